@@ -0,0 +1,47 @@
+"""``POST <list>/bulk``: create a list of objects in one request.
+
+The body is a JSON array of the objects the list endpoint accepts one at a
+time. Every item is validated in one pass; if any is invalid nothing is
+written and the 400 response is an array with the errors of each item, an
+empty object for the valid ones. Otherwise the view's
+``perform_bulk_create`` inserts them all in one transaction, see
+posts.bulk; by default the serializer creates them one by one. At most
+``API_BULK_MAX_ITEMS`` items are accepted.
+"""
+from django.conf import settings
+from django.utils.decorators import method_decorator
+from rest_framework import status
+from rest_framework.decorators import action
+from rest_framework.exceptions import ValidationError
+from rest_framework.response import Response
+from rest_framework.settings import api_settings
+
+from yatube.sqlite.transactions import serialized_write
+
+
+def max_bulk_items():
+    return getattr(settings, 'API_BULK_MAX_ITEMS', 100)
+
+
+class BulkCreateMixin:
+
+    @action(detail=False, methods=['post'])
+    @method_decorator(serialized_write)
+    def bulk(self, request, *args, **kwargs):
+        items = request.data
+        if not isinstance(items, list) or not items:
+            raise ValidationError({api_settings.NON_FIELD_ERRORS_KEY: [
+                'Expected a non-empty list of items.']})
+        if len(items) > max_bulk_items():
+            raise ValidationError({api_settings.NON_FIELD_ERRORS_KEY: [
+                f'At most {max_bulk_items()} items per request.']})
+        serializer = self.get_serializer(data=items, many=True)
+        serializer.is_valid(raise_exception=True)
+        created = self.perform_bulk_create(serializer)
+        return Response(self.get_serializer(created, many=True).data,
+                        status=status.HTTP_201_CREATED)
+
+    def perform_bulk_create(self, serializer):
+        """Create the validated items, one ``create()`` each; views
+        override it to set their fields and insert with one query."""
+        return serializer.save()
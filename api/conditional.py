@@ -0,0 +1,24 @@
+"""Conditional GET for the API viewsets, see posts.conditional."""
+from posts import conditional
+
+
+class ConditionalGetMixin:
+    """Answer conditional list and retrieve requests with 304.
+
+    ``get_conditional_scopes()`` lists the page_cache scopes whose changes
+    change the response; by default there are none and responses carry no
+    validators.
+    """
+
+    def get_conditional_scopes(self):
+        return None
+
+    def list(self, request, *args, **kwargs):
+        view = super().list
+        return conditional.respond(request, self.get_conditional_scopes(),
+                                   lambda: view(request, *args, **kwargs))
+
+    def retrieve(self, request, *args, **kwargs):
+        view = super().retrieve
+        return conditional.respond(request, self.get_conditional_scopes(),
+                                   lambda: view(request, *args, **kwargs))
@@ -0,0 +1,39 @@
+from django.db.models import Case, When, IntegerField
+from rest_framework.filters import BaseFilterBackend
+
+from posts import search
+
+MAX_RESULTS = 500
+
+
+class FullTextSearchFilter(BaseFilterBackend):
+    """Filter posts by ``?search=`` through the FTS index, best first.
+
+    The rank position is annotated as ``search_rank`` so that keyset pages
+    of the results keep the ranking.
+    """
+    search_param = 'search'
+    rank_field = 'search_rank'
+
+    def get_query(self, request):
+        return request.query_params.get(self.search_param, '').strip()
+
+    def cursor_ordering(self, request, queryset):
+        if self.rank_field in queryset.query.annotations:
+            return (self.rank_field, 'pk')
+        return None
+
+    def filter_queryset(self, request, queryset, view):
+        query = self.get_query(request)
+        if not query:
+            return queryset
+        ids = [post_id for post_id, _ in search.ranked(query,
+                                                       limit=MAX_RESULTS)]
+        if not ids:
+            return queryset.none()
+        rank = Case(*[When(pk=post_id, then=position)
+                      for position, post_id in enumerate(ids)],
+                    output_field=IntegerField())
+        return queryset.filter(pk__in=ids)\
+            .annotate(**{self.rank_field: rank})\
+            .order_by(self.rank_field)
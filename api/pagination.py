@@ -0,0 +1,130 @@
+"""Keyset pagination for the API, built on ``posts.pagination``.
+
+List responses are ``{"next", "previous", "results"}`` pages. ``next`` and
+``previous`` carry opaque ``?before=`` / ``?after=`` cursors over the view's
+unique ``ordering``, so a page is one index range scan at any depth and the
+table is never counted. ``?page_size=`` is capped by ``API_MAX_PAGE_SIZE``.
+
+``?stream=1`` on a list endpoint exports every row instead, as one JSON
+array written while it is read in keyset batches.
+"""
+from collections import OrderedDict
+
+from django.conf import settings
+from django.http import StreamingHttpResponse
+from rest_framework.pagination import BasePagination
+from rest_framework.response import Response
+from rest_framework.settings import api_settings
+from rest_framework.utils.encoders import JSONEncoder
+from rest_framework.utils.urls import remove_query_param, replace_query_param
+
+from posts.pagination import KeysetPaginator, PAGE_SIZE
+
+
+def max_page_size():
+    return getattr(settings, 'API_MAX_PAGE_SIZE', 100)
+
+
+def export_batch_size():
+    return getattr(settings, 'API_EXPORT_BATCH_SIZE', 500)
+
+
+def cursor_ordering(request, queryset, view):
+    """The unique ordering to page ``queryset`` of ``view`` by.
+
+    A filter backend may take over with a ``cursor_ordering`` method, the
+    way the full-text filter pages by rank.
+    """
+    for backend in view.filter_backends:
+        get_ordering = getattr(backend(), 'cursor_ordering', None)
+        ordering = get_ordering and get_ordering(request, queryset)
+        if ordering:
+            return ordering
+    return getattr(view, 'ordering', None)
+
+
+class KeysetPagination(BasePagination):
+    page_size_query_param = 'page_size'
+    before_query_param = 'before'
+    after_query_param = 'after'
+
+    def get_page_size(self, request):
+        default = api_settings.PAGE_SIZE or PAGE_SIZE
+        try:
+            size = int(request.query_params[self.page_size_query_param])
+        except (KeyError, ValueError):
+            return min(default, max_page_size())
+        return min(max(size, 1), max_page_size())
+
+    def paginate_queryset(self, queryset, request, view=None):
+        self.request = request
+        paginator = KeysetPaginator(
+            queryset, self.get_page_size(request),
+            cursor_ordering(request, queryset, view))
+        self.page = paginator.page(
+            before=request.query_params.get(self.before_query_param),
+            after=request.query_params.get(self.after_query_param))
+        return list(self.page)
+
+    def _link(self, param, cursor):
+        url = self.request.build_absolute_uri()
+        for name in (self.before_query_param, self.after_query_param):
+            url = remove_query_param(url, name)
+        return replace_query_param(url, param, cursor)
+
+    def get_next_link(self):
+        if not self.page.has_older:
+            return None
+        return self._link(self.before_query_param, self.page.older_cursor)
+
+    def get_previous_link(self):
+        if not self.page.has_newer:
+            return None
+        return self._link(self.after_query_param, self.page.newer_cursor)
+
+    def get_paginated_response(self, data):
+        return Response(OrderedDict([
+            ('next', self.get_next_link()),
+            ('previous', self.get_previous_link()),
+            ('results', data),
+        ]))
+
+    def get_paginated_response_schema(self, schema):
+        return {
+            'type': 'object',
+            'properties': {
+                'next': {'type': 'string', 'nullable': True},
+                'previous': {'type': 'string', 'nullable': True},
+                'results': schema,
+            },
+        }
+
+
+class StreamingExportMixin:
+    """Answer ``?stream=1`` list requests with the whole result set."""
+    stream_query_param = 'stream'
+
+    def list(self, request, *args, **kwargs):
+        if request.query_params.get(self.stream_query_param) not in (
+                '1', 'true'):
+            return super().list(request, *args, **kwargs)
+        queryset = self.filter_queryset(self.get_queryset())
+        paginator = KeysetPaginator(
+            queryset, export_batch_size(),
+            cursor_ordering(request, queryset, self))
+        return StreamingHttpResponse(self._export(paginator),
+                                     content_type='application/json')
+
+    def _export(self, paginator):
+        encoder = JSONEncoder(ensure_ascii=False, separators=(',', ':'))
+        yield '['
+        page = paginator.page()
+        separator = ''
+        while True:
+            for item in self.get_serializer(page.object_list, many=True).data:
+                yield separator + encoder.encode(item)
+                separator = ','
+            if not page.has_older:
+                break
+            page = paginator.page(before=page.older_cursor)
+        yield ']'
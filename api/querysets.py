@@ -0,0 +1,144 @@
+"""Querysets shaped by the serializer that will render them.
+
+``optimize`` walks the declared serializer fields and their dotted sources:
+forward foreign keys are joined with ``select_related``, many relations are
+prefetched, and when every source resolves to a model field the columns are
+narrowed with ``only()``. A source that is a property or method may read
+anything, so it disables the narrowing for the model it starts from.
+
+Fields marked ``preloaded`` are filled in on the fetched instances
+afterwards, like the comment previews attached by
+``attach_comment_previews``, and are skipped.
+"""
+from collections import defaultdict
+
+from django.core.exceptions import FieldDoesNotExist
+from django.db import connections, router
+from rest_framework import serializers
+from rest_framework.relations import ManyRelatedField, RelatedField
+
+from posts.models import Comment
+
+# SQLite allows 500 SELECTs in a compound statement.
+PREVIEW_CHUNK = 100
+
+
+class _Plan:
+
+    def __init__(self):
+        self.select = set()
+        self.prefetch = set()
+        self.only = set()
+        self.narrow = True
+
+
+def _walk(plan, field, model, prefix):
+    if field.write_only:
+        return
+    if field.source == '*':
+        if isinstance(field, serializers.BaseSerializer):
+            _walk_serializer(plan, field, model, prefix)
+        else:
+            plan.narrow = False
+        return
+    path = list(prefix)
+    for position, bit in enumerate(field.source_attrs):
+        try:
+            model_field = model._meta.get_field(bit)
+        except FieldDoesNotExist:
+            plan.narrow = False
+            return
+        path.append(bit)
+        last = position == len(field.source_attrs) - 1
+        lookup = '__'.join(path)
+        if model_field.many_to_many or model_field.one_to_many:
+            plan.prefetch.add(lookup)
+            return
+        if not model_field.is_relation:
+            plan.only.add(lookup)
+            return
+        if last and isinstance(field, RelatedField) \
+                and field.use_pk_only_optimization():
+            plan.only.add(lookup)
+            return
+        # A joined relation must itself be loaded, not deferred.
+        plan.select.add(lookup)
+        plan.only.add(lookup)
+        model = model_field.related_model
+        if last:
+            if isinstance(field, serializers.BaseSerializer):
+                _walk_serializer(plan, field, model, path)
+            else:
+                # str() or a custom to_representation may read any column.
+                plan.only.update(f'{lookup}__{related.name}'
+                                 for related in model._meta.concrete_fields)
+            return
+
+
+def _walk_serializer(plan, serializer, model, prefix):
+    for field in serializer.fields.values():
+        if getattr(field, 'preloaded', False):
+            continue
+        if isinstance(field, (ManyRelatedField, serializers.ListSerializer)):
+            if not field.write_only:
+                plan.prefetch.add('__'.join(prefix + field.source_attrs))
+            continue
+        _walk(plan, field, model, prefix)
+
+
+def optimize(queryset, serializer, keep=()):
+    """Return ``queryset`` with the joins and columns ``serializer`` reads.
+
+    ``keep`` names more columns to load, e.g. the ones paginated on.
+    """
+    if isinstance(serializer, serializers.ListSerializer):
+        serializer = serializer.child
+    plan = _Plan()
+    plan.only.update(name.lstrip('-') for name in keep)
+    _walk_serializer(plan, serializer, queryset.model, [])
+    if plan.select:
+        queryset = queryset.select_related(*sorted(plan.select))
+    if plan.prefetch:
+        queryset = queryset.prefetch_related(*sorted(plan.prefetch))
+    if plan.narrow:
+        queryset = queryset.only(queryset.model._meta.pk.name,
+                                 *sorted(plan.only))
+    return queryset
+
+
+def attach_comment_previews(posts, serializer, size):
+    """Set ``comments_preview`` of every post to its latest comments.
+
+    Each post contributes one ``LIMIT size`` index seek to a ``UNION ALL``
+    of comment ids, so up to ``PREVIEW_CHUNK`` posts cost two queries
+    however many comments they have.
+    """
+    posts = [post for post in posts
+             if not hasattr(post, 'comments_preview')]
+    latest = (f'SELECT * FROM (SELECT id FROM {Comment._meta.db_table} '
+              'WHERE post_id = %s ORDER BY created DESC, id DESC LIMIT %s)')
+    previews = defaultdict(list)
+    for start in range(0, len(posts), PREVIEW_CHUNK):
+        chunk = posts[start:start + PREVIEW_CHUNK]
+        with connections[router.db_for_read(Comment)].cursor() as cursor:
+            cursor.execute(' UNION ALL '.join([latest] * len(chunk)),
+                           [value for post in chunk
+                            for value in (post.pk, size)])
+            ids = [row[0] for row in cursor.fetchall()]
+        comments = optimize(Comment.objects.filter(pk__in=ids), serializer,
+                            keep=('post',))
+        for comment in comments:
+            previews[comment.post_id].append(comment)
+    for post in posts:
+        post.comments_preview = sorted(
+            previews[post.pk], key=lambda comment: (comment.created,
+                                                    comment.pk),
+            reverse=True)
+
+
+class SerializerQuerysetMixin:
+    """Build ``get_queryset()`` from the fields of the view's serializer."""
+
+    def get_queryset(self):
+        return optimize(super().get_queryset(), self.get_serializer(),
+                        keep=getattr(self, 'ordering', None) or ())
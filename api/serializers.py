@@ -1,36 +1,119 @@
+from django.conf import settings
 from rest_framework import serializers
+from rest_framework.permissions import SAFE_METHODS
 
 from posts.models import Post, Comment, Group, Follow
+from posts.uploads import ImageUploadField
+from .querysets import attach_comment_previews
 
 
-class PostSerializer(serializers.ModelSerializer):
-    author = serializers.ReadOnlyField(source='author.username')
+def comments_preview_size():
+    return getattr(settings, 'API_COMMENTS_PREVIEW_SIZE', 3)
+
+
+def _names(request, param):
+    value = request.query_params.get(param) if request is not None else None
+    if not value:
+        return None
+    return {name.strip() for name in value.split(',') if name.strip()}
+
+
+class DynamicFieldsMixin:
+    """Shape the top level serializer of a request by its query string.
+
+    ``?fields=a,b`` keeps only the listed fields and ``?expand=x,y`` swaps
+    in the fields built by ``get_expanded_fields()``, which are kept even
+    when not listed. Unknown names are ignored. Nested serializers are left
+    alone. api.querysets reads the resulting fields, so the trimmed columns
+    are not selected either. Only reads are shaped: a write would lose the
+    fields it drops.
+    """
+
+    def __init__(self, *args, **kwargs):
+        super().__init__(*args, **kwargs)
+        request = self.context.get('request')
+        if request is None or request.method not in SAFE_METHODS:
+            # Writes validate and answer with every field.
+            return
+        expand = _names(request, 'expand') or set()
+        expanded = {name: field for name, field
+                    in self.get_expanded_fields().items() if name in expand}
+        self.fields.update(expanded)
+        keep = _names(request, 'fields')
+        if keep is not None:
+            for name in set(self.fields) - keep - set(expanded):
+                self.fields.pop(name)
+
+    def get_expanded_fields(self):
+        return {}
+
+
+class EmbeddedGroupSerializer(serializers.ModelSerializer):
 
     class Meta:
-        model = Post
-        fields = ['id', 'text', 'author',  'pub_date']
+        model = Group
+        fields = ['id', 'title', 'slug', 'description']
 
 
-class CommentSerializer(serializers.ModelSerializer):
+class CommentSerializer(DynamicFieldsMixin, serializers.ModelSerializer):
     author = serializers.ReadOnlyField(source='author.username')
-    post = serializers.ReadOnlyField(source='post.id')
+    post = serializers.PrimaryKeyRelatedField(read_only=True)
 
     class Meta:
         model = Comment
         fields = ['id', 'author', 'text', 'created', 'post']
 
 
-class GroupSerializer(serializers.ModelSerializer):
+class PostListSerializer(serializers.ListSerializer):
+
+    def to_representation(self, data):
+        posts = list(data.all() if hasattr(data, 'all') else data)
+        self.child.preload(posts)
+        return super().to_representation(posts)
+
+
+class PostSerializer(DynamicFieldsMixin, serializers.ModelSerializer):
+    author = serializers.ReadOnlyField(source='author.username')
+    image = serializers.ImageField(required=False, allow_null=True,
+                                   _DjangoImageField=ImageUploadField)
+
+    class Meta:
+        model = Post
+        fields = ['id', 'text', 'author', 'pub_date', 'group', 'image',
+                  'comment_count']
+        list_serializer_class = PostListSerializer
+
+    def get_expanded_fields(self):
+        preview = CommentSerializer(many=True, read_only=True)
+        preview.preloaded = True
+        return {
+            'group': EmbeddedGroupSerializer(read_only=True),
+            'comments_preview': preview,
+        }
+
+    def preload(self, posts):
+        """Load the comment previews of ``posts`` in one batch."""
+        preview = self.fields.get('comments_preview')
+        if preview is not None:
+            attach_comment_previews(posts, preview.child,
+                                    comments_preview_size())
+
+    def to_representation(self, instance):
+        self.preload([instance])
+        return super().to_representation(instance)
+
+
+class GroupSerializer(DynamicFieldsMixin, serializers.ModelSerializer):
 
     class Meta:
         model = Group
         fields = ['title']
 
 
-class FollowSerializer(serializers.ModelSerializer):
+class FollowSerializer(DynamicFieldsMixin, serializers.ModelSerializer):
     user = serializers.CharField(source='user.username', read_only=True)
     author = serializers.CharField(source='author.username')
 
     class Meta:
         model = Follow
-        fields = ['user', 'author']
\ No newline at end of file
+        fields = ['user', 'author']
@@ -1,3 +1,399 @@
-from django.test import TestCase
+import json
+import shutil
+import tempfile
+from io import BytesIO
+from urllib.parse import urlencode
 
-# Create your tests here.
+from django.contrib.auth.models import User
+from django.core.cache import cache
+from django.core.files.uploadedfile import SimpleUploadedFile
+from django.db import connection
+from django.test import TestCase, override_settings
+from django.test.utils import CaptureQueriesContext
+from django.utils import timezone
+from PIL import Image
+from rest_framework import serializers, viewsets
+from rest_framework.test import APIClient, APIRequestFactory
+
+from api.bulk import BulkCreateMixin
+from api.conditional import ConditionalGetMixin
+
+from posts import follow_graph, page_cache
+from posts.models import Post, Comment, Group, Follow, FeedEntry
+
+
+class QueryCountMixin:
+    """Fail when the queries of a list endpoint grow with its length."""
+
+    def count_queries(self, url):
+        with CaptureQueriesContext(connection) as queries:
+            response = self.client.get(url)
+        self.assertEqual(response.status_code, 200)
+        return len(response.json()['results']), len(queries)
+
+    def assertQueriesConstant(self, url, add_row, rows=(2, 10)):
+        counts = []
+        for size in rows:
+            while self.count_queries(url)[0] < size:
+                add_row()
+            length, queries = self.count_queries(url)
+            self.assertEqual(length, size)
+            counts.append(queries)
+        self.assertEqual(counts[0], counts[-1],
+                         f'{url} ran {counts} queries for {rows} rows')
+
+
+class ApiQueryCountTest(QueryCountMixin, TestCase):
+
+    def setUp(self) -> None:
+        cache.clear()
+        self.user = User.objects.create(username='reader')
+        self.client = APIClient()
+        self.client.force_authenticate(self.user)
+        self.post = Post.objects.create(text='Пост', author=self.user)
+        self.rows = 0
+
+    def new_user(self):
+        self.rows += 1
+        return User.objects.create(username=f'user{self.rows}')
+
+    def test_posts(self):
+        self.assertQueriesConstant('/api/v1/posts', lambda: Post.objects
+                                   .create(text='Текст',
+                                           author=self.new_user()))
+
+    def test_comments(self):
+        self.assertQueriesConstant(
+            f'/api/v1/posts/{self.post.pk}/comments',
+            lambda: Comment.objects.create(post=self.post, text='Текст',
+                                           author=self.new_user()))
+
+    def test_groups(self):
+        def add_group():
+            self.rows += 1
+            Group.objects.create(title=f'Группа {self.rows}',
+                                 slug=f'group-{self.rows}')
+        self.assertQueriesConstant('/api/v1/groups', add_group)
+
+    def test_follows(self):
+        self.assertQueriesConstant('/api/v1/follow', lambda: Follow.objects
+                                   .create(user=self.new_user(),
+                                           author=self.new_user()))
+
+    def test_update_keeps_unloaded_columns(self):
+        group = Group.objects.create(title='Группа', slug='group')
+        Post.objects.filter(pk=self.post.pk).update(group=group)
+        response = self.client.patch(f'/api/v1/posts/{self.post.pk}',
+                                     {'text': 'Правка'}, format='json')
+        self.assertEqual(response.status_code, 200)
+        self.post.refresh_from_db()
+        self.assertEqual(self.post.text, 'Правка')
+        self.assertEqual(self.post.group, group)
+
+
+class ApiPaginationTest(TestCase):
+
+    def setUp(self) -> None:
+        cache.clear()
+        self.user = User.objects.create(username='reader')
+        self.client = APIClient()
+        self.client.force_authenticate(self.user)
+        now = timezone.now()
+        self.posts = [Post.objects.create(text=f'Пост {i}', author=self.user)
+                      for i in range(25)]
+        # Equal dates must be split by the id tie-break, not skipped.
+        Post.objects.update(pub_date=now)
+
+    def walk(self, url):
+        ids = []
+        while url:
+            data = self.client.get(url).json()
+            ids += [post['id'] for post in data['results']]
+            url = data['next']
+        return ids
+
+    def test_pages_cover_every_row_once(self):
+        ids = self.walk('/api/v1/posts?page_size=7')
+        self.assertEqual(ids, sorted((post.pk for post in self.posts),
+                                     reverse=True))
+
+    def test_previous_link(self):
+        first = self.client.get('/api/v1/posts?page_size=10').json()
+        self.assertIsNone(first['previous'])
+        second = self.client.get(first['next']).json()
+        back = self.client.get(second['previous']).json()
+        self.assertEqual(back['results'], first['results'])
+
+    @override_settings(API_MAX_PAGE_SIZE=5)
+    def test_page_size_is_capped(self):
+        data = self.client.get('/api/v1/posts?page_size=1000').json()
+        self.assertEqual(len(data['results']), 5)
+
+    def test_streaming_export(self):
+        response = self.client.get('/api/v1/posts?stream=1')
+        self.assertTrue(response.streaming)
+        rows = json.loads(b''.join(response.streaming_content))
+        self.assertEqual(len(rows), 25)
+        self.assertEqual(rows[0]['text'], self.posts[-1].text)
+
+    def test_search_pages_keep_rank(self):
+        Post.objects.create(text='котики котики котики', author=self.user)
+        Post.objects.create(text='котики и собаки', author=self.user)
+        query = urlencode({'search': 'котики', 'page_size': 1})
+        ids = self.walk(f'/api/v1/posts?{query}')
+        self.assertEqual(len(ids), 2)
+        self.assertEqual(Post.objects.get(pk=ids[0]).text,
+                         'котики котики котики')
+
+    def test_comment_pages_match_the_post_page(self):
+        post = self.posts[0]
+        comments = [Comment.objects.create(post=post, author=self.user,
+                                           text=f'Комментарий {i}')
+                    for i in range(12)]
+        Comment.objects.create(post=self.posts[1], author=self.user,
+                               text='Другой пост')
+        Comment.objects.filter(post=post).update(created=timezone.now())
+        ids = self.walk(f'/api/v1/posts/{post.pk}/comments?page_size=5')
+        self.assertEqual(ids, [comment.pk for comment in comments[::-1]])
+        self.assertEqual(
+            self.client.get('/api/v1/posts/0/comments').status_code, 404)
+
+
+class ApiBulkCreateTest(TestCase):
+
+    def setUp(self) -> None:
+        cache.clear()
+        self.user = User.objects.create(username='writer')
+        self.follower = User.objects.create(username='follower')
+        Follow.objects.create(user=self.follower, author=self.user)
+        self.client = APIClient()
+        self.client.force_authenticate(self.user)
+
+    def post_bulk(self, url, texts):
+        return self.client.post(url, [{'text': text} for text in texts],
+                                format='json')
+
+    def test_posts(self):
+        response = self.post_bulk('/api/v1/posts/bulk',
+                                  ['котики', 'собаки', 'ежики'])
+        self.assertEqual(response.status_code, 201)
+        ids = [post['id'] for post in response.json()]
+        self.assertEqual(
+            list(Post.objects.filter(author=self.user).order_by('pk')
+                 .values_list('pk', 'text')),
+            list(zip(ids, ['котики', 'собаки', 'ежики'])))
+        self.assertEqual(self.user.stats.posts_count, 3)
+        self.assertEqual(FeedEntry.objects.filter(user=self.follower)
+                         .count(), 3)
+        found = self.client.get('/api/v1/posts?search=собака').json()
+        self.assertEqual([post['id'] for post in found['results']],
+                         [ids[1]])
+
+    def test_queries_do_not_grow_with_batch(self):
+        counts = []
+        for size in (2, 10):
+            with CaptureQueriesContext(connection) as queries:
+                response = self.post_bulk('/api/v1/posts/bulk',
+                                          ['Текст'] * size)
+            self.assertEqual(response.status_code, 201)
+            counts.append(len(queries))
+        self.assertEqual(counts[0], counts[1])
+
+    def test_errors_per_item(self):
+        response = self.client.post('/api/v1/posts/bulk',
+                                    [{'text': 'Пост'}, {}], format='json')
+        self.assertEqual(response.status_code, 400)
+        errors = response.json()
+        self.assertEqual(errors[0], {})
+        self.assertIn('text', errors[1])
+        self.assertFalse(Post.objects.exists())
+
+    @override_settings(API_BULK_MAX_ITEMS=2)
+    def test_batch_size_is_capped(self):
+        response = self.post_bulk('/api/v1/posts/bulk', ['a', 'b', 'c'])
+        self.assertEqual(response.status_code, 400)
+        response = self.client.post('/api/v1/posts/bulk', {'text': 'a'},
+                                    format='json')
+        self.assertEqual(response.status_code, 400)
+        self.assertFalse(Post.objects.exists())
+
+    def test_comments(self):
+        post = Post.objects.create(text='Пост', author=self.follower)
+        response = self.post_bulk(f'/api/v1/posts/{post.pk}/comments/bulk',
+                                  ['Первый', 'Второй'])
+        self.assertEqual(response.status_code, 201)
+        self.assertEqual([comment['post'] for comment in response.json()],
+                         [post.pk, post.pk])
+        post.refresh_from_db()
+        self.assertEqual(post.comment_count, 2)
+        self.assertEqual(
+            set(post.comments.values_list('pk', flat=True)),
+            {comment['id'] for comment in response.json()})
+        response = self.post_bulk('/api/v1/posts/0/comments/bulk', ['Нет'])
+        self.assertEqual(response.status_code, 404)
+
+    def test_default_hooks(self):
+        class GroupSerializer(serializers.ModelSerializer):
+            class Meta:
+                model = Group
+                fields = ['title', 'slug']
+
+        class GroupViewSet(ConditionalGetMixin, BulkCreateMixin,
+                           viewsets.ModelViewSet):
+            queryset = Group.objects.all()
+            serializer_class = GroupSerializer
+            pagination_class = None
+            permission_classes = []
+
+        factory = APIRequestFactory()
+        request = factory.post('/', [{'title': 'Первая', 'slug': 'first'},
+                                     {'title': 'Вторая', 'slug': 'second'}],
+                               format='json')
+        response = GroupViewSet.as_view({'post': 'bulk'})(request)
+        self.assertEqual(response.status_code, 201)
+        self.assertEqual(Group.objects.count(), 2)
+        response = GroupViewSet.as_view({'get': 'list'})(factory.get('/'))
+        self.assertEqual(response.status_code, 200)
+        self.assertNotIn('ETag', response)
+
+
+class ApiConditionalGetTest(TestCase):
+
+    def setUp(self) -> None:
+        cache.clear()
+        self.user = User.objects.create(username='reader')
+        self.client = APIClient()
+        self.client.force_authenticate(self.user)
+        self.post = Post.objects.create(text='Пост', author=self.user)
+
+    def test_detail_and_lists(self):
+        urls = [f'/api/v1/posts/{self.post.pk}', '/api/v1/posts',
+                f'/api/v1/posts/{self.post.pk}/comments']
+        first = {url: self.client.get(url) for url in urls}
+        for url, response in first.items():
+            again = self.client.get(url, HTTP_IF_NONE_MATCH=response['ETag'])
+            self.assertEqual(again.status_code, 304, url)
+        self.client.patch(f'/api/v1/posts/{self.post.pk}',
+                          {'text': 'Правка'}, format='json')
+        for url, response in first.items():
+            again = self.client.get(url, HTTP_IF_NONE_MATCH=response['ETag'])
+            self.assertEqual(again.status_code, 200, url)
+
+    def test_unrelated_change_keeps_detail(self):
+        url = f'/api/v1/posts/{self.post.pk}'
+        response = self.client.get(url)
+        Post.objects.create(text='Другой', author=self.user)
+        again = self.client.get(url, HTTP_IF_NONE_MATCH=response['ETag'])
+        self.assertEqual(again.status_code, 304)
+
+    def test_missing_post_stores_no_generation(self):
+        for url in ('/api/v1/posts/999', '/api/v1/posts/999/comments'):
+            self.assertEqual(self.client.get(url).status_code, 404)
+        self.assertIsNone(cache.get(
+            page_cache.generation_key(page_cache.post_scope(999))))
+
+
+class ApiFieldsExpandTest(QueryCountMixin, TestCase):
+
+    def setUp(self) -> None:
+        cache.clear()
+        self.user = User.objects.create(username='reader')
+        self.client = APIClient()
+        self.client.force_authenticate(self.user)
+        self.group = Group.objects.create(title='Группа', slug='group')
+        self.rows = 0
+
+    def add_post(self, comments=4):
+        self.rows += 1
+        post = Post.objects.create(text=f'Пост {self.rows}',
+                                   author=self.user, group=self.group)
+        for number in range(comments):
+            Comment.objects.create(post=post, author=self.user,
+                                   text=f'Комментарий {number}')
+        return post
+
+    def test_fields_trim_output_and_columns(self):
+        self.add_post()
+        with CaptureQueriesContext(connection) as queries:
+            data = self.client.get('/api/v1/posts?fields=id,text').json()
+        self.assertEqual(set(data['results'][0]), {'id', 'text'})
+        selects = [query['sql'] for query in queries.captured_queries
+                   if 'FROM "posts_post"' in query['sql']]
+        self.assertTrue(selects)
+        self.assertNotIn('"image"', selects[-1])
+
+    def test_writes_keep_every_field(self):
+        for query in ('fields=id', 'expand=group'):
+            response = self.client.post(
+                f'/api/v1/posts?{query}',
+                {'text': 'hello', 'group': self.group.pk}, format='json')
+            self.assertEqual(response.status_code, 201)
+            self.assertEqual(response.json()['text'], 'hello')
+            post = Post.objects.get(pk=response.json()['id'])
+            self.assertEqual((post.text, post.group), ('hello', self.group))
+
+    def test_expand_group_and_comments(self):
+        post = self.add_post()
+        url = (f'/api/v1/posts/{post.pk}?fields=id'
+               '&expand=group,comments_preview')
+        data = self.client.get(url).json()
+        self.assertEqual(data['group']['slug'], 'group')
+        self.assertEqual([comment['text'] for comment
+                          in data['comments_preview']],
+                         ['Комментарий 3', 'Комментарий 2', 'Комментарий 1'])
+
+    def test_expansions_take_constant_queries(self):
+        self.assertQueriesConstant(
+            '/api/v1/posts?expand=group,comments_preview', self.add_post)
+
+
+class ApiFollowGraphTest(TestCase):
+
+    def test_api_follow_invalidates_graph(self):
+        cache.clear()
+        user = User.objects.create(username='reader')
+        author = User.objects.create(username='author')
+        client = APIClient()
+        client.force_authenticate(user)
+        self.assertFalse(follow_graph.is_following(user, author.pk))
+        response = client.post('/api/v1/follow', {'author': 'author'},
+                               format='json')
+        self.assertEqual(response.status_code, 201)
+        self.assertTrue(follow_graph.is_following(user, author.pk))
+
+
+class ApiImageUploadTest(TestCase):
+
+    def setUp(self) -> None:
+        cache.clear()
+        media = tempfile.mkdtemp()
+        settings = override_settings(MEDIA_ROOT=media)
+        settings.enable()
+        self.addCleanup(settings.disable)
+        self.addCleanup(shutil.rmtree, media)
+        self.user = User.objects.create(username='photographer')
+        self.client = APIClient()
+        self.client.force_authenticate(self.user)
+
+    def image(self, size=(3000, 1000)):
+        data = BytesIO()
+        Image.new('RGB', size, 'green').save(data, 'JPEG')
+        return SimpleUploadedFile('photo.jpeg', data.getvalue())
+
+    @override_settings(IMAGE_UPLOAD_MAX_SIDE=1000)
+    def test_upload_is_reencoded(self):
+        response = self.client.post('/api/v1/posts', {
+            'text': 'Фото', 'image': self.image()}, format='multipart')
+        self.assertEqual(response.status_code, 201)
+        self.assertTrue(response.json()['image'].endswith('.jpg'))
+        post = Post.objects.get()
+        self.assertEqual((post.image.width, post.image.height), (1000, 333))
+
+    @override_settings(IMAGE_UPLOAD_MAX_PIXELS=1000)
+    def test_too_many_pixels(self):
+        post = Post.objects.create(text='Фото', author=self.user)
+        response = self.client.patch(f'/api/v1/posts/{post.pk}', {
+            'image': self.image()}, format='multipart')
+        self.assertEqual(response.status_code, 400)
+        self.assertEqual(response.json()['image'],
+                         ['Изображение больше 0.001 мегапикселей.'])
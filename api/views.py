@@ -1,3 +1,5 @@
+from django.db import IntegrityError, transaction
+from django.http import Http404
 from django.shortcuts import get_object_or_404
 from rest_framework import viewsets, filters
 from rest_framework.exceptions import ValidationError
@@ -5,25 +7,53 @@ from rest_framework.permissions import IsAuthenticated
 
 from django_filters.rest_framework import DjangoFilterBackend
 
+from .bulk import BulkCreateMixin
+from .conditional import ConditionalGetMixin
+from .filters import FullTextSearchFilter
+from .pagination import StreamingExportMixin
 from .permissions import IsAuthorOrAdminOrReadOnly, IsAdminOrReadOnly
+from .querysets import SerializerQuerysetMixin
 from .serializers import PostSerializer, CommentSerializer, GroupSerializer, \
     FollowSerializer
+from posts import bulk, comment_thread, page_cache
 from posts.models import Post, Comment, Group, Follow, User
+from yatube.routers import ReplicaReadsMixin
 
 
-class PostViewSet(viewsets.ModelViewSet):
+class PostViewSet(ReplicaReadsMixin, ConditionalGetMixin,
+                  SerializerQuerysetMixin, StreamingExportMixin,
+                  BulkCreateMixin, viewsets.ModelViewSet):
     queryset = Post.objects.all()
     serializer_class = PostSerializer
+    ordering = ('-pub_date', '-id')
     permission_classes = [IsAuthorOrAdminOrReadOnly, IsAuthenticated]
-    filter_backends = [DjangoFilterBackend]
+    filter_backends = [DjangoFilterBackend, FullTextSearchFilter]
     filter_fields = ['group']
 
     def perform_create(self, serializer):
         serializer.save(author=self.request.user)
 
+    def get_conditional_scopes(self):
+        if 'pk' in self.kwargs:
+            if not Post.objects.filter(pk=self.kwargs['pk']).exists():
+                return None
+            # ?expand=group embeds the group title.
+            return [page_cache.post_scope(self.kwargs['pk']),
+                    page_cache.GROUPS_SCOPE]
+        return [page_cache.INDEX_SCOPE]
 
-class CommentViewSet(viewsets.ModelViewSet):
+    def perform_bulk_create(self, serializer):
+        return bulk.create_posts([
+            Post(author=self.request.user, **item)
+            for item in serializer.validated_data])
+
+
+class CommentViewSet(ReplicaReadsMixin, ConditionalGetMixin,
+                     SerializerQuerysetMixin, StreamingExportMixin,
+                     BulkCreateMixin, viewsets.ModelViewSet):
     serializer_class = CommentSerializer
+    # The cursor order of the post page, see posts.comment_thread.
+    ordering = comment_thread.ORDERING
     permission_classes = [IsAuthorOrAdminOrReadOnly, IsAuthenticated]
     queryset = Comment.objects.all()
 
@@ -32,37 +62,66 @@ class CommentViewSet(viewsets.ModelViewSet):
         serializer.save(author=self.request.user,
                         post=post)
 
-    def get_queryset(self):
+    def get_conditional_scopes(self):
+        post_pk = self.kwargs.get('post_pk')
+        if not Post.objects.filter(pk=post_pk).exists():
+            return None
+        # Saving or deleting a comment changes the scope of its post.
+        return [page_cache.post_scope(post_pk)]
+
+    def perform_bulk_create(self, serializer):
         post = get_object_or_404(Post, id=self.kwargs.get('post_pk'))
-        return post.comments.all()
+        return bulk.create_comments([
+            Comment(author=self.request.user, post=post, **item)
+            for item in serializer.validated_data])
+
+    def get_queryset(self):
+        post_pk = self.kwargs.get('post_pk')
+        if not Post.objects.filter(id=post_pk).exists():
+            raise Http404
+        return super().get_queryset().filter(post_id=post_pk)
 
 
-class GroupViewSet(viewsets.ModelViewSet):
+class GroupViewSet(ReplicaReadsMixin, ConditionalGetMixin,
+                   SerializerQuerysetMixin, StreamingExportMixin,
+                   viewsets.ModelViewSet):
     queryset = Group.objects.all()
     serializer_class = GroupSerializer
+    ordering = ('id',)
     permission_classes = [IsAdminOrReadOnly,
                           IsAuthenticated]
 
+    def get_conditional_scopes(self):
+        return [page_cache.GROUPS_SCOPE]
 
-class FollowViewSet(viewsets.ModelViewSet):
+
+class FollowViewSet(ReplicaReadsMixin, ConditionalGetMixin,
+                    SerializerQuerysetMixin, StreamingExportMixin,
+                    viewsets.ModelViewSet):
     serializer_class = FollowSerializer
+    ordering = ('id',)
     queryset = Follow.objects.all()
     permission_classes = [IsAuthorOrAdminOrReadOnly, IsAuthenticated]
     filter_backends = [filters.SearchFilter]
     search_fields = ['=author__username',
                      '=user__username']
 
+    def get_conditional_scopes(self):
+        return [page_cache.FOLLOWS_SCOPE]
+
     def perform_create(self, serializer):
         author = get_object_or_404(
             User, username=self.request.data.get("author")
         )
         user = self.request.user
-        follows = self.queryset.filter(user=user, author=author)
-        if follows.exists():
-            raise ValidationError(
-                f"You already have a subscription to {author}.")
         if user == author:
             raise ValidationError("You cannot subscribe to yourself.")
-        serializer.save(user=user, author=author)
+        # The unique (user, author) index settles concurrent requests.
+        try:
+            with transaction.atomic():
+                serializer.save(user=user, author=author)
+        except IntegrityError:
+            raise ValidationError(
+                f"You already have a subscription to {author}.")
 
 
@@ -0,0 +1,9 @@
+import pytest
+
+from yatube.test_runner import temporary_cache
+
+
+@pytest.fixture(scope='session', autouse=True)
+def test_cache():
+    with temporary_cache():
+        yield
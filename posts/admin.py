@@ -1,11 +1,24 @@
 from django.contrib import admin
 from .models import Post, Group, Comment
+from . import search
 
 
-class PostAdmin(admin.ModelAdmin):
+class FullTextSearchMixin:
+    """Answer the admin search box from the FTS index, not LIKE scans."""
+    search_kind = None
+
+    def get_search_results(self, request, queryset, search_term):
+        if not search_term.strip():
+            return queryset, False
+        matching = search.matching(self.search_kind, search_term)
+        return queryset.filter(pk__in=matching), False
+
+
+class PostAdmin(FullTextSearchMixin, admin.ModelAdmin):
 
     list_display = ('pk', 'text', 'pub_date', 'author', 'group')
     search_fields = ('text',)
+    search_kind = search.POST
     list_filter = ('pub_date',)
     empty_value_display = '-пусто-'
 
@@ -24,10 +37,11 @@ class GroupAdmin(admin.ModelAdmin):
 admin.site.register(Group, GroupAdmin)
 
 
-class CommentAdmin(admin.ModelAdmin):
+class CommentAdmin(FullTextSearchMixin, admin.ModelAdmin):
 
     list_display = ('pk', 'post_id', 'text', 'author', 'created')
     search_fields = ('text',)
+    search_kind = search.COMMENT
     list_filter = ('created', 'author')
     empty_value_display = '-пусто-'
 
@@ -0,0 +1,391 @@
+"""Repeatable benchmark of the hot pages and API endpoints.
+
+``seed`` fills an empty database with a realistic dataset built by the
+factories in posts.factories: at scale 1, 10k users posting 100k posts,
+a fifth of them with an image, and 1M comments. Authors, groups and
+commented posts are picked with power-law weights, and so are the out-degree
+and the targets of the follow graph, so a few authors have most of the
+followers as on a real site. Rows are inserted with ``bulk_create``; the
+counters, timelines and search index are then rebuilt by their management
+commands instead of the per-row signals.
+
+``run`` requests every scenario through the Django test client, anonymous
+and signed in where both are possible, and returns latency percentiles and
+query counts per scenario. ``manage.py benchmark`` writes the report as JSON
+together with the commit it was measured on, so two commits can be
+compared with ``--compare``. ``database`` switches to the dataset file and
+is shared with ``manage.py benchmark_servers``.
+"""
+import math
+import os
+import random
+import subprocess
+import time
+from contextlib import ExitStack, contextmanager
+from io import BytesIO
+from itertools import accumulate
+
+import factory.random
+from django.conf import settings
+from django.core.files.base import ContentFile
+from django.core.files.storage import default_storage
+from django.core.management import call_command
+from django.db import connections, transaction
+from django.test import Client
+from django.test.utils import override_settings
+from PIL import Image
+from rest_framework_simplejwt.tokens import AccessToken
+
+from yatube.instrumentation import Measure, budget_for
+from . import thumbnails
+from .factories import UserFactory, GroupFactory, PostFactory, CommentFactory
+from .models import Post, Group, Comment, Follow, FeedEntry, User
+
+SIZES = {
+    'users': 10_000,
+    'groups': 50,
+    'posts': 100_000,
+    'comments': 1_000_000,
+    'images': 20,
+}
+MINIMUM = {'users': 5, 'groups': 2, 'posts': 20, 'comments': 50, 'images': 2}
+FOLLOWS_PER_USER = 20
+IMAGE_SHARE = 0.2
+GROUP_SHARE = 0.7
+# Exponent of the Zipf-like weights: the n-th author is 1/n^s as likely.
+SKEW = 1.1
+BATCH = 5000
+USERNAME = 'bench{}'
+PERCENTILES = (50, 90, 95, 99)
+
+
+def sizes_for(scale):
+    return {name: max(MINIMUM[name], round(size * scale))
+            for name, size in SIZES.items()}
+
+
+def _weights(count, rng):
+    """Cumulative power-law weights of ``count`` items in random order."""
+    weights = [1 / (rank ** SKEW) for rank in range(1, count + 1)]
+    rng.shuffle(weights)
+    return list(accumulate(weights))
+
+
+def _batches(items, size=BATCH):
+    batch = []
+    for item in items:
+        batch.append(item)
+        if len(batch) >= size:
+            yield batch
+            batch = []
+    if batch:
+        yield batch
+
+
+@contextmanager
+def explicit_dates():
+    """Let bulk inserts keep the dates the factories picked."""
+    fields = [Post._meta.get_field('pub_date'),
+              Comment._meta.get_field('created')]
+    for field in fields:
+        field.auto_now_add = False
+    try:
+        yield
+    finally:
+        for field in fields:
+            field.auto_now_add = True
+
+
+def _image_names(count):
+    names = []
+    for index in range(count):
+        name = f'posts/benchmark/{index}.png'
+        if not default_storage.exists(name):
+            data = BytesIO()
+            color = (index * 37 % 256, index * 91 % 256, index * 53 % 256)
+            Image.new('RGB', (1200, 800), color).save(data, 'PNG')
+            name = default_storage.save(name, ContentFile(data.getvalue()))
+        names.append(name)
+    return names
+
+
+def _follows(user_ids, rng):
+    popularity = _weights(len(user_ids), rng)
+    for user_id in user_ids:
+        # Pareto with alpha 1.5 has a mean of 3.
+        degree = int(rng.paretovariate(1.5) * FOLLOWS_PER_USER / 3)
+        degree = min(degree, len(user_ids) - 1)
+        authors = set(rng.choices(user_ids, cum_weights=popularity,
+                                  k=degree))
+        authors.discard(user_id)
+        for author_id in authors:
+            yield Follow(user_id=user_id, author_id=author_id)
+
+
+def seed(scale=1.0, seed=0, stdout=None):
+    """Fill the database with a dataset of the given scale."""
+    rng = random.Random(seed)
+    factory.random.reseed_random(seed)
+    sizes = sizes_for(scale)
+    images = _image_names(sizes['images'])
+    with transaction.atomic(), explicit_dates():
+        User.objects.bulk_create(
+            UserFactory.build(username=USERNAME.format(index))
+            for index in range(sizes['users']))
+        user_ids = list(User.objects
+                        .filter(username__startswith=USERNAME.format(''))
+                        .order_by('pk').values_list('pk', flat=True))
+        users = [User(pk=pk) for pk in user_ids]
+        Group.objects.bulk_create(
+            GroupFactory.build(slug=f'bench-{index}')
+            for index in range(sizes['groups']))
+        groups = [Group(pk=pk) for pk in Group.objects
+                  .filter(slug__startswith='bench-')
+                  .order_by('pk').values_list('pk', flat=True)]
+
+        author_weights = _weights(len(users), rng)
+        group_weights = _weights(len(groups), rng)
+        posts = (
+            PostFactory.build(
+                author=rng.choices(users, cum_weights=author_weights)[0],
+                group=(rng.choices(groups, cum_weights=group_weights)[0]
+                       if rng.random() < GROUP_SHARE else None),
+                image=(rng.choice(images)
+                       if rng.random() < IMAGE_SHARE else None))
+            for _ in range(sizes['posts']))
+        for batch in _batches(posts):
+            Post.objects.bulk_create(batch)
+
+        published = [Post(pk=pk, pub_date=pub_date) for pk, pub_date in
+                     Post.objects.order_by('pk')
+                     .values_list('pk', 'pub_date')]
+        post_weights = _weights(len(published), rng)
+        comments = (
+            CommentFactory.build(post=post, author=rng.choice(users))
+            for post in rng.choices(published, cum_weights=post_weights,
+                                    k=sizes['comments']))
+        for batch in _batches(comments):
+            Comment.objects.bulk_create(batch)
+        for batch in _batches(_follows(user_ids, rng)):
+            Follow.objects.bulk_create(batch, ignore_conflicts=True)
+
+    # Followers counts decide which authors are fanned out, see posts.feed.
+    for command in ('reconcile_counters', 'backfill_timelines',
+                    'rebuild_search_index'):
+        call_command(command, stdout=stdout)
+    for name in images:
+        try:
+            thumbnails.generate(name)
+        except Exception as error:
+            if stdout is not None:
+                stdout.write(f'Thumbnail of {name} failed: {error}')
+    return dataset()
+
+
+@contextmanager
+def database(path, reseed=False):
+    """Switch to the SQLite dataset at ``path`` with production-like settings.
+
+    The file is created on first use and kept afterwards unless ``reseed``
+    is set; the media files and the cache are kept next to it.
+    """
+    base = os.path.splitext(path)[0]
+    os.makedirs(os.path.dirname(os.path.abspath(base)), exist_ok=True)
+    default = connections['default']
+    default.settings_dict['TEST']['NAME'] = path
+    old_name = default.creation.create_test_db(
+        verbosity=0, autoclobber=True, serialize=False, keepdb=not reseed)
+    try:
+        with override_settings(
+                DEBUG=False, ALLOWED_HOSTS=['*'], DATABASE_REPLICAS=[],
+                QUERY_BUDGET_RAISE=False, MEDIA_ROOT=f'{base}-media',
+                CACHES={'default': {**settings.CACHES['default'],
+                                    'LOCATION': f'{base}-cache.sqlite3'}}):
+            yield
+    finally:
+        default.creation.destroy_test_db(old_name, verbosity=0, keepdb=True)
+
+
+def dataset():
+    return {
+        'users': User.objects.count(),
+        'groups': Group.objects.count(),
+        'posts': Post.objects.count(),
+        'image_posts': (Post.objects.exclude(image='')
+                        .exclude(image__isnull=True).count()),
+        'comments': Comment.objects.count(),
+        'follows': Follow.objects.count(),
+        'feed_entries': FeedEntry.objects.count(),
+    }
+
+
+def default_user():
+    """The user following the most authors, the heaviest follow feed."""
+    return User.objects.filter(stats__isnull=False)\
+        .order_by('-stats__following_count', 'pk').first()
+
+
+class Targets:
+    """Random but repeatable URLs of each page."""
+
+    def __init__(self, rng, sample=1000):
+        self.rng = rng
+        posts = list(Post.objects.order_by('pk')
+                     .values_list('pk', 'author__username'))
+        self.posts = rng.sample(posts, min(sample, len(posts)))
+        authors = sorted({username for _, username in posts})
+        self.authors = rng.sample(authors, min(sample, len(authors)))
+        self.groups = list(Group.objects.order_by('pk')
+                           .values_list('pk', 'slug'))
+
+    def post(self):
+        return self.rng.choice(self.posts)
+
+    def group(self):
+        return self.rng.choice(self.groups)
+
+    def author(self):
+        return self.rng.choice(self.authors)
+
+
+def scenarios(targets):
+    """(name, url name, signed in, URL factory) of every measured request."""
+    pages = [
+        ('index', 'index', lambda: '/'),
+        ('group_posts', 'group', lambda: f'/group/{targets.group()[1]}/'),
+        ('profile', 'profile', lambda: f'/{targets.author()}/'),
+        ('post_view', 'post',
+         lambda: '/{1}/{0}/'.format(*targets.post())),
+    ]
+    for name, url_name, url in pages:
+        yield f'{name}:anonymous', url_name, False, url
+        yield f'{name}:user', url_name, True, url
+    yield 'follow_index:user', 'follow_index', True, lambda: '/follow/'
+    api = [
+        ('post-list', lambda: '/api/v1/posts'),
+        ('post-list:group',
+         lambda: f'/api/v1/posts?group={targets.group()[0]}'),
+        ('post-detail', lambda: f'/api/v1/posts/{targets.post()[0]}'),
+        ('comment-list',
+         lambda: f'/api/v1/posts/{targets.post()[0]}/comments'),
+        ('group-list', lambda: '/api/v1/groups'),
+        ('follow-list', lambda: '/api/v1/follow'),
+    ]
+    for name, url in api:
+        yield f'api:{name}', name.split(':')[0], True, url
+
+
+def percentile(values, percent):
+    """Nearest-rank percentile of sorted ``values``."""
+    if not values:
+        return 0
+    return values[max(0, math.ceil(percent / 100 * len(values)) - 1)]
+
+
+def summarize(samples, url_name):
+    latency = sorted(sample['total_ms'] for sample in samples)
+    sql = sorted(sample['sql_ms'] for sample in samples)
+    queries = sorted(sample['queries'] for sample in samples)
+    return {
+        'requests': len(samples),
+        'errors': sum(sample['status'] >= 400 for sample in samples),
+        'budget': budget_for(url_name),
+        'latency_ms': {
+            **{f'p{p}': round(percentile(latency, p), 3)
+               for p in PERCENTILES},
+            'mean': round(sum(latency) / len(latency), 3),
+            'max': round(latency[-1], 3),
+        },
+        'sql_ms': {f'p{p}': round(percentile(sql, p), 3)
+                   for p in (50, 95)},
+        'queries': {
+            'min': queries[0],
+            'p50': percentile(queries, 50),
+            'max': queries[-1],
+            'mean': round(sum(queries) / len(queries), 2),
+        },
+    }
+
+
+def request(client, url):
+    measure = Measure()
+    with ExitStack() as stack:
+        for connection in connections.all():
+            stack.enter_context(connection.execute_wrapper(measure))
+        start = time.perf_counter()
+        response = client.get(url)
+        elapsed = time.perf_counter() - start
+    return {'status': response.status_code, 'total_ms': elapsed * 1000,
+            'sql_ms': measure.sql_ms, 'queries': measure.queries}
+
+
+def run(user, requests=100, warmup=5, cold=False, seed=0, only=None,
+        cache=None):
+    """Measure every scenario, return their summaries by name.
+
+    Warm-up requests fill the caches and are not measured; with ``cold``
+    the cache is cleared before every request instead.
+    """
+    rng = random.Random(seed)
+    targets = Targets(rng)
+    anonymous = Client()
+    signed_in = Client(
+        HTTP_AUTHORIZATION=f'Bearer {AccessToken.for_user(user)}')
+    signed_in.force_login(user)
+    results = {}
+    for name, url_name, authenticated, url in scenarios(targets):
+        if only and not any(part in name for part in only):
+            continue
+        client = signed_in if authenticated else anonymous
+        for _ in range(0 if cold else warmup):
+            client.get(url())
+        samples = []
+        for _ in range(requests):
+            if cold and cache is not None:
+                cache.clear()
+            samples.append(request(client, url()))
+        results[name] = summarize(samples, url_name)
+    return results
+
+
+def commit():
+    """The checked out commit and whether the tree has changes."""
+    def git(*args):
+        try:
+            return subprocess.run(
+                ('git',) + args, cwd=settings.BASE_DIR, check=True,
+                capture_output=True, text=True).stdout.strip()
+        except (OSError, subprocess.CalledProcessError):
+            return None
+    sha = git('rev-parse', 'HEAD')
+    return {'sha': sha, 'dirty': bool(sha and git('status', '--porcelain',
+                                                  '--untracked-files=no'))}
+
+
+def report(results, options):
+    return {
+        'commit': commit(),
+        'created': time.strftime('%Y-%m-%dT%H:%M:%S%z'),
+        'options': options,
+        'dataset': dataset(),
+        'results': results,
+    }
+
+
+def compare(before, after):
+    """Rows of (scenario, metric, before, after, change in percent)."""
+    rows = []
+    for name, result in after['results'].items():
+        previous = before['results'].get(name)
+        if previous is None:
+            continue
+        for metric, old, new in (
+                ('latency p50', previous['latency_ms']['p50'],
+                 result['latency_ms']['p50']),
+                ('latency p95', previous['latency_ms']['p95'],
+                 result['latency_ms']['p95']),
+                ('queries max', previous['queries']['max'],
+                 result['queries']['max'])):
+            change = (new - old) / old * 100 if old else 0.0
+            rows.append((name, metric, old, new, change))
+    return rows
@@ -0,0 +1,63 @@
+"""Batch inserts of posts and comments.
+
+``bulk_create`` sends no signals, so the receivers in posts.signals never
+see these rows. ``create_posts`` and ``create_comments`` apply the same
+effects themselves, once per batch rather than once per row: one counter
+UPDATE per author or post, one search index INSERT, one timeline fan-out
+per author and one cache stamp per scope.
+"""
+from collections import Counter
+
+from django.db import transaction
+from django.db.models import Max
+
+from . import counters, feed, fragments, page_cache, search
+from .models import Post, Comment, ThumbnailJob
+
+
+def _insert(model, objects):
+    """``bulk_create`` that also sets the primary keys on SQLite."""
+    last = model.objects.aggregate(last=Max('pk'))['last'] or 0
+    model.objects.bulk_create(objects)
+    if objects and objects[0].pk is None:
+        # AUTOINCREMENT ids grow in insertion order and the transaction
+        # holds the write lock, so the new rows are the ones after ``last``.
+        pks = model.objects.filter(pk__gt=last).order_by('pk')\
+            .values_list('pk', flat=True)
+        for obj, pk in zip(objects, pks):
+            obj.pk = pk
+            obj._state.adding = False
+
+
+def create_posts(posts):
+    """Insert unsaved posts, return them with their ids."""
+    with transaction.atomic():
+        _insert(Post, posts)
+        for author_id, count in Counter(
+                post.author_id for post in posts).items():
+            counters.bump_user(author_id, posts_count=count)
+        search.index_new(posts=posts)
+        feed.fan_out_many(posts)
+        ThumbnailJob.objects.bulk_create(
+            [ThumbnailJob(post=post) for post in posts if post.image])
+        authors = {page_cache.author_scope(post.author_id) for post in posts}
+        page_cache.bump(*page_cache.post_scopes(
+            *{post.group_id for post in posts}), *authors)
+    return posts
+
+
+def create_comments(comments):
+    """Insert unsaved comments, return them with their ids."""
+    with transaction.atomic():
+        _insert(Comment, comments)
+        commented = Counter(comment.post_id for comment in comments)
+        for post_id, count in commented.items():
+            counters.bump_post(post_id, count)
+            fragments.bump('post', post_id)
+        search.index_new(comments=comments)
+        shown = {page_cache.post_scope(post_id) for post_id in commented}
+        shown |= {page_cache.author_scope(comment.post.author_id)
+                  for comment in comments}
+        page_cache.bump(*page_cache.post_scopes(
+            *{comment.post.group_id for comment in comments}), *shown)
+    return comments
@@ -0,0 +1,45 @@
+"""Keyset pages of the comments under a post.
+
+The post page renders only the newest ``COMMENTS_FIRST_PAGE`` comments.
+The "Показать ещё" link after them requests the same URL with the older
+cursor and ``fragment=comments``, which answers the next
+``COMMENTS_PAGE_SIZE`` comments and the link to the batch after them;
+js/feed.js loads it in place, and without JavaScript the link opens the
+post page with the same batch.
+
+Comments are ordered newest first by ``ORDERING``, the columns of the
+``(post, -created, -id)`` index, so each batch is one index range scan.
+The comments endpoint of the API pages by the same ordering.
+"""
+from django.conf import settings
+
+from .models import Comment
+from .pagination import KeysetPaginator
+
+ORDERING = ('-created', '-id')
+FRAGMENT = 'comments'
+
+
+def first_page():
+    return getattr(settings, 'COMMENTS_FIRST_PAGE', 20)
+
+
+def page_size():
+    return getattr(settings, 'COMMENTS_PAGE_SIZE', 50)
+
+
+def is_fragment(request):
+    return request.GET.get('fragment') == FRAGMENT
+
+
+def thread(post_id):
+    return Comment.objects.filter(post_id=post_id)
+
+
+def page(request, post_id):
+    """The comments of ``post_id`` that ``request`` shows."""
+    before = request.GET.get('before')
+    per_page = page_size() if before else first_page()
+    paginator = KeysetPaginator(thread(post_id).select_related('author'),
+                                per_page, ORDERING)
+    return paginator.page(before=before)
@@ -0,0 +1,111 @@
+"""Conditional GET for pages and API resources.
+
+The validators of a response come from the posts.page_cache generations of
+the scopes it shows, so they cost one cache read and never a render. The
+weak ETag hashes those generations with the viewer, the CSRF token and the
+full path, since signed in users see other links and forms;
+``Last-Modified`` is the latest time one of the scopes changed. A request
+whose ``If-None-Match`` or ``If-Modified-Since`` still matches gets a 304
+without running the view.
+
+Responses carry ``Cache-Control: no-cache``: browsers keep them but
+revalidate every time instead of guessing a freshness lifetime from
+``Last-Modified``.
+"""
+import hashlib
+from functools import wraps
+
+from django.utils.cache import get_conditional_response, patch_cache_control
+from django.utils.http import http_date
+
+from . import page_cache
+from .models import Post, User
+
+SAFE_METHODS = ('GET', 'HEAD')
+
+
+def validators(request, scopes):
+    """Return the ETag and the Last-Modified timestamp of a response."""
+    generations = page_cache.generations(scopes)
+    user = request.user
+    viewer = str(user.pk) if user.is_authenticated else 'anonymous'
+    # Forms embed the CSRF token, which is rotated on login.
+    csrf = request.META.get('CSRF_COOKIE', '')
+    digest = hashlib.md5('\n'.join(
+        [viewer, csrf, request.get_full_path(), *generations])
+        .encode()).hexdigest()
+    times = [page_cache.created_at(value) for value in generations]
+    last_modified = None if None in times else int(max(times))
+    return f'W/"{digest}"', last_modified
+
+
+def _set_validators(request, response, etag, last_modified):
+    response['ETag'] = etag
+    if last_modified is not None:
+        response['Last-Modified'] = http_date(last_modified)
+    patch_cache_control(response, no_cache=True,
+                        private=request.user.is_authenticated)
+
+
+def respond(request, scopes, view):
+    """Return 304 if the client has the response for ``scopes``, or call
+    ``view()`` and add the validators to what it returns.
+
+    ``scopes`` may be None when there is nothing to validate against, e.g.
+    for a missing object. Scopes are only built for existing objects: the
+    first read of a scope stores its generation.
+    """
+    if request.method not in SAFE_METHODS or not scopes:
+        return view()
+    etag, last_modified = validators(request, scopes)
+    response = get_conditional_response(request, etag=etag,
+                                        last_modified=last_modified)
+    if response is None:
+        response = view()
+    if response.status_code in (200, 304):
+        _set_validators(request, response, etag, last_modified)
+    return response
+
+
+def conditional_page(scopes):
+    """Answer conditional GETs of a page view.
+
+    ``scopes`` is a list of scope names or a callable building it from the
+    view keyword arguments.
+    """
+    def decorator(view):
+        @wraps(view)
+        def wrapped(request, *args, **kwargs):
+            names = scopes(**kwargs) if callable(scopes) else scopes
+            return respond(request, names,
+                           lambda: view(request, *args, **kwargs))
+        return wrapped
+    return decorator
+
+
+def _author_id(username):
+    return User.objects.filter(username=username)\
+        .values_list('pk', flat=True).first()
+
+
+def profile_scopes(username):
+    """The author's posts and counters, and the titles of the groups."""
+    author_id = _author_id(username)
+    if author_id is None:
+        return None
+    return [page_cache.author_scope(author_id), page_cache.GROUPS_SCOPE]
+
+
+def post_page_scopes(username, post_id):
+    """The post with its comments, its author's counters and the groups."""
+    author_id = Post.objects.filter(pk=post_id, author__username=username)\
+        .values_list('author_id', flat=True).order_by('pk').first()
+    if author_id is None:
+        return None
+    return [page_cache.post_scope(post_id), page_cache.author_scope(author_id),
+            page_cache.GROUPS_SCOPE]
+
+
+def group_page_scopes(slug):
+    scope = page_cache.existing_group_scope(slug)
+    return scope and [scope]
@@ -0,0 +1,69 @@
+"""Denormalized counters for posts and users.
+
+``Post.comment_count`` and the ``UserStats`` row of each user are changed
+with single ``UPDATE ... SET x = x + 1`` statements from the model signals,
+so pages can show them without aggregate queries. ``reconcile`` recomputes
+everything from the source tables and fixes any drift.
+"""
+from django.db.models import Count, F, OuterRef, Subquery, Value
+from django.db.models.functions import Coalesce, Greatest
+
+from .models import Post, Comment, Follow, UserStats, User
+
+
+def _deltas(deltas):
+    return {name: Greatest(F(name) + delta, Value(0))
+            for name, delta in deltas.items()}
+
+
+def bump_post(post_id, delta):
+    Post.objects.filter(pk=post_id).update(**_deltas({'comment_count': delta}))
+
+
+def bump_user(user_id, **deltas):
+    updated = UserStats.objects.filter(user_id=user_id)\
+        .update(**_deltas(deltas))
+    if updated or all(delta < 0 for delta in deltas.values()):
+        # Nothing to decrement from, most likely the user is being deleted.
+        return
+    UserStats.objects.get_or_create(user_id=user_id)
+    UserStats.objects.filter(user_id=user_id).update(**_deltas(deltas))
+
+
+def stats_for(user):
+    """Return the counters of ``user`` without failing for fresh accounts."""
+    try:
+        return user.stats
+    except UserStats.DoesNotExist:
+        return UserStats(user=user)
+
+
+def _count(queryset, field, outer):
+    rows = queryset\
+        .filter(**{field: OuterRef(outer)})\
+        .order_by()\
+        .values(field)\
+        .annotate(total=Count('pk'))\
+        .values('total')
+    return Coalesce(Subquery(rows), Value(0))
+
+
+def reconcile():
+    """Recompute every counter, return the number of rows that drifted."""
+    comments = _count(Comment.objects.all(), 'post', 'pk')
+    fixed = Post.objects.exclude(comment_count=comments)\
+        .update(comment_count=comments)
+
+    missing = User.objects.filter(stats__isnull=True).values_list('pk',
+                                                                  flat=True)
+    UserStats.objects.bulk_create(
+        [UserStats(user_id=user_id) for user_id in missing],
+        ignore_conflicts=True)
+    for name, queryset, field in (
+            ('posts_count', Post.objects.all(), 'author'),
+            ('followers_count', Follow.objects.all(), 'author'),
+            ('following_count', Follow.objects.all(), 'user')):
+        counted = _count(queryset, field, 'user_id')
+        fixed += UserStats.objects.exclude(**{name: counted})\
+            .update(**{name: counted})
+    return fixed
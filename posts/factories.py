@@ -0,0 +1,70 @@
+"""factory-boy factories for posts, comments, groups and follows.
+
+Texts are Russian like the content of the site, so full-text search and
+its stemmer see realistic words. ``build()`` the objects and insert them
+with ``bulk_create`` when seeding large datasets, see posts.benchmark.
+"""
+from datetime import timedelta
+
+import factory
+from django.contrib.auth.models import User
+from django.utils import timezone
+
+from .models import Post, Group, Comment, Follow
+
+LOCALE = 'ru_RU'
+
+
+class UserFactory(factory.django.DjangoModelFactory):
+    class Meta:
+        model = User
+        django_get_or_create = ('username',)
+
+    username = factory.Sequence(lambda n: f'user{n}')
+    first_name = factory.Faker('first_name', locale=LOCALE)
+    last_name = factory.Faker('last_name', locale=LOCALE)
+    email = factory.LazyAttribute(lambda user: f'{user.username}@example.com')
+    # Seeded users never sign in with a password.
+    password = '!'
+
+
+class GroupFactory(factory.django.DjangoModelFactory):
+    class Meta:
+        model = Group
+        django_get_or_create = ('slug',)
+
+    title = factory.Faker('catch_phrase', locale=LOCALE)
+    slug = factory.Sequence(lambda n: f'group-{n}')
+    description = factory.Faker('paragraph', locale=LOCALE)
+
+
+class PostFactory(factory.django.DjangoModelFactory):
+    class Meta:
+        model = Post
+
+    text = factory.Faker('paragraph', nb_sentences=4, locale=LOCALE)
+    author = factory.SubFactory(UserFactory)
+    group = None
+    pub_date = factory.Faker('date_time_between', start_date='-2y',
+                             tzinfo=timezone.utc)
+
+
+class CommentFactory(factory.django.DjangoModelFactory):
+    class Meta:
+        model = Comment
+
+    post = factory.SubFactory(PostFactory)
+    author = factory.SubFactory(UserFactory)
+    text = factory.Faker('sentence', locale=LOCALE)
+    created = factory.LazyAttribute(
+        lambda comment: comment.post.pub_date + timedelta(
+            minutes=factory.random.randgen.randint(1, 60 * 24 * 7)))
+
+
+class FollowFactory(factory.django.DjangoModelFactory):
+    class Meta:
+        model = Follow
+        django_get_or_create = ('user', 'author')
+
+    user = factory.SubFactory(UserFactory)
+    author = factory.SubFactory(UserFactory)
@@ -0,0 +1,179 @@
+"""Fan-out-on-write follow feed.
+
+Every post is copied into the ``FeedEntry`` timeline of each follower of
+its author when it is published, so reading the follow feed is a single
+range scan on ``(user, -pub_date, -post)``. Authors with at least
+``FEED_CELEBRITY_FOLLOWERS`` followers are not fanned out; their posts are
+merged into the timeline at read time instead. An author who falls below
+the threshold again gets a ``FeedBackfillJob``: "backfill_timelines
+--queued" copies their past posts to the timelines outside the request,
+and until it has, their posts are still merged at read time. Following
+and unfollowing at the threshold only re-queues the same job.
+"""
+from collections import defaultdict
+
+from django.conf import settings
+from django.db.models import Q
+from django.utils import timezone
+
+from .models import Post, Follow, FeedEntry, FeedBackfillJob, UserStats
+from .pagination import (KeysetPaginator, KeysetPage, PAGE_SIZE,
+                         decode_cursor)
+
+ENTRY_ORDERING = ('-pub_date', '-post')
+
+
+def celebrity_threshold():
+    return getattr(settings, 'FEED_CELEBRITY_FOLLOWERS', 1000)
+
+
+def backfill_limit():
+    return getattr(settings, 'FEED_FOLLOW_BACKFILL', 200)
+
+
+def is_celebrity(author_id):
+    return UserStats.objects.filter(
+        user_id=author_id,
+        followers_count__gte=celebrity_threshold()).exists()
+
+
+def followed_celebrities(user):
+    """The followed authors whose posts are merged at read time."""
+    followed = Follow.objects.filter(user=user).values('author')
+    return list(UserStats.objects
+                .filter(Q(followers_count__gte=celebrity_threshold())
+                        | Q(user__feed_backfill_job__isnull=False),
+                        user__in=followed)
+                .values_list('user', flat=True))
+
+
+def entries_for(post, user_ids):
+    return [FeedEntry(user_id=user_id, post_id=post.id,
+                      author_id=post.author_id, pub_date=post.pub_date)
+            for user_id in user_ids]
+
+
+def fan_out(post):
+    fan_out_many([post])
+
+
+def fan_out_many(posts):
+    """Fan out a batch with one followers query per author."""
+    by_author = defaultdict(list)
+    for post in posts:
+        by_author[post.author_id].append(post)
+    entries = []
+    for author_id, authored in by_author.items():
+        if is_celebrity(author_id):
+            continue
+        followers = list(Follow.objects
+                         .filter(author_id=author_id)
+                         .values_list('user_id', flat=True))
+        for post in authored:
+            entries += entries_for(post, followers)
+    FeedEntry.objects.bulk_create(entries, ignore_conflicts=True)
+
+
+def add_author(user_id, author_id, limit=None):
+    """Copy the latest posts of a newly followed author into a timeline."""
+    if is_celebrity(author_id):
+        return
+    posts = (Post.objects
+             .filter(author_id=author_id)
+             .only('id', 'author_id', 'pub_date'))
+    posts = posts[:limit or backfill_limit()]
+    FeedEntry.objects.bulk_create(
+        [entry for post in posts for entry in entries_for(post, [user_id])],
+        ignore_conflicts=True)
+
+
+def remove_author(user_id, author_id):
+    FeedEntry.objects.filter(user_id=user_id, author_id=author_id).delete()
+
+
+def add_followers(author_id, limit=None):
+    """Copy the latest posts of an author into the timelines of all of
+    their followers."""
+    followers = list(Follow.objects
+                     .filter(author_id=author_id)
+                     .values_list('user_id', flat=True))
+    posts = (Post.objects
+             .filter(author_id=author_id)
+             .only('id', 'author_id', 'pub_date'))
+    posts = posts[:limit or backfill_limit()]
+    FeedEntry.objects.bulk_create(
+        [entry for post in posts for entry in entries_for(post, followers)],
+        batch_size=500, ignore_conflicts=True)
+
+
+def follower_removed(author_id):
+    """Queue the backfill of an author who just fell below the celebrity
+    threshold: their past posts were never copied to the timelines."""
+    if UserStats.objects.filter(
+            user_id=author_id,
+            followers_count=celebrity_threshold() - 1).exists():
+        FeedBackfillJob.objects.update_or_create(
+            author_id=author_id, defaults={'queued': timezone.now()})
+
+
+def process_backfills(limit=None):
+    """Run the queued backfills, return the number of authors done."""
+    done = 0
+    for job in FeedBackfillJob.objects.all()[:limit]:
+        if not is_celebrity(job.author_id):
+            add_followers(job.author_id)
+        # An author queued again meanwhile keeps the newer job.
+        FeedBackfillJob.objects.filter(pk=job.pk, queued=job.queued).delete()
+        done += 1
+    return done
+
+
+def _merge(pages, per_page, backwards):
+    posts = {}
+    for page in pages:
+        for post in page.object_list:
+            posts[post.id] = post
+    rows = sorted(posts.values(), key=lambda post: (post.pub_date, post.id),
+                  reverse=True)
+    more = len(rows) > per_page
+    if backwards:
+        rows = rows[-per_page:]
+        has_older = True
+        has_newer = more or any(page.has_newer for page in pages)
+    else:
+        rows = rows[:per_page]
+        has_older = more or any(page.has_older for page in pages)
+        has_newer = any(page.has_newer for page in pages)
+    return rows, has_older, has_newer
+
+
+def timeline_page(user, before=None, after=None, per_page=PAGE_SIZE):
+    """Return a keyset page of the posts from authors ``user`` follows."""
+    entries = FeedEntry.objects\
+        .filter(user=user)\
+        .select_related('post__author', 'post__group')
+    entry_page = KeysetPaginator(entries, per_page, ENTRY_ORDERING)\
+        .page(before=before, after=after)
+    entry_page.object_list = [entry.post for entry in entry_page]
+    pages = [entry_page]
+
+    celebrities = followed_celebrities(user)
+    if celebrities:
+        # Both cursors are (pub_date, post id), so one cursor seeks both.
+        celebrity_posts = Post.objects\
+            .filter(author_id__in=celebrities)\
+            .select_related('author', 'group')
+        pages.append(KeysetPaginator(celebrity_posts, per_page)
+                     .page(before=before, after=after))
+
+    post_paginator = KeysetPaginator(Post.objects.all(), per_page)
+    backwards = bool(after) and decode_cursor(
+        after, post_paginator.fields) is not None
+    rows, has_older, has_newer = _merge(pages, per_page, backwards)
+    return KeysetPage(
+        rows,
+        has_older=has_older,
+        has_newer=has_newer,
+        older_cursor=post_paginator.cursor_for(rows[-1]) if rows else None,
+        newer_cursor=post_paginator.cursor_for(rows[0]) if rows else None,
+    )
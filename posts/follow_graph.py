@@ -0,0 +1,45 @@
+"""Who follows whom, answered from a cached set per user.
+
+The ids of the authors a user follows are loaded with one query and kept
+in the cache as a frozenset, so "does the viewer follow X" is a set lookup.
+Follow rows change only through the ORM (``profile_follow``,
+``profile_unfollow`` and the API), and the Follow signals call
+``invalidate``.
+"""
+from django.conf import settings
+from django.core.cache import cache
+from django.db import connection, transaction
+
+from .models import Follow
+
+
+def graph_timeout():
+    return getattr(settings, 'FOLLOW_GRAPH_TIMEOUT', 60 * 60 * 24)
+
+
+def followed_key(user_id):
+    return f'follow_graph:{user_id}:followed'
+
+
+def followed_ids(user):
+    """Ids of the authors ``user`` follows, empty for anonymous users."""
+    if not user.is_authenticated:
+        return frozenset()
+    key = followed_key(user.pk)
+    ids = cache.get(key)
+    if ids is None:
+        ids = frozenset(Follow.objects.filter(user_id=user.pk)
+                        .values_list('author_id', flat=True))
+        cache.set(key, ids, graph_timeout())
+    return ids
+
+
+def is_following(user, author_id):
+    return author_id in followed_ids(user)
+
+
+def invalidate(user_id):
+    cache.delete(followed_key(user_id))
+    if connection.in_atomic_block:
+        # A set loaded before the follow commits would be stored again.
+        transaction.on_commit(lambda: cache.delete(followed_key(user_id)))
@@ -1,6 +1,7 @@
 from django import forms
 
 from .models import Post, Comment
+from .uploads import ImageUploadField
 
 
 class PostForm(forms.ModelForm):
@@ -11,6 +12,7 @@ class PostForm(forms.ModelForm):
         labels = {'text': 'Введите текст', 'group': 'Выберите группу',
                   'image': 'Вставьте изображение'}
         widgets = {'text': forms.Textarea()}
+        field_classes = {'image': ImageUploadField}
 
 
 class CommentForm(forms.ModelForm):
@@ -0,0 +1,110 @@
+"""Cache of rendered ``post_item.html`` cards.
+
+A card is stored under the post id, the current version stamps of the post
+and of its group, and the viewer variant. Only the author sees the
+"Редактировать" link and only signed in users see "Добавить комментарий",
+so there are at most three variants of every card. Saving or deleting a
+post, comment or group replaces the matching stamp, which makes the old
+fragments unreachable instead of deleting them one by one.
+"""
+import uuid
+
+from django.conf import settings
+from django.core.cache import cache
+from django.db import connection, transaction
+from django.template.loader import render_to_string
+
+from yatube import routers
+from . import image_variants
+
+STATS_KEYS = {'hits': 'post_card:hits', 'misses': 'post_card:misses'}
+
+
+def card_timeout():
+    return getattr(settings, 'POST_CARD_CACHE_TIMEOUT', 60 * 60 * 24)
+
+
+def version_key(kind, pk):
+    return f'post_card:{kind}:{pk}:version'
+
+
+def _replace_version(kind, pk):
+    cache.set(version_key(kind, pk), uuid.uuid4().hex, None)
+
+
+def bump(kind, pk):
+    _replace_version(kind, pk)
+    if connection.in_atomic_block:
+        # Same as page_cache.bump: drop cards rendered before the commit.
+        transaction.on_commit(lambda: _replace_version(kind, pk))
+
+
+def variant_for(post, user):
+    if not user.is_authenticated:
+        return 'anon'
+    return 'author' if user.pk == post.author_id else 'auth'
+
+
+def _versions(posts):
+    keys = {version_key('post', post.pk) for post in posts}
+    keys |= {version_key('group', post.group_id)
+             for post in posts if post.group_id}
+    versions = cache.get_many(keys)
+    missing = {key: uuid.uuid4().hex for key in keys - set(versions)}
+    if missing:
+        # A lost stamp must never fall back to a value an old fragment
+        # could have been stored under.
+        cache.set_many(missing, None)
+        versions.update(missing)
+    return versions
+
+
+def _count(name, value):
+    if value:
+        key = STATS_KEYS[name]
+        cache.add(key, 0, None)
+        try:
+            cache.incr(key, value)
+        except ValueError:
+            cache.set(key, value, None)
+
+
+def render_cards(posts, user):
+    """Return the rendered cards of ``posts`` in order."""
+    posts = list(posts)
+    if not posts:
+        return []
+    versions = _versions(posts)
+    keys = []
+    for post in posts:
+        group_version = versions.get(version_key('group', post.group_id), '')
+        keys.append(':'.join((
+            'post_card', str(post.pk),
+            versions[version_key('post', post.pk)], group_version,
+            variant_for(post, user),
+        )))
+    cards = cache.get_many(keys)
+    image_variants.attach([post for key, post in zip(keys, posts)
+                           if key not in cards])
+    rendered = {}
+    for key, post in zip(keys, posts):
+        if key not in cards:
+            rendered[key] = render_to_string('post_item.html',
+                                             {'post': post, 'user': user})
+    # Cards rendered from a lagging replica could be stale for the current
+    # version stamp; they are shown but only primary renders are stored.
+    if rendered and not routers.reading_replica():
+        cache.set_many(rendered, card_timeout())
+    cards.update(rendered)
+    _count('hits', len(posts) - len(rendered))
+    _count('misses', len(rendered))
+    return [cards[key] for key in keys]
+
+
+def stats():
+    values = cache.get_many(STATS_KEYS.values())
+    return {name: values.get(key, 0) for name, key in STATS_KEYS.items()}
+
+
+def reset_stats():
+    cache.delete_many(STATS_KEYS.values())
@@ -0,0 +1,139 @@
+"""Responsive variants of post images.
+
+Next to the sorl thumbnail, the thumbnail worker renders every post image
+cropped to the card geometry in ``IMAGE_VARIANT_WIDTHS`` widths and
+``IMAGE_VARIANT_FORMATS`` formats; formats this Pillow cannot write, such
+as AVIF before Pillow 11.3, are skipped. The cards show them as a
+``<picture>`` with a ``<source>`` per modern format and a JPEG ``srcset``
+on the ``<img>``, so a phone downloads a 320px WebP instead of the 960px
+JPEG.
+
+Files are named after a hash of their bytes under ``variants/``: a name
+never changes content, so the web server can send them with
+``CACHE_CONTROL``. Resizing uses Pillow directly because sorl's engine
+relies on ``Image.ANTIALIAS``, which newer Pillow releases removed.
+"""
+import hashlib
+from collections import defaultdict
+from io import BytesIO
+
+from django.conf import settings
+from django.core.files.base import ContentFile
+from django.core.files.storage import default_storage
+from PIL import Image, ImageOps
+
+from .models import ImageVariant
+
+CACHE_CONTROL = 'public, max-age=31536000, immutable'
+DIRECTORY = 'variants'
+MIME_TYPES = {'avif': 'image/avif', 'webp': 'image/webp',
+              'jpeg': 'image/jpeg'}
+EXTENSIONS = {'avif': 'avif', 'webp': 'webp', 'jpeg': 'jpg'}
+QUALITY = {'avif': 50, 'webp': 75, 'jpeg': 80}
+FALLBACK = 'jpeg'
+
+
+def widths():
+    return sorted(getattr(settings, 'IMAGE_VARIANT_WIDTHS',
+                          (320, 480, 640, 960)))
+
+
+def formats():
+    """The configured formats Pillow can write, best first."""
+    Image.init()
+    wanted = getattr(settings, 'IMAGE_VARIANT_FORMATS', ('webp', 'jpeg'))
+    return [name for name in MIME_TYPES
+            if name in wanted and name.upper() in Image.SAVE
+            or name == FALLBACK]
+
+
+def sizes():
+    return getattr(settings, 'IMAGE_VARIANT_SIZES',
+                   '(max-width: 960px) 100vw, 960px')
+
+
+def _save(content, extension):
+    digest = hashlib.sha256(content).hexdigest()[:24]
+    name = f'{DIRECTORY}/{digest[:2]}/{digest}.{extension}'
+    if not default_storage.exists(name):
+        name = default_storage.save(name, ContentFile(content))
+    return name
+
+
+def render(name, geometry):
+    """Write the variants of the image ``name`` cropped to the aspect of
+    ``geometry``, e.g. ``'960x339'``, and return their fields."""
+    with default_storage.open(name) as file:
+        image = Image.open(file)
+        image = ImageOps.exif_transpose(image).convert('RGB')
+    card_width, card_height = map(int, geometry.split('x'))
+    # Upscaled copies would cost bytes without adding detail.
+    chosen = [width for width in widths() if width <= image.width] \
+        or widths()[:1]
+    variants = []
+    for width in chosen:
+        height = round(width * card_height / card_width)
+        resized = ImageOps.fit(image, (width, height), Image.LANCZOS)
+        for format in formats():
+            data = BytesIO()
+            resized.save(data, format.upper(), quality=QUALITY[format])
+            variants.append({
+                'format': format, 'width': width, 'height': height,
+                'name': _save(data.getvalue(), EXTENSIONS[format]),
+            })
+    return variants
+
+
+def store(post_id, source, variants):
+    """Replace the variants of a post by the ones rendered from
+    ``source``."""
+    ImageVariant.objects.filter(post_id=post_id).delete()
+    ImageVariant.objects.bulk_create(
+        ImageVariant(post_id=post_id, source=source, **fields)
+        for fields in variants)
+
+
+def _srcset(variants):
+    return ', '.join(f'{default_storage.url(variant.name)} {variant.width}w'
+                     for variant in variants)
+
+
+def picture(post, variants):
+    """The ``<picture>`` markup data of ``post``, None until its variants
+    are ready."""
+    by_format = defaultdict(list)
+    for variant in sorted(variants, key=lambda variant: variant.width):
+        if variant.source == post.image.name:
+            by_format[variant.format].append(variant)
+    fallback = by_format.pop(FALLBACK, None)
+    if not fallback:
+        return None
+    largest = fallback[-1]
+    return {
+        'sources': [{'type': MIME_TYPES[format],
+                     'srcset': _srcset(by_format[format])}
+                    for format in MIME_TYPES if by_format.get(format)],
+        'src': default_storage.url(largest.name),
+        'srcset': _srcset(fallback),
+        'sizes': sizes(),
+        'width': largest.width,
+        'height': largest.height,
+    }
+
+
+def attach(posts):
+    """Set ``picture`` on ``posts`` with one query."""
+    ids = [post.pk for post in posts if post.image]
+    by_post = defaultdict(list)
+    if ids:
+        for variant in ImageVariant.objects.filter(post_id__in=ids):
+            by_post[variant.post_id].append(variant)
+    for post in posts:
+        post.picture = picture(post, by_post[post.pk]) if post.image \
+            else None
+
+
+def picture_for(post):
+    if not hasattr(post, 'picture'):
+        attach([post])
+    return post.picture
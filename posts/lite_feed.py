@@ -0,0 +1,52 @@
+"""Lite mode of the feed pages.
+
+With ``FEED_LITE`` on (it is off by default), a feed page renders only its
+first ``FEED_LITE_FIRST_CARDS`` cards. The following ones are loaded by
+js/feed.js as the reader scrolls towards the end: it requests the same URL
+with the older cursor and ``fragment=cards``, which answers only the next
+``PAGE_SIZE`` cards and the link to the batch after them. Without
+JavaScript that link opens the next full page as before, so the URLs in
+posts/urls.py are unchanged. Legacy ``?page=N`` links keep full pages.
+"""
+from django.conf import settings
+from django.shortcuts import render
+
+from .pagination import PAGE_SIZE, is_legacy_request
+
+FRAGMENT = 'cards'
+
+
+def enabled():
+    return getattr(settings, 'FEED_LITE', False)
+
+
+def first_cards():
+    return getattr(settings, 'FEED_LITE_FIRST_CARDS', 5)
+
+
+def is_lite(request):
+    return enabled() and not is_legacy_request(request)
+
+
+def is_fragment(request):
+    return request.GET.get('fragment') == FRAGMENT
+
+
+def is_first_page(request):
+    return not ({'before', 'after'} & set(request.GET))
+
+
+def per_page(request):
+    """How many posts the feed ``request`` shows: only the first page is
+    shortened, the pages opened by the links are full."""
+    if is_lite(request) and is_first_page(request):
+        return first_cards()
+    return PAGE_SIZE
+
+
+def render_feed(request, template, context):
+    """Render the feed page, or only its cards for a fragment request."""
+    context['lite'] = is_lite(request)
+    if is_fragment(request):
+        return render(request, 'feed_fragment.html', context)
+    return render(request, template, context)
@@ -0,0 +1,34 @@
+from django.core.management.base import BaseCommand
+
+from posts import feed
+from posts.models import Follow, FeedEntry
+
+
+class Command(BaseCommand):
+    help = 'Rebuild the materialized follow feed of every user.'
+
+    def add_arguments(self, parser):
+        parser.add_argument('--clear', action='store_true',
+                            help='Delete all timeline entries first.')
+        parser.add_argument('--limit', type=int, default=None,
+                            help='Latest posts copied per followed author.')
+        parser.add_argument('--queued', action='store_true',
+                            help='Only run the backfills queued for authors '
+                                 'who fell below the celebrity threshold.')
+
+    def handle(self, *args, **options):
+        if options['queued']:
+            done = feed.process_backfills()
+            self.stdout.write(self.style.SUCCESS(
+                f'Backfilled the posts of {done} authors.'))
+            return
+        if options['clear']:
+            FeedEntry.objects.all().delete()
+        follows = Follow.objects.values_list('user_id', 'author_id')
+        total = 0
+        for user_id, author_id in follows.iterator():
+            feed.add_author(user_id, author_id, limit=options['limit'])
+            total += 1
+        self.stdout.write(self.style.SUCCESS(
+            f'Backfilled {total} subscriptions, '
+            f'{FeedEntry.objects.count()} timeline entries in total.'))
@@ -0,0 +1,110 @@
+import json
+import os
+
+from django.conf import settings
+from django.core.cache import cache
+from django.core.management.base import BaseCommand, CommandError
+from django.db import connection
+
+from posts import benchmark
+from posts.models import Post, User
+
+
+class Command(BaseCommand):
+    help = ('Seed a separate benchmark database, request the hot pages and '
+            'API endpoints through the test client and write latency '
+            'percentiles and query counts as JSON.')
+
+    def add_arguments(self, parser):
+        parser.add_argument('--database',
+                            default=os.path.join(settings.BASE_DIR,
+                                                 'benchmark.sqlite3'),
+                            help='SQLite file of the dataset, kept between '
+                                 'runs so commits are measured on the same '
+                                 'data.')
+        parser.add_argument('--scale', type=float, default=1.0,
+                            help='Dataset size relative to 100k posts and '
+                                 '1M comments.')
+        parser.add_argument('--seed', type=int, default=0)
+        parser.add_argument('--reseed', action='store_true',
+                            help='Recreate the dataset even if the database '
+                                 'exists.')
+        parser.add_argument('--requests', type=int, default=100,
+                            help='Measured requests per scenario.')
+        parser.add_argument('--warmup', type=int, default=5,
+                            help='Unmeasured requests filling the caches.')
+        parser.add_argument('--cold', action='store_true',
+                            help='Clear the cache before every request.')
+        parser.add_argument('--only', action='append',
+                            help='Run the scenarios containing this text.')
+        parser.add_argument('--user',
+                            help='Username of the signed in requests, '
+                                 'defaults to the one following the most '
+                                 'authors.')
+        parser.add_argument('--output',
+                            help='JSON report path, defaults to '
+                                 'benchmark-<commit>.json.')
+        parser.add_argument('--compare',
+                            help='Earlier JSON report to compare with.')
+
+    def handle(self, *args, **options):
+        if connection.vendor != 'sqlite':
+            raise CommandError('The benchmark database is a SQLite file.')
+        with benchmark.database(options['database'], options['reseed']):
+            report = self.measure(options)
+        output = options['output'] or \
+            f'benchmark-{(report["commit"]["sha"] or "unknown")[:10]}.json'
+        with open(output, 'w') as file:
+            json.dump(report, file, indent=2, sort_keys=True)
+        self.print_results(report['results'])
+        if options['compare']:
+            with open(options['compare']) as file:
+                self.print_comparison(benchmark.compare(json.load(file),
+                                                        report))
+        self.stdout.write(self.style.SUCCESS(f'Report written to {output}.'))
+
+    def measure(self, options):
+        if not Post.objects.exists():
+            self.stdout.write(f'Seeding at scale {options["scale"]:g}...')
+            benchmark.seed(options['scale'], options['seed'], self.stdout)
+        if options['user']:
+            user = User.objects.filter(
+                username=options['user']).first()
+        else:
+            user = benchmark.default_user()
+        if user is None:
+            raise CommandError('No user to sign in as.')
+        cache.clear()
+        results = benchmark.run(
+            user, requests=options['requests'], warmup=options['warmup'],
+            cold=options['cold'], seed=options['seed'], only=options['only'],
+            cache=cache)
+        used = {name: options[name] for name in
+                ('seed', 'requests', 'warmup', 'cold', 'only')}
+        used['user'] = user.username
+        return benchmark.report(results, used)
+
+    def print_results(self, results):
+        self.stdout.write(f'{"scenario":<28}{"p50":>9}{"p95":>9}{"p99":>9}'
+                          f'{"queries":>9}{"budget":>8}{"errors":>8}')
+        for name, result in results.items():
+            latency = result['latency_ms']
+            queries = result['queries']['max']
+            budget = result['budget']
+            line = (f'{name:<28}{latency["p50"]:>9.1f}{latency["p95"]:>9.1f}'
+                    f'{latency["p99"]:>9.1f}{queries:>9}'
+                    f'{"-" if budget is None else budget:>8}'
+                    f'{result["errors"]:>8}')
+            if result['errors'] or budget is not None and queries > budget:
+                line = self.style.WARNING(line)
+            self.stdout.write(line)
+
+    def print_comparison(self, rows):
+        self.stdout.write(f'{"scenario":<28}{"metric":<14}{"before":>10}'
+                          f'{"after":>10}{"change":>9}')
+        for name, metric, before, after, change in rows:
+            line = (f'{name:<28}{metric:<14}{before:>10g}{after:>10g}'
+                    f'{change:>+8.1f}%')
+            if change > 10:
+                line = self.style.WARNING(line)
+            self.stdout.write(line)
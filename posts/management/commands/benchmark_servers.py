@@ -0,0 +1,84 @@
+import json
+import os
+
+from django.conf import settings
+from django.core.management.base import BaseCommand, CommandError
+from django.db import connection
+
+from posts import benchmark, server_benchmark
+from posts.models import Post, User
+
+
+class Command(BaseCommand):
+    help = ('Serve the read-only benchmark scenarios to many slow '
+            'concurrent clients through the WSGI and the ASGI entry points '
+            'and write their throughput and latency percentiles as JSON.')
+
+    def add_arguments(self, parser):
+        parser.add_argument('--database',
+                            default=os.path.join(settings.BASE_DIR,
+                                                 'benchmark.sqlite3'),
+                            help='SQLite file of the dataset, shared with '
+                                 'manage.py benchmark.')
+        parser.add_argument('--scale', type=float, default=1.0,
+                            help='Dataset size if it has to be seeded.')
+        parser.add_argument('--seed', type=int, default=0)
+        parser.add_argument('--clients', type=int, default=50,
+                            help='Concurrent clients.')
+        parser.add_argument('--requests', type=int, default=10,
+                            help='Requests made by every client in turn.')
+        parser.add_argument('--workers', type=int, default=4,
+                            help='Threads running the application on both '
+                                 'sides.')
+        parser.add_argument('--delay', type=float, default=0.05,
+                            help='Seconds a client takes to send a request '
+                                 'and again to read the response.')
+        parser.add_argument('--only', action='append',
+                            help='Request the scenarios containing this '
+                                 'text.')
+        parser.add_argument('--user',
+                            help='Username of the signed in requests.')
+        parser.add_argument('--output',
+                            help='JSON report path, defaults to '
+                                 'benchmark-servers-<commit>.json.')
+
+    def handle(self, *args, **options):
+        if connection.vendor != 'sqlite':
+            raise CommandError('The benchmark database is a SQLite file.')
+        with benchmark.database(options['database']):
+            report = self.measure(options)
+        output = options['output'] or 'benchmark-servers-{}.json'.format(
+            (report['commit']['sha'] or 'unknown')[:10])
+        with open(output, 'w') as file:
+            json.dump(report, file, indent=2, sort_keys=True)
+        self.print_results(report['results'])
+        self.stdout.write(self.style.SUCCESS(f'Report written to {output}.'))
+
+    def measure(self, options):
+        if not Post.objects.exists():
+            self.stdout.write(f'Seeding at scale {options["scale"]:g}...')
+            benchmark.seed(options['scale'], options['seed'], self.stdout)
+        if options['user']:
+            user = User.objects.filter(username=options['user']).first()
+        else:
+            user = benchmark.default_user()
+        if user is None:
+            raise CommandError('No user to sign in as.')
+        used = {name: options[name] for name in
+                ('seed', 'clients', 'requests', 'workers', 'delay', 'only')}
+        results = server_benchmark.run(
+            user, **{name: used[name] for name in used})
+        used['user'] = user.username
+        return benchmark.report(results, used)
+
+    def print_results(self, results):
+        self.stdout.write(f'{"server":<8}{"req/s":>9}{"p50":>9}{"p95":>9}'
+                          f'{"p99":>9}{"errors":>8}')
+        for name, result in results.items():
+            latency = result['latency_ms']
+            line = (f'{name:<8}{result["throughput"]:>9.1f}'
+                    f'{latency["p50"]:>9.1f}{latency["p95"]:>9.1f}'
+                    f'{latency["p99"]:>9.1f}{result["errors"]:>8}')
+            if result['errors']:
+                line = self.style.WARNING(line)
+            self.stdout.write(line)
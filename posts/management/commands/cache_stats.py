@@ -0,0 +1,17 @@
+from django.core.cache import cache
+from django.core.management.base import BaseCommand, CommandError
+
+
+class Command(BaseCommand):
+    help = 'Show per-worker hit and miss counters of the shared cache.'
+
+    def handle(self, *args, **options):
+        if not hasattr(cache, 'worker_metrics'):
+            raise CommandError('The default cache does not record metrics.')
+        for row in cache.worker_metrics():
+            total = row['lru_hits'] + row['hits'] + row['misses']
+            ratio = (row['lru_hits'] + row['hits']) / total if total else 0
+            self.stdout.write(
+                f"pid {row['pid']}: lru hits {row['lru_hits']}, "
+                f"hits {row['hits']}, misses {row['misses']}, "
+                f'hit ratio {ratio:.2%}')
@@ -0,0 +1,102 @@
+import re
+
+from django.contrib.auth.models import User
+from django.core.management.base import BaseCommand, CommandError
+from django.db import connection, transaction
+from django.test import Client
+from django.test.utils import CaptureQueriesContext, override_settings
+from rest_framework_simplejwt.tokens import AccessToken
+
+from posts import search
+from posts.models import Post, Group
+
+# "SCAN posts_post" reads the whole table; "SCAN ... USING INDEX" walks an
+# index in order and "SEARCH" seeks into one.
+FULL_SCAN = re.compile(r'^SCAN (TABLE )?(?P<table>\w+)(?: AS \w+)?$')
+TEMP_SORT = 'USE TEMP B-TREE FOR ORDER BY'
+# Without a WHERE clause a scan already in ORDER BY order stops at LIMIT.
+BOUNDED = re.compile(r'^(?!.* WHERE ).* LIMIT \d+$', re.S)
+
+
+class Command(BaseCommand):
+    help = ('Request every page and API list as a sample user, run EXPLAIN '
+            'QUERY PLAN on the queries issued and flag full table scans.')
+
+    def add_arguments(self, parser):
+        parser.add_argument('--user',
+                            help='Username to request pages as, defaults '
+                                 'to the author of the newest post.')
+        parser.add_argument('--ignore', action='append',
+                            default=['django_session', 'django_site',
+                                     'django_content_type', 'auth_user'],
+                            help='Table whose full scans are expected.')
+
+    def sample_urls(self, user):
+        post = Post.objects.filter(author=user).first()
+        group = Group.objects.first()
+        urls = ['/', '/follow/', f'/{user.username}/', '/search/?q=test',
+                '/api/v1/posts', '/api/v1/groups', '/api/v1/follow']
+        if post is not None:
+            urls += [f'/{user.username}/{post.pk}/',
+                     f'/api/v1/posts/{post.pk}/comments']
+        if group is not None:
+            urls += [f'/group/{group.slug}/',
+                     f'/api/v1/posts?group={group.pk}']
+        return urls
+
+    def handle(self, *args, **options):
+        if connection.vendor != 'sqlite':
+            raise CommandError('EXPLAIN QUERY PLAN is specific to SQLite.')
+        if options['user']:
+            user = User.objects.filter(username=options['user']).first()
+        else:
+            post = Post.objects.select_related('author').first()
+            user = post and post.author
+        if user is None:
+            raise CommandError('No user to request the pages as.')
+        ignored = set(options['ignore'])
+        flagged = 0
+        for url in self.sample_urls(user):
+            for sql, problems in self.explain(url, user, ignored):
+                flagged += 1
+                self.stdout.write(self.style.WARNING(f'{url}: {sql}'))
+                for problem in problems:
+                    self.stdout.write(f'    {problem}')
+        if flagged:
+            self.stdout.write(self.style.ERROR(
+                f'{flagged} queries scan a table or sort without an index.'))
+        else:
+            self.stdout.write(self.style.SUCCESS('No full scans found.'))
+
+    def explain(self, url, user, ignored):
+        token = AccessToken.for_user(user)
+        client = Client(HTTP_AUTHORIZATION=f'Bearer {token}')
+        # Signed in pages skip the anonymous page cache; the session of the
+        # login is rolled back with anything else the request wrote.
+        with transaction.atomic(), override_settings(ALLOWED_HOSTS=['*']):
+            client.force_login(user)
+            with CaptureQueriesContext(connection) as queries:
+                client.get(url)
+            transaction.set_rollback(True)
+        seen = set()
+        for query in queries.captured_queries:
+            sql = query['sql']
+            # Ranked search sorts its matches by design.
+            if not sql.startswith('SELECT') or sql in seen \
+                    or search.TABLE in sql:
+                continue
+            seen.add(sql)
+            with connection.cursor() as cursor:
+                cursor.execute(f'EXPLAIN QUERY PLAN {sql}')
+                plan = [row[-1] for row in cursor.fetchall()]
+            if TEMP_SORT in plan:
+                yield sql, [TEMP_SORT]
+                continue
+            problems = []
+            for step in plan:
+                match = FULL_SCAN.match(step)
+                if match and match.group('table') not in ignored \
+                        and not BOUNDED.match(sql):
+                    problems.append(step)
+            if problems:
+                yield sql, problems
@@ -0,0 +1,21 @@
+from django.core.management.base import BaseCommand
+
+from posts import fragments
+
+
+class Command(BaseCommand):
+    help = 'Show hit and miss counters of the rendered post card cache.'
+
+    def add_arguments(self, parser):
+        parser.add_argument('--reset', action='store_true',
+                            help='Zero the counters after printing them.')
+
+    def handle(self, *args, **options):
+        stats = fragments.stats()
+        total = stats['hits'] + stats['misses']
+        ratio = stats['hits'] / total if total else 0
+        self.stdout.write(f"hits: {stats['hits']}\n"
+                          f"misses: {stats['misses']}\n"
+                          f'hit ratio: {ratio:.2%}')
+        if options['reset']:
+            fragments.reset_stats()
@@ -0,0 +1,33 @@
+import os
+
+from django.core.management.base import BaseCommand
+from django.db import connections
+
+from posts import thumbnails
+from posts.models import Post
+
+
+class Command(BaseCommand):
+    help = 'Generate thumbnails for every existing post image in parallel.'
+
+    def add_arguments(self, parser):
+        parser.add_argument('--processes', type=int,
+                            default=os.cpu_count() or 1)
+
+    def handle(self, *args, **options):
+        images = dict(Post.objects
+                      .exclude(image='')
+                      .exclude(image__isnull=True)
+                      .values_list('pk', 'image'))
+        failed = 0
+        with thumbnails.make_pool(options['processes']) as pool:
+            connections.close_all()
+            futures = {pk: pool.submit(thumbnails.generate, name)
+                       for pk, name in images.items()}
+            for pk, future in futures.items():
+                if future.exception():
+                    failed += 1
+                    self.stderr.write(f'Post {pk}: {future.exception()}')
+        thumbnails.invalidate(list(images))
+        self.stdout.write(self.style.SUCCESS(
+            f'Generated {len(images) - failed} thumbnails, {failed} failed.'))
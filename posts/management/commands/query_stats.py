@@ -0,0 +1,46 @@
+from django.conf import settings
+from django.core.management.base import BaseCommand
+
+from yatube import instrumentation
+
+
+class Command(BaseCommand):
+    help = ('Print per-view query counts, SQL, render and total time '
+            'collected by QueryBudgetMiddleware in every worker.')
+
+    def add_arguments(self, parser):
+        parser.add_argument('--reset', action='store_true',
+                            help='Clear the collected histograms.')
+
+    def handle(self, *args, **options):
+        if options['reset']:
+            instrumentation.clear_collected()
+            self.stdout.write(self.style.SUCCESS('Query stats cleared.'))
+            return
+        # Include what this process saw, e.g. under runserver --nothreading.
+        instrumentation.recorder.flush()
+        views = instrumentation.collected()
+        if not views:
+            self.stdout.write('No requests recorded yet.')
+            return
+        budgets = getattr(settings, 'QUERY_BUDGETS', {})
+        self.stdout.write(f'{"view":<28}{"requests":>9}{"budget":>8}'
+                          f'{"over":>6}{"queries p50/p95/max":>21}'
+                          f'{"sql ms p95":>12}{"render ms p95":>15}'
+                          f'{"total ms p50/p95":>18}')
+        for name in sorted(views):
+            stats = views[name]
+            queries = stats.histograms['queries']
+            total = stats.histograms['total_ms']
+            counts = (f'{queries.percentile(.5):g}/'
+                      f'{queries.percentile(.95):g}/{queries.peak:g}')
+            latency = f'{total.percentile(.5):g}/{total.percentile(.95):g}'
+            line = (f'{name:<28}{queries.count:>9}'
+                    f'{budgets.get(name, "-"):>8}{stats.over_budget:>6}'
+                    f'{counts:>21}'
+                    f'{stats.histograms["sql_ms"].percentile(.95):>12g}'
+                    f'{stats.histograms["render_ms"].percentile(.95):>15g}'
+                    f'{latency:>18}')
+            if stats.over_budget:
+                line = self.style.WARNING(line)
+            self.stdout.write(line)
@@ -0,0 +1,14 @@
+from django.core.management.base import BaseCommand
+from django.db import transaction
+
+from posts import search
+from posts.models import Post, Comment
+
+
+class Command(BaseCommand):
+    help = 'Rebuild the full-text index of posts and comments.'
+
+    def handle(self, *args, **options):
+        with transaction.atomic():
+            search.rebuild(Post, Comment)
+        self.stdout.write(self.style.SUCCESS('Search index rebuilt.'))
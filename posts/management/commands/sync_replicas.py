@@ -0,0 +1,22 @@
+from django.conf import settings
+from django.core.management.base import BaseCommand, CommandError
+from django.db import DEFAULT_DB_ALIAS, connections
+
+
+class Command(BaseCommand):
+    help = ('Copy the primary SQLite database over every replica listed in '
+            'DATABASE_REPLICAS, a local stand-in for replication.')
+
+    def handle(self, *args, **options):
+        replicas = getattr(settings, 'DATABASE_REPLICAS', [])
+        if not replicas:
+            raise CommandError('DATABASE_REPLICAS is empty.')
+        primary = connections[DEFAULT_DB_ALIAS]
+        primary.ensure_connection()
+        for alias in replicas:
+            replica = connections[alias]
+            replica.ensure_connection()
+            # The backup API copies a consistent snapshot while the
+            # primary keeps serving writes.
+            primary.connection.backup(replica.connection)
+            self.stdout.write(f'Copied the primary to {alias}.')
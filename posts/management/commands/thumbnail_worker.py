@@ -0,0 +1,37 @@
+import os
+import time
+
+from django.core.management.base import BaseCommand
+
+from posts import thumbnails
+
+
+class Command(BaseCommand):
+    help = 'Generate queued post thumbnails in a pool of processes.'
+
+    def add_arguments(self, parser):
+        parser.add_argument('--processes', type=int,
+                            default=os.cpu_count() or 1)
+        parser.add_argument('--batch', type=int, default=32)
+        parser.add_argument('--poll', type=float, default=2.0,
+                            help='Seconds to sleep when the queue is empty.')
+        parser.add_argument('--once', action='store_true',
+                            help='Exit when the queue is empty.')
+        parser.add_argument('--backfill', action='store_true',
+                            help='First queue the images without '
+                                 'responsive variants.')
+
+    def handle(self, *args, **options):
+        if options['backfill']:
+            queued = thumbnails.enqueue_missing()
+            self.stdout.write(f'Queued {queued} images without variants.')
+        with thumbnails.make_pool(options['processes']) as pool:
+            while True:
+                jobs = thumbnails.claim(options['batch'])
+                if jobs:
+                    thumbnails.process_jobs(jobs, pool)
+                    self.stdout.write(f'Processed {len(jobs)} thumbnails.')
+                elif options['once']:
+                    break
+                else:
+                    time.sleep(options['poll'])
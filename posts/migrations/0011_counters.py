@@ -0,0 +1,55 @@
+# Generated by Django 2.2.9 on 2026-10-18 17:33
+
+from django.conf import settings
+from django.db import migrations, models
+import django.db.models.deletion
+
+
+def fill_counters(apps, schema_editor):
+    Post = apps.get_model('posts', 'Post')
+    Comment = apps.get_model('posts', 'Comment')
+    Follow = apps.get_model('posts', 'Follow')
+    UserStats = apps.get_model('posts', 'UserStats')
+    User = apps.get_model(*settings.AUTH_USER_MODEL.split('.'))
+
+    for post_id, total in Comment.objects.values_list('post') \
+            .annotate(total=models.Count('id')).order_by():
+        Post.objects.filter(pk=post_id).update(comment_count=total)
+
+    stats = {user_id: UserStats(user_id=user_id)
+             for user_id in User.objects.values_list('pk', flat=True)}
+    for queryset, field, name in (
+            (Post.objects, 'author', 'posts_count'),
+            (Follow.objects, 'author', 'followers_count'),
+            (Follow.objects, 'user', 'following_count')):
+        for user_id, total in queryset.values_list(field) \
+                .annotate(total=models.Count('id')).order_by():
+            setattr(stats[user_id], name, total)
+    UserStats.objects.bulk_create(stats.values())
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        migrations.swappable_dependency(settings.AUTH_USER_MODEL),
+        ('posts', '0010_feedentry'),
+    ]
+
+    operations = [
+        migrations.AddField(
+            model_name='post',
+            name='comment_count',
+            field=models.PositiveIntegerField(default=0, editable=False),
+        ),
+        migrations.CreateModel(
+            name='UserStats',
+            fields=[
+                ('id', models.AutoField(auto_created=True, primary_key=True, serialize=False, verbose_name='ID')),
+                ('posts_count', models.PositiveIntegerField(default=0)),
+                ('followers_count', models.PositiveIntegerField(default=0)),
+                ('following_count', models.PositiveIntegerField(default=0)),
+                ('user', models.OneToOneField(on_delete=django.db.models.deletion.CASCADE, related_name='stats', to=settings.AUTH_USER_MODEL)),
+            ],
+        ),
+        migrations.RunPython(fill_counters, migrations.RunPython.noop),
+    ]
@@ -0,0 +1,59 @@
+# Generated by Django 2.2.9 on 2026-10-18 17:48
+
+from django.conf import settings
+from django.db import migrations, models
+from django.db.models.functions import Greatest
+
+
+def drop_duplicate_follows(apps, schema_editor):
+    Follow = apps.get_model('posts', 'Follow')
+    UserStats = apps.get_model('posts', 'UserStats')
+    duplicates = list(Follow.objects.values('user', 'author')
+                      .annotate(first=models.Min('id'),
+                                total=models.Count('id'))
+                      .filter(total__gt=1).order_by())
+    for row in duplicates:
+        extra = row['total'] - 1
+        Follow.objects.filter(user=row['user'], author=row['author'])\
+            .exclude(pk=row['first']).delete()
+        UserStats.objects.filter(user=row['user']).update(
+            following_count=Greatest(models.F('following_count') - extra, 0))
+        UserStats.objects.filter(user=row['author']).update(
+            followers_count=Greatest(models.F('followers_count') - extra, 0))
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        migrations.swappable_dependency(settings.AUTH_USER_MODEL),
+        ('posts', '0013_thumbnailjob'),
+    ]
+
+    operations = [
+        migrations.RunPython(drop_duplicate_follows,
+                             migrations.RunPython.noop),
+        migrations.AlterUniqueTogether(
+            name='follow',
+            unique_together={('user', 'author')},
+        ),
+        migrations.AddIndex(
+            model_name='comment',
+            index=models.Index(fields=['post', '-created', '-id'], name='comment_post_created_idx'),
+        ),
+        migrations.AddIndex(
+            model_name='follow',
+            index=models.Index(fields=['author', 'user'], name='follow_author_user_idx'),
+        ),
+        migrations.AddIndex(
+            model_name='post',
+            index=models.Index(fields=['-pub_date', '-id'], name='post_date_idx'),
+        ),
+        migrations.AddIndex(
+            model_name='post',
+            index=models.Index(fields=['group', '-pub_date', '-id'], name='post_group_date_idx'),
+        ),
+        migrations.AddIndex(
+            model_name='post',
+            index=models.Index(fields=['author', '-pub_date', '-id'], name='post_author_date_idx'),
+        ),
+    ]
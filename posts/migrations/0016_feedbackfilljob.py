@@ -0,0 +1,27 @@
+# Generated by Django 2.2.9 on 2026-10-18 18:56
+
+from django.conf import settings
+from django.db import migrations, models
+import django.db.models.deletion
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        migrations.swappable_dependency(settings.AUTH_USER_MODEL),
+        ('posts', '0015_imagevariant'),
+    ]
+
+    operations = [
+        migrations.CreateModel(
+            name='FeedBackfillJob',
+            fields=[
+                ('id', models.AutoField(auto_created=True, primary_key=True, serialize=False, verbose_name='ID')),
+                ('queued', models.DateTimeField()),
+                ('author', models.OneToOneField(on_delete=django.db.models.deletion.CASCADE, related_name='feed_backfill_job', to=settings.AUTH_USER_MODEL)),
+            ],
+            options={
+                'ordering': ('queued',),
+            },
+        ),
+    ]
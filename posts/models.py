@@ -3,6 +3,8 @@ from django.contrib.auth import get_user_model
 
 User = get_user_model()
 
+COUNTERS = ('comment_count',)
+
 
 class Group(models.Model):
     title = models.CharField(max_length=200)
@@ -22,13 +24,36 @@ class Post(models.Model):
                               related_name='posts',
                               on_delete=models.SET_NULL, )
     image = models.ImageField(upload_to='posts/', blank=True, null=True)
+    comment_count = models.PositiveIntegerField(default=0, editable=False)
 
     class Meta:
         ordering = ('-pub_date',)
+        # Every feed is a seek over (-pub_date, -id), see posts.pagination.
+        indexes = [
+            models.Index(fields=['-pub_date', '-id'],
+                         name='post_date_idx'),
+            models.Index(fields=['group', '-pub_date', '-id'],
+                         name='post_group_date_idx'),
+            models.Index(fields=['author', '-pub_date', '-id'],
+                         name='post_author_date_idx'),
+        ]
 
     def __str__(self):
         return self.text
 
+    def save(self, *args, **kwargs):
+        # Counters are maintained with F() updates by posts.counters, an
+        # edit must not write a stale in-memory copy back over them.
+        # Deferred columns were not loaded and are left alone as well.
+        if not self._state.adding and kwargs.get('update_fields') is None:
+            deferred = self.get_deferred_fields()
+            kwargs['update_fields'] = [
+                field.name for field in self._meta.concrete_fields
+                if not field.primary_key and field.name not in COUNTERS
+                and field.attname not in deferred
+            ]
+        super().save(*args, **kwargs)
+
 
 class Comment(models.Model):
     post = models.ForeignKey(Post, related_name='comments',
@@ -40,6 +65,10 @@ class Comment(models.Model):
 
     class Meta:
         ordering = ('-created',)
+        indexes = [
+            models.Index(fields=['post', '-created', '-id'],
+                         name='comment_post_created_idx'),
+        ]
 
 
 class Follow(models.Model):
@@ -47,3 +76,83 @@ class Follow(models.Model):
                              on_delete=models.CASCADE)
     author = models.ForeignKey(User, related_name='following',
                                on_delete=models.CASCADE)
+
+    class Meta:
+        unique_together = ('user', 'author')
+        indexes = [
+            models.Index(fields=['author', 'user'],
+                         name='follow_author_user_idx'),
+        ]
+
+
+class FeedEntry(models.Model):
+    """A post materialized into a follower's timeline on write."""
+    user = models.ForeignKey(User, related_name='feed_entries',
+                             on_delete=models.CASCADE)
+    post = models.ForeignKey(Post, related_name='feed_entries',
+                             on_delete=models.CASCADE)
+    author = models.ForeignKey(User, related_name='+',
+                               on_delete=models.CASCADE)
+    pub_date = models.DateTimeField()
+
+    class Meta:
+        ordering = ('-pub_date',)
+        unique_together = ('user', 'post')
+        indexes = [
+            models.Index(fields=['user', '-pub_date', '-post'],
+                         name='feedentry_user_date_idx'),
+            models.Index(fields=['user', 'author'],
+                         name='feedentry_user_author_idx'),
+        ]
+
+
+class FeedBackfillJob(models.Model):
+    """An author who fell below the celebrity threshold, whose past posts
+    are still to be copied into the timelines of their followers."""
+    author = models.OneToOneField(User, related_name='feed_backfill_job',
+                                  on_delete=models.CASCADE)
+    queued = models.DateTimeField()
+
+    class Meta:
+        ordering = ('queued',)
+
+
+class UserStats(models.Model):
+    """Denormalized per-user counters kept in sync by posts.counters."""
+    user = models.OneToOneField(User, related_name='stats',
+                                on_delete=models.CASCADE)
+    posts_count = models.PositiveIntegerField(default=0)
+    followers_count = models.PositiveIntegerField(default=0)
+    following_count = models.PositiveIntegerField(default=0)
+
+
+class ThumbnailJob(models.Model):
+    """A post image waiting for its thumbnail to be generated."""
+    post = models.OneToOneField(Post, related_name='thumbnail_job',
+                                on_delete=models.CASCADE)
+    created = models.DateTimeField(auto_now_add=True)
+    locked_at = models.DateTimeField(blank=True, null=True)
+    attempts = models.PositiveSmallIntegerField(default=0)
+    last_error = models.TextField(blank=True)
+
+    class Meta:
+        ordering = ('created',)
+
+
+class ImageVariant(models.Model):
+    """A resized copy of a post image in one format and width.
+
+    ``source`` is the image name it was made from, so variants of a
+    replaced image are ignored until the new ones are ready.
+    """
+    post = models.ForeignKey(Post, related_name='image_variants',
+                             on_delete=models.CASCADE)
+    source = models.CharField(max_length=255)
+    format = models.CharField(max_length=10)
+    width = models.PositiveSmallIntegerField()
+    height = models.PositiveSmallIntegerField()
+    name = models.CharField(max_length=255)
+
+    class Meta:
+        ordering = ('post', 'format', 'width')
+        unique_together = ('post', 'format', 'width')
@@ -0,0 +1,171 @@
+"""Generation based page cache for anonymous visitors.
+
+Each cached page belongs to a scope (``index`` or ``group:<slug>``) and is
+stored with the scope generation it was rendered under. Writing a post
+replaces the generation of its scopes, so the next request sees the change
+immediately. While one process re-renders an outdated page, the others keep
+serving the stale copy instead of all rendering it at once.
+
+A page is stored with the headers of its response and keyed by its path
+and the ``PAGE_PARAMS`` of its query string, the only ones the feed views
+read, so other parameters do not add entries.
+
+A generation starts with the time it was created, which posts.conditional
+serves as ``Last-Modified``. The ``post:<id>``, ``author:<id>``, ``groups``
+and ``follows`` scopes are only used for those validators.
+"""
+import hashlib
+import time
+import uuid
+from functools import wraps
+
+from django.conf import settings
+from django.core.cache import cache
+from django.db import connection, transaction
+from django.http import HttpResponse
+from django.utils.http import urlencode
+
+from yatube import routers
+
+from .models import Group
+
+INDEX_SCOPE = 'index'
+GROUPS_SCOPE = 'groups'
+FOLLOWS_SCOPE = 'follows'
+PAGE_PARAMS = ('before', 'after', 'page', 'fragment')
+
+
+def page_timeout():
+    return getattr(settings, 'PAGE_CACHE_TIMEOUT', 60 * 60)
+
+
+def lock_timeout():
+    return getattr(settings, 'PAGE_CACHE_LOCK_TIMEOUT', 30)
+
+
+def group_scope(slug):
+    return f'group:{slug}'
+
+
+def existing_group_scope(slug):
+    """The scope of group ``slug``, None when there is no such group."""
+    if Group.objects.filter(slug=slug).exists():
+        return group_scope(slug)
+    return None
+
+
+def post_scope(pk):
+    return f'post:{pk}'
+
+
+def author_scope(pk):
+    return f'author:{pk}'
+
+
+def post_scopes(*group_ids):
+    """Scopes showing posts of the given groups: the index and the groups."""
+    slugs = Group.objects\
+        .filter(pk__in=[pk for pk in group_ids if pk])\
+        .values_list('slug', flat=True)
+    return [INDEX_SCOPE] + [group_scope(slug) for slug in slugs]
+
+
+def generation_key(scope):
+    return f'page:{scope}:generation'
+
+
+def _new_generation():
+    return f'{time.time():.6f}:{uuid.uuid4().hex}'
+
+
+def created_at(generation):
+    """When ``generation`` was created, None for stamps without a time."""
+    try:
+        return float(generation.partition(':')[0])
+    except ValueError:
+        return None
+
+
+def _replace_generations(scopes):
+    cache.set_many({generation_key(scope): _new_generation()
+                    for scope in scopes}, None)
+
+
+def bump(*scopes):
+    _replace_generations(scopes)
+    if connection.in_atomic_block:
+        # A page rendered from the old rows before the write commits was
+        # stored under the new generation and must not outlive the commit.
+        transaction.on_commit(lambda: _replace_generations(scopes))
+
+
+def generation(scope):
+    key = generation_key(scope)
+    value = _new_generation()
+    if cache.add(key, value, None):
+        return value
+    return cache.get(key) or value
+
+
+def generations(scopes):
+    """The generation of each of ``scopes``, read with one query."""
+    found = cache.get_many([generation_key(scope) for scope in scopes])
+    return [found.get(generation_key(scope)) or generation(scope)
+            for scope in scopes]
+
+
+def _page_key(scope, request):
+    query = urlencode([(name, request.GET[name]) for name in PAGE_PARAMS
+                       if name in request.GET])
+    path = hashlib.md5(f'{request.path}\n{query}'.encode()).hexdigest()
+    return f'page:{scope}:{path}'
+
+
+def _render(view, request, args, kwargs, key, current):
+    # A lagging replica would store an old page under the new generation.
+    with routers.replica(False):
+        response = view(request, *args, **kwargs)
+    if response.status_code == 200 and not response.streaming:
+        cache.set(key, (current, response.content, list(response.items())),
+                  page_timeout())
+    return response
+
+
+def _replay(entry):
+    _, content, headers = entry
+    response = HttpResponse(content)
+    for name, value in headers:
+        response[name] = value
+    return response
+
+
+def anonymous_page_cache(scope):
+    """Cache GET responses for anonymous users.
+
+    ``scope`` is a scope name or a callable building it from the view
+    keyword arguments, which returns None for a missing object.
+    """
+    def decorator(view):
+        @wraps(view)
+        def wrapped(request, *args, **kwargs):
+            if request.method != 'GET' or request.user.is_authenticated:
+                return view(request, *args, **kwargs)
+            name = scope(**kwargs) if callable(scope) else scope
+            if name is None:
+                return view(request, *args, **kwargs)
+            current = generation(name)
+            key = _page_key(name, request)
+            entry = cache.get(key)
+            if entry is not None and entry[0] == current:
+                return _replay(entry)
+            if entry is None:
+                return _render(view, request, args, kwargs, key, current)
+            lock = f'{key}:lock'
+            if not cache.add(lock, 1, lock_timeout()):
+                return _replay(entry)
+            try:
+                return _render(view, request, args, kwargs, key, current)
+            finally:
+                cache.delete(lock)
+        return wrapped
+    return decorator
@@ -0,0 +1,179 @@
+import base64
+import binascii
+
+from django.core.paginator import Paginator, Page
+from django.db.models import Q
+
+PAGE_SIZE = 10
+
+
+def encode_cursor(values):
+    raw = '|'.join(str(value) for value in values)
+    return base64.urlsafe_b64encode(raw.encode()).decode().rstrip('=')
+
+
+def decode_cursor(cursor, fields):
+    """Return the list of python values stored in cursor or None."""
+    try:
+        padded = cursor + '=' * (-len(cursor) % 4)
+        raw = base64.urlsafe_b64decode(padded.encode()).decode()
+    except (binascii.Error, UnicodeDecodeError, ValueError):
+        return None
+    parts = raw.split('|')
+    if len(parts) != len(fields):
+        return None
+    try:
+        return [field.to_python(part) for field, part in zip(fields, parts)]
+    except Exception:
+        return None
+
+
+class KeysetPage:
+    """One window of a keyset paginated feed.
+
+    ``older_cursor`` / ``newer_cursor`` are opaque strings meant to be passed
+    back as ``?before=`` / ``?after=``.
+    """
+
+    def __init__(self, object_list, has_older, has_newer, older_cursor,
+                 newer_cursor):
+        self.object_list = object_list
+        self.has_older = has_older
+        self.has_newer = has_newer
+        self.older_cursor = older_cursor
+        self.newer_cursor = newer_cursor
+
+    def __iter__(self):
+        return iter(self.object_list)
+
+    def __len__(self):
+        return len(self.object_list)
+
+    def has_other_pages(self):
+        return self.has_older or self.has_newer
+
+
+class KeysetPaginator:
+    """Seek pagination over a queryset without COUNT(*) and OFFSET.
+
+    Rows are ordered by the model's ``Meta.ordering`` with the primary key
+    appended as a tie-break, so every page is a single index range scan
+    whatever its depth. An explicit ``ordering`` must already be unique and
+    may name annotations of the queryset as well as model fields.
+    """
+
+    def __init__(self, object_list, per_page=PAGE_SIZE, ordering=None):
+        self.object_list = object_list
+        self.per_page = per_page
+        opts = object_list.model._meta
+        if ordering is None:
+            ordering = tuple(opts.ordering)
+            ordering += ('-pk' if ordering[0].startswith('-') else 'pk',)
+        self.ordering = ordering
+        self.descending = ordering[0].startswith('-')
+        self.names = [name.lstrip('-') for name in ordering]
+        annotations = object_list.query.annotations
+        self.fields = [
+            opts.pk if name == 'pk'
+            else annotations[name].output_field if name in annotations
+            else opts.get_field(name)
+            for name in self.names
+        ]
+
+    def cursor_for(self, obj):
+        return encode_cursor(getattr(obj, getattr(field, 'attname', name))
+                             for field, name in zip(self.fields, self.names))
+
+    def _seek(self, values, forward):
+        # Lexicographic "row comparison" (a, b) < (x, y) spelled as ORs,
+        # which SQLite can still satisfy from the ordering index.
+        older = forward == self.descending
+        lookup = 'lt' if older else 'gt'
+        condition = Q()
+        for index, name in enumerate(self.names):
+            term = Q(**{f'{name}__{lookup}': values[index]})
+            for prev_name, prev_value in zip(self.names[:index],
+                                             values[:index]):
+                term &= Q(**{prev_name: prev_value})
+            condition |= term
+        return condition
+
+    def _reversed_ordering(self):
+        return [name[1:] if name.startswith('-') else f'-{name}'
+                for name in self.ordering]
+
+    def page(self, before=None, after=None):
+        values = None
+        backwards = False
+        if after:
+            values = decode_cursor(after, self.fields)
+            backwards = values is not None
+        if values is None and before:
+            values = decode_cursor(before, self.fields)
+
+        queryset = self.object_list
+        if values is not None:
+            queryset = queryset.filter(self._seek(values, not backwards))
+        if backwards:
+            queryset = queryset.order_by(*self._reversed_ordering())
+        else:
+            queryset = queryset.order_by(*self.ordering)
+
+        rows = list(queryset[:self.per_page + 1])
+        has_more = len(rows) > self.per_page
+        rows = rows[:self.per_page]
+        if backwards:
+            rows.reverse()
+            has_older, has_newer = True, has_more
+        else:
+            has_older, has_newer = has_more, values is not None
+        return self._make_page(rows, has_older, has_newer)
+
+    def offset_page(self, number):
+        """Serve a legacy ``?page=N`` link without counting the table."""
+        try:
+            number = max(int(number), 1)
+        except (TypeError, ValueError):
+            number = 1
+        offset = (number - 1) * self.per_page
+        rows = list(self.object_list
+                    .order_by(*self.ordering)[offset:
+                                              offset + self.per_page + 1])
+        has_older = len(rows) > self.per_page
+        return self._make_page(rows[:self.per_page], has_older, number > 1)
+
+    def _make_page(self, rows, has_older, has_newer):
+        return KeysetPage(
+            rows,
+            has_older=has_older,
+            has_newer=has_newer,
+            older_cursor=self.cursor_for(rows[-1]) if rows else None,
+            newer_cursor=self.cursor_for(rows[0]) if rows else None,
+        )
+
+
+def page_context(keyset, object_list, per_page=PAGE_SIZE):
+    """Build the pagination part of a feed template context.
+
+    ``page`` and ``paginator`` keep Django's types so the templates and
+    callers that expect them keep working, but the paginator is never asked
+    for its count: navigation is driven by the ``keyset`` page.
+    """
+    paginator = Paginator(object_list, per_page)
+    page = Page(keyset.object_list, 1, paginator)
+    return {'page': page, 'paginator': paginator, 'keyset': keyset}
+
+
+def is_legacy_request(request):
+    return 'page' in request.GET and not ({'before', 'after'}
+                                          & set(request.GET))
+
+
+def paginate(request, object_list, per_page=PAGE_SIZE):
+    keyset_paginator = KeysetPaginator(object_list, per_page)
+    if is_legacy_request(request):
+        keyset = keyset_paginator.offset_page(request.GET.get('page'))
+    else:
+        keyset = keyset_paginator.page(before=request.GET.get('before'),
+                                       after=request.GET.get('after'))
+    return page_context(keyset, object_list, per_page)
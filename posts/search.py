@@ -0,0 +1,194 @@
+"""Full-text search over posts and comments with SQLite FTS5.
+
+``posts_search`` holds one row per post and per comment. The indexed body
+is not the raw text but its normalized form: lower case, "ё" folded to "е"
+and every Cyrillic word cut down by a light Russian suffix stemmer, so
+"котики", "котиков" and "котикам" all match each other. Queries go through
+the same normalization and every term is matched as a prefix.
+
+Rows are kept in sync from the model signals rather than SQL triggers
+because the normalization is Python code.
+"""
+import re
+
+from django.db import connection, models
+from django.db.models.expressions import RawSQL
+
+from .pagination import KeysetPage, PAGE_SIZE, encode_cursor, decode_cursor
+
+TABLE = 'posts_search'
+POST, COMMENT = 'post', 'comment'
+CREATE_TABLE = (
+    f'CREATE VIRTUAL TABLE IF NOT EXISTS {TABLE} USING fts5('
+    'body, kind UNINDEXED, object_id UNINDEXED, post_id UNINDEXED, '
+    "tokenize = 'unicode61 remove_diacritics 2')"
+)
+CURSOR_FIELDS = (models.FloatField(), models.IntegerField())
+
+WORD = re.compile(r'\w+')
+CYRILLIC = re.compile(r'^[а-я]+$')
+ENDINGS = sorted((
+    'иями', 'ями', 'ами', 'ыми', 'ими', 'ого', 'его', 'ому', 'ему', 'ией',
+    'иях', 'иям', 'ешь', 'ете', 'ить', 'ать', 'ять', 'еть', 'ал', 'ил',
+    'ла', 'ли', 'ло', 'ся', 'сь', 'ая', 'яя', 'ое', 'ее', 'ие', 'ые', 'ой',
+    'ей', 'ий', 'ый', 'ом', 'ем', 'ам', 'ям', 'ах', 'ях', 'ию', 'ью', 'ия',
+    'ья', 'ов', 'ев', 'ут', 'ют', 'ит', 'ат', 'ят', 'ет', 'ть', 'а', 'я',
+    'о', 'е', 'ы', 'и', 'у', 'ю', 'ь', 'й',
+), key=len, reverse=True)
+MIN_STEM = 3
+REFLEXIVE = ('ся', 'сь')
+
+
+def _strip(word):
+    for ending in ENDINGS:
+        if word.endswith(ending) and len(word) - len(ending) >= MIN_STEM:
+            return word[:-len(ending)], ending
+    return word, None
+
+
+def stem(word):
+    if not CYRILLIC.match(word):
+        return word
+    word, ending = _strip(word)
+    if ending in REFLEXIVE:
+        # "учился" -> "учил" -> "уч..." like the plain "учил".
+        word, _ = _strip(word)
+    return word
+
+
+def normalize(text):
+    words = WORD.findall(text.lower().replace('ё', 'е'))
+    return ' '.join(stem(word) for word in words)
+
+
+def match_expression(query):
+    """Turn user input into a safe FTS5 query, or None if it is empty."""
+    terms = normalize(query).split()
+    if not terms:
+        return None
+    return ' '.join(f'"{term}"*' for term in terms)
+
+
+def _delete(kind, object_id):
+    with connection.cursor() as cursor:
+        cursor.execute(f'DELETE FROM {TABLE} WHERE kind = %s '
+                       'AND object_id = %s', [kind, object_id])
+
+
+def _insert(rows):
+    with connection.cursor() as cursor:
+        cursor.executemany(
+            f'INSERT INTO {TABLE} (body, kind, object_id, post_id) '
+            'VALUES (%s, %s, %s, %s)', rows)
+
+
+def index_post(post):
+    _delete(POST, post.pk)
+    _insert([(normalize(post.text), POST, post.pk, post.pk)])
+
+
+def index_comment(comment):
+    _delete(COMMENT, comment.pk)
+    _insert([(normalize(comment.text), COMMENT, comment.pk,
+              comment.post_id)])
+
+
+def index_new(posts=(), comments=()):
+    """Index rows just inserted, e.g. by posts.bulk, in one statement."""
+    _insert([(normalize(post.text), POST, post.pk, post.pk)
+             for post in posts] +
+            [(normalize(comment.text), COMMENT, comment.pk, comment.post_id)
+             for comment in comments])
+
+
+def unindex_post(post_id):
+    with connection.cursor() as cursor:
+        cursor.execute(f'DELETE FROM {TABLE} WHERE post_id = %s', [post_id])
+
+
+def unindex_comment(comment_id):
+    _delete(COMMENT, comment_id)
+
+
+def rebuild(post_model, comment_model, batch=1000):
+    with connection.cursor() as cursor:
+        cursor.execute(f'DELETE FROM {TABLE}')
+    for kind, queryset, post_field in (
+            (POST, post_model.objects.all(), 'id'),
+            (COMMENT, comment_model.objects.all(), 'post_id')):
+        rows = []
+        for object_id, post_id, text in queryset\
+                .values_list('id', post_field, 'text').iterator():
+            rows.append((normalize(text), kind, object_id, post_id))
+            if len(rows) >= batch:
+                _insert(rows)
+                rows = []
+        _insert(rows)
+
+
+def matching(kind, query):
+    """Subquery of object ids of ``kind`` matching ``query``."""
+    expression = match_expression(query) or '""'
+    return RawSQL(f'SELECT object_id FROM {TABLE} WHERE {TABLE} MATCH %s '
+                  'AND kind = %s', [expression, kind])
+
+
+def ranked(query, before=None, after=None, limit=PAGE_SIZE):
+    """Return ``[(post_id, score)]`` best first, seeking past a cursor.
+
+    A post is scored by its best matching row, so a hit in a comment brings
+    up the post it belongs to.
+    """
+    expression = match_expression(query)
+    if expression is None:
+        return []
+    cursor_values = None
+    backwards = False
+    if after:
+        cursor_values = decode_cursor(after, CURSOR_FIELDS)
+        backwards = cursor_values is not None
+    if cursor_values is None and before:
+        cursor_values = decode_cursor(before, CURSOR_FIELDS)
+    # The hidden "rank" column is bm25() and, unlike the function, may be
+    # aggregated.
+    sql = (f'SELECT post_id, MIN(rank) AS score FROM {TABLE} '
+           f'WHERE {TABLE} MATCH %s GROUP BY post_id')
+    params = [expression]
+    if cursor_values is not None:
+        op = '<' if backwards else '>'
+        sql += f' HAVING score {op} %s OR (score = %s AND post_id {op} %s)'
+        score, post_id = cursor_values
+        params += [score, score, post_id]
+    direction = 'DESC' if backwards else 'ASC'
+    sql += f' ORDER BY score {direction}, post_id {direction} LIMIT %s'
+    params.append(limit)
+    with connection.cursor() as cursor:
+        cursor.execute(sql, params)
+        rows = [(int(post_id), score)
+                for post_id, score in cursor.fetchall()]
+    if backwards:
+        rows.reverse()
+    return rows
+
+
+def search_page(queryset, query, before=None, after=None, per_page=PAGE_SIZE):
+    """Return a ``KeysetPage`` of posts from ``queryset`` ordered by rank."""
+    rows = ranked(query, before, after, per_page + 1)
+    backwards = bool(after) and decode_cursor(after,
+                                              CURSOR_FIELDS) is not None
+    has_more = len(rows) > per_page
+    if backwards:
+        rows = rows[-per_page:]
+        has_older, has_newer = True, has_more
+    else:
+        rows = rows[:per_page]
+        has_older, has_newer = has_more, bool(before)
+    posts = queryset.in_bulk([post_id for post_id, _ in rows])
+    rows = [(post_id, score) for post_id, score in rows if post_id in posts]
+    return KeysetPage(
+        [posts[post_id] for post_id, _ in rows],
+        has_older=has_older,
+        has_newer=has_newer,
+        older_cursor=encode_cursor(rows[-1][::-1]) if rows else None,
+        newer_cursor=encode_cursor(rows[0][::-1]) if rows else None,
+    )
@@ -0,0 +1,167 @@
+"""Concurrent throughput of the WSGI and the ASGI entry points.
+
+Both servers get the same requests, picked from the read-only scenarios
+of posts.benchmark, from ``clients`` concurrent clients that each take
+``delay`` seconds to send a request and again to read the response, as
+phones on a slow network do. Both run the Django application in
+``workers`` threads:
+
+* the WSGI side is a threaded sync server: a worker stays busy for the
+  whole exchange, including the time spent waiting on the client;
+* the ASGI side is yatube.asgi_handler, whose event loop waits on the
+  clients and uses the threads only to run the application.
+
+No sockets are involved, so the numbers show how the two models share the
+threads, not the cost of a particular server.
+"""
+import asyncio
+import random
+import time
+from concurrent.futures import ThreadPoolExecutor
+
+from django.conf import settings
+from django.core.handlers.wsgi import WSGIHandler
+from django.test import Client
+from django.test.utils import override_settings
+from rest_framework_simplejwt.tokens import AccessToken
+
+from yatube.asgi_handler import ASGIHandler, environ_for
+from . import benchmark
+
+
+def _scope(url, headers):
+    path, _, query = url.partition('?')
+    return {
+        'type': 'http', 'asgi': {'version': '3.0'}, 'http_version': '1.1',
+        'method': 'GET', 'scheme': 'http', 'path': path, 'root_path': '',
+        'query_string': query.encode(), 'headers': headers,
+        'server': ('testserver', 80), 'client': ('127.0.0.1', 0),
+    }
+
+
+def plan(user, clients, requests, seed=0, only=None):
+    """The ASGI scopes each client requests, in order."""
+    rng = random.Random(seed)
+    targets = benchmark.Targets(rng)
+    session = Client()
+    session.force_login(user)
+    cookie = session.cookies[settings.SESSION_COOKIE_NAME].value
+    anonymous = [(b'host', b'testserver')]
+    signed_in = anonymous + [
+        (b'cookie', f'{settings.SESSION_COOKIE_NAME}={cookie}'.encode()),
+        (b'authorization', f'Bearer {AccessToken.for_user(user)}'.encode()),
+    ]
+    scenarios = [(url, signed_in if authenticated else anonymous)
+                 for name, _, authenticated, url
+                 in benchmark.scenarios(targets)
+                 if not only or any(part in name for part in only)]
+    return [[_scope(url(), headers)
+             for url, headers in rng.choices(scenarios, k=requests)]
+            for _ in range(clients)]
+
+
+def summarize(latencies, errors, seconds):
+    latencies.sort()
+    return {
+        'requests': len(latencies),
+        'errors': errors,
+        'seconds': round(seconds, 3),
+        'throughput': round(len(latencies) / seconds, 1) if seconds else 0,
+        'latency_ms': {
+            f'p{percent}': round(
+                benchmark.percentile(latencies, percent) * 1000, 1)
+            for percent in benchmark.PERCENTILES},
+    }
+
+
+def warm_up(scopes):
+    """Request every distinct URL once so both sides start with full
+    caches."""
+    application = WSGIHandler()
+    seen = set()
+    for scope in (scope for requests in scopes for scope in requests):
+        key = (scope['path'], scope['query_string'], len(scope['headers']))
+        if key not in seen:
+            seen.add(key)
+            application(environ_for(scope, b''), lambda *args: None).close()
+
+
+def run_wsgi(scopes, workers, delay):
+    application = WSGIHandler()
+    statuses = []
+
+    def exchange(scope):
+        time.sleep(delay)
+        response = application(environ_for(scope, b''),
+                               lambda status, headers: statuses.append(
+                                   int(status.split(' ', 1)[0])))
+        try:
+            b''.join(response)
+        finally:
+            response.close()
+        time.sleep(delay)
+
+    def client(pool, requests):
+        latencies = []
+        for scope in requests:
+            started = time.perf_counter()
+            pool.submit(exchange, scope).result()
+            latencies.append(time.perf_counter() - started)
+        return latencies
+
+    started = time.perf_counter()
+    with ThreadPoolExecutor(workers) as pool, \
+            ThreadPoolExecutor(len(scopes)) as clients:
+        latencies = [latency for result in clients.map(
+            lambda requests: client(pool, requests), scopes)
+            for latency in result]
+    return summarize(latencies, sum(status >= 500 for status in statuses),
+                     time.perf_counter() - started)
+
+
+def run_asgi(scopes, workers, delay):
+    with override_settings(ASGI_READ_THREADS=workers):
+        application = ASGIHandler()
+        statuses = []
+
+        async def receive():
+            await asyncio.sleep(delay)
+            return {'type': 'http.request', 'body': b''}
+
+        async def send(message):
+            if message['type'] == 'http.response.start':
+                statuses.append(message['status'])
+            elif not message.get('more_body'):
+                await asyncio.sleep(delay)
+
+        async def client(requests):
+            latencies = []
+            for scope in requests:
+                started = time.perf_counter()
+                await application(scope, receive, send)
+                latencies.append(time.perf_counter() - started)
+            return latencies
+
+        async def main():
+            return await asyncio.gather(*map(client, scopes))
+
+        started = time.perf_counter()
+        try:
+            results = asyncio.run(main())
+        finally:
+            for pool in application.pools.values():
+                pool.shutdown()
+    return summarize([latency for result in results for latency in result],
+                     sum(status >= 500 for status in statuses),
+                     time.perf_counter() - started)
+
+
+def run(user, clients=50, requests=10, workers=4, delay=0.05, seed=0,
+        only=None):
+    """Serve the same plan through both entry points."""
+    scopes = plan(user, clients, requests, seed, only)
+    warm_up(scopes)
+    return {
+        'wsgi': run_wsgi(scopes, workers, delay),
+        'asgi': run_asgi(scopes, workers, delay),
+    }
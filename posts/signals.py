@@ -0,0 +1,135 @@
+import threading
+
+from django.db.models.signals import (post_init, post_save, pre_delete,
+                                      post_delete)
+from django.dispatch import receiver
+
+from . import (counters, feed, follow_graph, fragments, page_cache, search,
+               thumbnails)
+from .models import Post, Comment, Follow, Group
+
+# Posts being deleted by this thread: the comments deleted with them skip
+# their own work, the post does it once.
+_deleting = threading.local()
+
+
+def _deleting_posts():
+    if not hasattr(_deleting, 'posts'):
+        _deleting.posts = set()
+    return _deleting.posts
+
+
+def _image_name(post):
+    image = post.__dict__.get('image')
+    return getattr(image, 'name', image)
+
+
+@receiver(post_init, sender=Post)
+def post_loaded(sender, instance, **kwargs):
+    # Read raw attributes: touching a deferred field would run a query.
+    instance._loaded_group_id = instance.__dict__.get('group_id')
+    instance._loaded_image = _image_name(instance)
+
+
+@receiver(post_save, sender=Post)
+def post_saved(sender, instance, created, **kwargs):
+    fragments.bump('post', instance.pk)
+    page_cache.bump(*page_cache.post_scopes(instance._loaded_group_id,
+                                            instance.group_id),
+                    page_cache.post_scope(instance.pk),
+                    page_cache.author_scope(instance.author_id))
+    instance._loaded_group_id = instance.group_id
+    image = _image_name(instance)
+    if image and image != instance._loaded_image:
+        thumbnails.enqueue(instance)
+    instance._loaded_image = image
+    search.index_post(instance)
+    if created:
+        counters.bump_user(instance.author_id, posts_count=1)
+        feed.fan_out(instance)
+
+
+@receiver(pre_delete, sender=Post)
+def post_deleting(sender, instance, **kwargs):
+    _deleting_posts().add(instance.pk)
+
+
+@receiver(post_delete, sender=Post)
+def post_deleted(sender, instance, **kwargs):
+    _deleting_posts().discard(instance.pk)
+    fragments.bump('post', instance.pk)
+    # Also removes the rows of its comments.
+    search.unindex_post(instance.pk)
+    page_cache.bump(*page_cache.post_scopes(instance.group_id),
+                    page_cache.post_scope(instance.pk),
+                    page_cache.author_scope(instance.author_id))
+    counters.bump_user(instance.author_id, posts_count=-1)
+
+
+@receiver(post_save, sender=Comment)
+def comment_saved(sender, instance, created, **kwargs):
+    fragments.bump('post', instance.post_id)
+    page_cache.bump(*page_cache.post_scopes(instance.post.group_id),
+                    page_cache.post_scope(instance.post_id),
+                    page_cache.author_scope(instance.post.author_id))
+    search.index_comment(instance)
+    if created:
+        counters.bump_post(instance.post_id, 1)
+
+
+@receiver(post_delete, sender=Comment)
+def comment_deleted(sender, instance, **kwargs):
+    if instance.post_id in _deleting_posts():
+        return
+    fragments.bump('post', instance.post_id)
+    search.unindex_comment(instance.pk)
+    post = Post.objects.filter(pk=instance.post_id)\
+        .only('group', 'author').first()
+    scopes = [page_cache.post_scope(instance.post_id)]
+    if post is not None:
+        scopes.append(page_cache.author_scope(post.author_id))
+    page_cache.bump(*page_cache.post_scopes(post.group_id if post else None),
+                    *scopes)
+    counters.bump_post(instance.post_id, -1)
+
+
+@receiver(post_init, sender=Group)
+def group_loaded(sender, instance, **kwargs):
+    instance._loaded_slug = instance.__dict__.get('slug')
+
+
+@receiver(post_save, sender=Group)
+@receiver(post_delete, sender=Group)
+def group_changed(sender, instance, **kwargs):
+    fragments.bump('group', instance.pk)
+    page_cache.bump(page_cache.INDEX_SCOPE, page_cache.GROUPS_SCOPE,
+                    page_cache.group_scope(instance._loaded_slug),
+                    page_cache.group_scope(instance.slug))
+    instance._loaded_slug = instance.slug
+
+
+def _follows_changed(follow):
+    page_cache.bump(page_cache.FOLLOWS_SCOPE,
+                    page_cache.author_scope(follow.user_id),
+                    page_cache.author_scope(follow.author_id))
+
+
+@receiver(post_save, sender=Follow)
+def follow_created(sender, instance, created, **kwargs):
+    # Also when the API edits a follow to point at another author.
+    follow_graph.invalidate(instance.user_id)
+    if created:
+        _follows_changed(instance)
+        counters.bump_user(instance.user_id, following_count=1)
+        counters.bump_user(instance.author_id, followers_count=1)
+        feed.add_author(instance.user_id, instance.author_id)
+
+
+@receiver(post_delete, sender=Follow)
+def follow_deleted(sender, instance, **kwargs):
+    follow_graph.invalidate(instance.user_id)
+    _follows_changed(instance)
+    counters.bump_user(instance.user_id, following_count=-1)
+    counters.bump_user(instance.author_id, followers_count=-1)
+    feed.remove_author(instance.user_id, instance.author_id)
+    feed.follower_removed(instance.author_id)
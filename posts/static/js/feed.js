@@ -0,0 +1,48 @@
+// Lite feed pages and comment threads: load the next batch when a
+// "Показать ещё" link gets close to the viewport, see posts/lite_feed.py
+// and posts/comment_thread.py. The link keeps working as a plain link when
+// a request fails or IntersectionObserver is missing.
+(function () {
+    'use strict';
+
+    if (!('IntersectionObserver' in window) || !window.fetch) {
+        return;
+    }
+
+    var observer = new IntersectionObserver(function (entries) {
+        entries.forEach(function (entry) {
+            if (entry.isIntersecting) {
+                observer.unobserve(entry.target);
+                load(entry.target);
+            }
+        });
+    }, {rootMargin: '800px 0px'});
+
+    function load(link) {
+        link.classList.add('disabled');
+        fetch(link.getAttribute('data-feed-more'), {
+            credentials: 'same-origin',
+            headers: {'X-Requested-With': 'XMLHttpRequest'}
+        }).then(function (response) {
+            if (!response.ok) {
+                throw new Error(response.status);
+            }
+            return response.text();
+        }).then(function (html) {
+            var parent = link.parentNode;
+            link.insertAdjacentHTML('beforebegin', html);
+            parent.removeChild(link);
+            watch(parent);
+        }).catch(function () {
+            link.classList.remove('disabled');
+        });
+    }
+
+    function watch(root) {
+        root.querySelectorAll('[data-feed-more]').forEach(function (link) {
+            observer.observe(link);
+        });
+    }
+
+    watch(document);
+})();
@@ -0,0 +1,16 @@
+from django import template
+
+from posts.image_variants import picture_for
+from posts.thumbnails import ready_thumbnail as lookup
+
+register = template.Library()
+
+
+@register.simple_tag
+def ready_thumbnail(image):
+    return lookup(image)
+
+
+@register.simple_tag
+def post_picture(post):
+    return picture_for(post)
@@ -1,8 +1,27 @@
-from django.contrib.auth.models import User
+import os
+import shutil
+import tempfile
+from io import BytesIO, StringIO
+from unittest import mock, skipUnless
+
+from django.contrib.auth.models import AnonymousUser, User
 from django.core.cache import cache
-from django.test import TestCase, Client
+from django.core.exceptions import ValidationError
+from django.core.files.uploadedfile import SimpleUploadedFile
+from django.core.management import call_command
+from django.db import connection
+from django.http import HttpResponse
+from django.test import TestCase, TransactionTestCase, Client, \
+    RequestFactory, override_settings
+from django.test.utils import CaptureQueriesContext
+from PIL import Image, MpoImagePlugin
 
-from .models import Post, Group, Follow, Comment
+from . import (benchmark, follow_graph, fragments, image_variants,
+               page_cache, server_benchmark, thumbnails)
+from .forms import PostForm
+from .models import (Post, Group, Follow, Comment, FeedEntry, UserStats,
+                     ThumbnailJob, FeedBackfillJob)
+from .views import image_variant
 
 
 class BaseTest(TestCase):
@@ -101,6 +120,7 @@ class BaseTest(TestCase):
 class CacheTest(TestCase):
 
     def setUp(self) -> None:
+        cache.clear()
         self.client = Client()
         self.user = User.objects.create(username='test_user',
                                         email='test@email.com')
@@ -117,10 +137,72 @@ class CacheTest(TestCase):
                             author=self.user)
         response = self.client.get('/')
         self.assertContains(response, self.text)
+        response = self.client.get('/')
+        self.assertIsNone(response.context)
+        self.assertContains(response, self.text)
         Post.objects.create(text='Text for cache',
                             author=self.user)
         response = self.client.get('/')
-        self.assertNotContains(response, 'Text for cache')
+        self.assertContains(response, 'Text for cache')
+
+    def test_group_cache_generation(self):
+        group = Group.objects.create(title='Group', slug='cached')
+        post = Post.objects.create(text=self.text, author=self.user,
+                                   group=group)
+        self.client.get('/group/cached/')
+        post.text = 'Edited text'
+        post.save()
+        self.assertContains(self.client.get('/group/cached/'), 'Edited text')
+        post.group = None
+        post.save()
+        self.assertNotContains(self.client.get('/group/cached/'),
+                               'Edited text')
+
+    def test_stale_copy_served_during_regeneration(self):
+        Post.objects.create(text=self.text, author=self.user)
+        self.client.get('/')
+        page_cache.bump(page_cache.INDEX_SCOPE)
+        key = page_cache._page_key(page_cache.INDEX_SCOPE,
+                                   RequestFactory().get('/'))
+        cache.add(f'{key}:lock', 1)
+        response = self.client.get('/')
+        self.assertIsNone(response.context)
+        cache.delete(f'{key}:lock')
+        self.assertIsNotNone(self.client.get('/').context)
+
+    def test_replay_keeps_headers(self):
+        calls = []
+
+        @page_cache.anonymous_page_cache('headers')
+        def view(request):
+            calls.append(request)
+            response = HttpResponse('page', content_type='text/plain')
+            response['Content-Language'] = 'ru'
+            return response
+
+        request = RequestFactory().get('/')
+        request.user = AnonymousUser()
+        view(request)
+        replayed = view(request)
+        self.assertEqual(len(calls), 1)
+        self.assertEqual(replayed['Content-Type'], 'text/plain')
+        self.assertEqual(replayed['Content-Language'], 'ru')
+        self.assertEqual(replayed.content, b'page')
+
+    def test_unknown_query_params_share_the_entry(self):
+        factory = RequestFactory()
+        self.assertEqual(
+            page_cache._page_key('index', factory.get('/', {'utm': 'x',
+                                                            'page': 2})),
+            page_cache._page_key('index', factory.get('/', {'page': 2})))
+        self.assertNotEqual(
+            page_cache._page_key('index', factory.get('/', {'page': 3})),
+            page_cache._page_key('index', factory.get('/', {'page': 2})))
+
+    def test_authenticated_not_cached(self):
+        self.client.force_login(self.user)
+        self.client.get('/')
+        self.assertIsNotNone(self.client.get('/').context)
 
 
 class FollowTest(TestCase):
@@ -187,5 +269,860 @@ class FollowTest(TestCase):
         self.assertFalse(comment)
 
 
+class FollowGraphTest(TestCase):
+
+    def setUp(self) -> None:
+        cache.clear()
+        self.client = Client()
+        self.reader = User.objects.create(username='reader')
+        self.authors = [User.objects.create(username=f'author{number}')
+                        for number in range(3)]
+        self.client.force_login(self.reader)
+
+    def test_profile_button_follows_viewer(self):
+        author = self.authors[0]
+        Follow.objects.create(user=self.authors[1], author=author)
+        response = self.client.get(f'/{author}/')
+        self.assertFalse(response.context['following'])
+        self.client.get(f'/{author}/follow/')
+        response = self.client.get(f'/{author}/')
+        self.assertTrue(response.context['following'])
+        self.client.get(f'/{author}/unfollow/')
+        response = self.client.get(f'/{author}/')
+        self.assertFalse(response.context['following'])
+
+    def test_cached_checks(self):
+        Follow.objects.create(user=self.reader, author=self.authors[0])
+        Follow.objects.create(user=self.reader, author=self.authors[2])
+        follow_graph.followed_ids(self.reader)
+        with CaptureQueriesContext(connection) as queries:
+            self.assertTrue(follow_graph.is_following(self.reader,
+                                                      self.authors[0].pk))
+            self.assertEqual(follow_graph.followed_ids(self.reader),
+                             {self.authors[0].pk, self.authors[2].pk})
+        self.assertEqual(len(queries), 0)
+        Follow.objects.filter(user=self.reader,
+                              author=self.authors[0]).delete()
+        self.assertFalse(follow_graph.is_following(self.reader,
+                                                   self.authors[0].pk))
+        self.assertFalse(follow_graph.followed_ids(AnonymousUser()))
+
+
+class KeysetPaginatorTest(TestCase):
+
+    def setUp(self) -> None:
+        cache.clear()
+        self.client = Client()
+        self.user = User.objects.create(username='test_user',
+                                        email='test@email.com')
+        self.posts = [Post.objects.create(text=f'Post #{i}',
+                                          author=self.user)
+                      for i in range(25)]
+
+    def test_first_page(self):
+        response = self.client.get('/')
+        keyset = response.context['keyset']
+        self.assertEqual(len(keyset), 10)
+        self.assertEqual(keyset.object_list[0], self.posts[-1])
+        self.assertTrue(keyset.has_older)
+        self.assertFalse(keyset.has_newer)
+
+    def test_walk_older_and_newer(self):
+        seen = []
+        keyset = self.client.get('/').context['keyset']
+        seen += keyset.object_list
+        while keyset.has_older:
+            keyset = self.client.get(
+                '/', {'before': keyset.older_cursor}).context['keyset']
+            seen += keyset.object_list
+        self.assertEqual(seen, self.posts[::-1])
+        keyset = self.client.get(
+            '/', {'after': keyset.newer_cursor}).context['keyset']
+        self.assertEqual(keyset.object_list, self.posts[14:4:-1])
+        self.assertTrue(keyset.has_newer)
+        self.assertTrue(keyset.has_older)
+
+    def test_legacy_page_param(self):
+        keyset = self.client.get('/', {'page': 3}).context['keyset']
+        self.assertEqual(keyset.object_list, self.posts[4::-1])
+        self.assertFalse(keyset.has_older)
+        self.assertTrue(keyset.has_newer)
+
+    def test_broken_cursor_falls_back_to_first_page(self):
+        keyset = self.client.get('/', {'before': '%%%'}).context['keyset']
+        self.assertEqual(keyset.object_list[0], self.posts[-1])
+
+    def test_no_count_or_offset(self):
+        keyset = self.client.get('/').context['keyset']
+        with CaptureQueriesContext(connection) as queries:
+            self.client.get('/', {'before': keyset.older_cursor})
+        feed_sql = queries[0]['sql']
+        self.assertNotIn('COUNT', feed_sql)
+        self.assertNotIn('OFFSET', feed_sql)
+
+
+class TimelineTest(TestCase):
+
+    def setUp(self) -> None:
+        self.client = Client()
+        self.user = User.objects.create(username='reader')
+        self.author = User.objects.create(username='writer')
+        self.star = User.objects.create(username='star')
+        self.client.force_login(self.user)
+
+    def test_post_is_fanned_out(self):
+        Follow.objects.create(user=self.user, author=self.author)
+        post = Post.objects.create(text=self.author.username,
+                                   author=self.author)
+        self.assertTrue(FeedEntry.objects.filter(user=self.user,
+                                                 post=post).exists())
+        post.delete()
+        self.assertFalse(FeedEntry.objects.filter(user=self.user).exists())
+
+    def test_follow_and_unfollow_update_timeline(self):
+        Post.objects.create(text='Old post', author=self.author)
+        self.client.get(f'/{self.author.username}/follow/')
+        self.assertContains(self.client.get('/follow/'), 'Old post')
+        self.client.get(f'/{self.author.username}/unfollow/')
+        self.assertFalse(FeedEntry.objects.filter(user=self.user).exists())
+        self.assertNotContains(self.client.get('/follow/'), 'Old post')
+
+    def test_celebrity_posts_merged_on_read(self):
+        Follow.objects.create(user=self.user, author=self.author)
+        Follow.objects.create(user=self.user, author=self.star)
+        with self.settings(FEED_CELEBRITY_FOLLOWERS=1):
+            Post.objects.create(text='Regular post', author=self.author)
+            Post.objects.create(text='Star post', author=self.star)
+            self.assertEqual(FeedEntry.objects.filter(user=self.user)
+                             .count(), 0)
+            response = self.client.get('/follow/')
+        self.assertContains(response, 'Regular post')
+        self.assertContains(response, 'Star post')
+
+    def test_former_celebrity_posts_backfilled(self):
+        other = User.objects.create(username='other')
+        Follow.objects.create(user=self.user, author=self.star)
+        follow = Follow.objects.create(user=other, author=self.star)
+        with self.settings(FEED_CELEBRITY_FOLLOWERS=2):
+            Post.objects.create(text='Star post', author=self.star)
+            self.assertFalse(FeedEntry.objects.exists())
+            follow.delete()
+            self.assertFalse(FeedEntry.objects.exists())
+            self.assertContains(self.client.get('/follow/'), 'Star post')
+            call_command('backfill_timelines', '--queued', stdout=StringIO())
+            response = self.client.get('/follow/')
+        self.assertEqual(FeedEntry.objects.filter(user=self.user).count(), 1)
+        self.assertFalse(FeedBackfillJob.objects.exists())
+        self.assertContains(response, 'Star post')
+
+    def test_flapping_at_threshold_queues_one_backfill(self):
+        other = User.objects.create(username='other')
+        Follow.objects.create(user=self.user, author=self.star)
+        Follow.objects.create(user=other, author=self.star)
+        with self.settings(FEED_CELEBRITY_FOLLOWERS=2):
+            Post.objects.create(text='Star post', author=self.star)
+            for _ in range(3):
+                Follow.objects.filter(user=other).delete()
+                Follow.objects.create(user=other, author=self.star)
+        self.assertFalse(FeedEntry.objects.exists())
+        self.assertEqual(FeedBackfillJob.objects.filter(author=self.star)
+                         .count(), 1)
+
+    def test_backfill_command(self):
+        Follow.objects.create(user=self.user, author=self.author)
+        Post.objects.create(text='Post', author=self.author)
+        FeedEntry.objects.all().delete()
+        call_command('backfill_timelines', stdout=StringIO())
+        self.assertEqual(FeedEntry.objects.filter(user=self.user).count(), 1)
+
+
+class CounterTest(TestCase):
+
+    def setUp(self) -> None:
+        self.client = Client()
+        self.user = User.objects.create(username='reader')
+        self.author = User.objects.create(username='writer')
+        self.post = Post.objects.create(text='Post', author=self.author)
+
+    def test_counters_follow_writes(self):
+        Comment.objects.create(post=self.post, author=self.user, text='1')
+        comment = Comment.objects.create(post=self.post, author=self.user,
+                                         text='2')
+        Follow.objects.create(user=self.user, author=self.author)
+        self.post.refresh_from_db()
+        self.assertEqual(self.post.comment_count, 2)
+        self.assertEqual(self.author.stats.posts_count, 1)
+        self.assertEqual(self.author.stats.followers_count, 1)
+        self.assertEqual(self.user.stats.following_count, 1)
+
+        comment.delete()
+        Follow.objects.all().delete()
+        self.post.refresh_from_db()
+        self.author.stats.refresh_from_db()
+        self.assertEqual(self.post.comment_count, 1)
+        self.assertEqual(self.author.stats.followers_count, 0)
+
+    def test_post_delete_cost_ignores_comments(self):
+        counts = []
+        for total in (1, 50):
+            post = Post.objects.create(text='Post', author=self.author)
+            Comment.objects.bulk_create(
+                Comment(post=post, author=self.user, text=str(i))
+                for i in range(total))
+            with CaptureQueriesContext(connection) as queries:
+                post.delete()
+            counts.append(len(queries))
+        self.assertEqual(counts[0], counts[1])
+        self.assertFalse(Comment.objects.exclude(post=self.post).exists())
+
+        comment = Comment.objects.create(post=self.post, author=self.user,
+                                         text='1')
+        comment.delete()
+        self.post.refresh_from_db()
+        self.assertEqual(self.post.comment_count, 0)
+
+    def test_edit_keeps_comment_count(self):
+        Comment.objects.create(post=self.post, author=self.user, text='1')
+        self.post.text = 'Edited'
+        self.post.save()
+        self.post.refresh_from_db()
+        self.assertEqual(self.post.comment_count, 1)
+
+    def test_reconcile_repairs_drift(self):
+        Comment.objects.create(post=self.post, author=self.user, text='1')
+        Post.objects.update(comment_count=7)
+        UserStats.objects.filter(user=self.author).update(posts_count=0)
+        call_command('reconcile_counters', stdout=StringIO())
+        self.post.refresh_from_db()
+        self.author.stats.refresh_from_db()
+        self.assertEqual(self.post.comment_count, 1)
+        self.assertEqual(self.author.stats.posts_count, 1)
+
+    def test_profile_needs_no_aggregates(self):
+        Comment.objects.create(post=self.post, author=self.user, text='1')
+        with CaptureQueriesContext(connection) as queries:
+            response = self.client.get(f'/{self.author.username}/')
+        self.assertContains(response, '1 комментариев')
+        for query in queries:
+            self.assertNotIn('COUNT', query['sql'])
+
+
+class PostCardCacheTest(TestCase):
+
+    def setUp(self) -> None:
+        cache.clear()
+        self.client = Client()
+        self.author = User.objects.create(username='writer')
+        self.group = Group.objects.create(title='Old title', slug='cards')
+        self.post = Post.objects.create(text='Card text', author=self.author,
+                                        group=self.group)
+
+    def test_second_render_hits_cache(self):
+        self.client.get(f'/{self.author.username}/')
+        self.client.get(f'/{self.author.username}/')
+        self.assertEqual(fragments.stats(), {'hits': 1, 'misses': 1})
+
+    def test_writes_invalidate_card(self):
+        self.client.get('/')
+        self.post.text = 'Edited card'
+        self.post.save()
+        self.assertContains(self.client.get('/'), 'Edited card')
+        Comment.objects.create(post=self.post, author=self.author, text='c')
+        self.assertContains(self.client.get('/'), '1 комментариев')
+        self.group.title = 'New title'
+        self.group.save()
+        self.assertContains(self.client.get('/'), '#New title')
+
+    def test_edit_link_only_for_author(self):
+        self.assertNotContains(self.client.get('/'), 'Редактировать')
+        self.client.force_login(self.author)
+        self.assertContains(self.client.get('/'), 'Редактировать')
+        self.client.force_login(User.objects.create(username='reader'))
+        self.assertNotContains(self.client.get('/'), 'Редактировать')
+
+
+class SearchTest(TestCase):
+
+    def setUp(self) -> None:
+        cache.clear()
+        self.client = Client()
+        self.user = User.objects.create(username='writer')
+        self.cats = Post.objects.create(text='Мои котики спят',
+                                        author=self.user)
+        self.dogs = Post.objects.create(text='Собака гуляет',
+                                        author=self.user)
+
+    def search(self, query, **params):
+        return self.client.get('/search/', {'q': query, **params})\
+            .context['keyset']
+
+    def test_russian_word_forms(self):
+        self.assertEqual(self.search('котиков').object_list, [self.cats])
+        self.assertEqual(self.search('СОБАКИ').object_list, [self.dogs])
+        self.assertEqual(self.search('"котики* (').object_list, [self.cats])
+
+    def test_index_follows_writes(self):
+        Comment.objects.create(post=self.dogs, author=self.user,
+                               text='Ёжик в тумане')
+        self.assertEqual(self.search('ежики').object_list, [self.dogs])
+        self.dogs.text = 'Кошка гуляет'
+        self.dogs.save()
+        self.assertEqual(self.search('собака').object_list, [])
+        self.dogs.delete()
+        self.assertEqual(self.search('ежик').object_list, [])
+
+    def test_rank_cursor(self):
+        for i in range(12):
+            Post.objects.create(text=f'котики номер {i}', author=self.user)
+        first = self.search('котики')
+        self.assertTrue(first.has_older)
+        second = self.search('котики', before=first.older_cursor)
+        self.assertEqual(len(first) + len(second), 13)
+        self.assertFalse(set(first) & set(second))
+        back = self.search('котики', after=second.newer_cursor)
+        self.assertEqual(back.object_list, first.object_list)
+
+    def test_admin_search_uses_index(self):
+        admin_user = User.objects.create_superuser('admin', 'a@a.com', 'pw')
+        self.client.force_login(admin_user)
+        response = self.client.get('/admin/posts/post/', {'q': 'котик'})
+        self.assertEqual(list(response.context['cl'].result_list),
+                         [self.cats])
+
+
+class ThumbnailTest(TestCase):
+
+    def setUp(self) -> None:
+        cache.clear()
+        self.media = tempfile.mkdtemp()
+        settings = override_settings(MEDIA_ROOT=self.media)
+        settings.enable()
+        self.addCleanup(settings.disable)
+        self.addCleanup(shutil.rmtree, self.media)
+        self.client = Client()
+        self.user = User.objects.create(username='photographer')
+
+    def image(self, name='photo.png'):
+        data = BytesIO()
+        Image.new('RGB', (40, 20), 'red').save(data, 'PNG')
+        return SimpleUploadedFile(name, data.getvalue(), 'image/png')
+
+    def test_job_queued_for_new_image_only(self):
+        post = Post.objects.create(text='Без картинки', author=self.user)
+        self.assertFalse(ThumbnailJob.objects.exists())
+        post.image = self.image()
+        post.save()
+        self.assertTrue(ThumbnailJob.objects.filter(post=post).exists())
+        ThumbnailJob.objects.all().delete()
+        post.text = 'Новый текст'
+        post.save()
+        self.assertFalse(ThumbnailJob.objects.exists())
+
+    # sorl-thumbnail 12.7 resizes with Image.ANTIALIAS, gone in Pillow 10.
+    @skipUnless(hasattr(Image, 'ANTIALIAS'), 'needs the pinned Pillow')
+    def test_placeholder_until_generated(self):
+        post = Post.objects.create(text='Фото', author=self.user,
+                                   image=self.image())
+        self.assertContains(self.client.get('/'), 'thumbnail-placeholder')
+        self.assertIsNone(thumbnails.ready_thumbnail(post.image))
+        thumbnails.process_jobs(thumbnails.claim(10))
+        self.assertFalse(ThumbnailJob.objects.exists())
+        thumbnail = thumbnails.ready_thumbnail(post.image)
+        self.assertIsNotNone(thumbnail)
+        response = self.client.get('/')
+        self.assertNotContains(response, 'thumbnail-placeholder')
+        self.assertContains(response, thumbnail.url)
+
+    def test_finished_job_is_removed_unless_requeued(self):
+        post = Post.objects.create(text='Фото', author=self.user,
+                                   image=self.image())
+        job, = thumbnails.claim(10)
+        thumbnails.finish(job)
+        self.assertFalse(ThumbnailJob.objects.exists())
+        post.image = self.image('second.png')
+        post.save()
+        job, = thumbnails.claim(10)
+        post.image = self.image('third.png')
+        post.save()
+        thumbnails.finish(job)
+        self.assertTrue(ThumbnailJob.objects.filter(post=post).exists())
 
+    def test_claimed_job_is_not_claimed_twice(self):
+        Post.objects.create(text='Фото', author=self.user,
+                            image=self.image())
+        self.assertEqual(len(thumbnails.claim(10)), 1)
+        self.assertEqual(thumbnails.claim(10), [])
+
+    def test_failed_job_is_retried(self):
+        post = Post.objects.create(text='Фото', author=self.user,
+                                   image=self.image())
+        job, = thumbnails.claim(10)
+        thumbnails.finish(job, ValueError('broken image'))
+        job = ThumbnailJob.objects.get(post=post)
+        self.assertEqual(job.attempts, 1)
+        self.assertEqual(job.last_error, 'broken image')
+        self.assertEqual(len(thumbnails.claim(10)), 1)
+
+
+class ImageVariantTest(TestCase):
+
+    def setUp(self) -> None:
+        cache.clear()
+        self.media = tempfile.mkdtemp()
+        settings = override_settings(MEDIA_ROOT=self.media)
+        settings.enable()
+        self.addCleanup(settings.disable)
+        self.addCleanup(shutil.rmtree, self.media)
+        self.user = User.objects.create(username='photographer')
+
+    def image(self, name='photo.png', width=1200, height=600):
+        data = BytesIO()
+        Image.effect_noise((width, height), 60).convert('RGB')\
+            .save(data, 'PNG')
+        return SimpleUploadedFile(name, data.getvalue(), 'image/png')
+
+    def render(self, post):
+        job, = thumbnails.claim(10)
+        variants = image_variants.render(post.image.name, thumbnails.GEOMETRY)
+        thumbnails.finish(job, variants=variants)
+        return variants
+
+    def test_variants_in_every_width_and_format(self):
+        post = Post.objects.create(text='Фото', author=self.user,
+                                   image=self.image())
+        variants = self.render(post)
+        self.assertEqual({(variant['format'], variant['width'])
+                          for variant in variants},
+                         {(format, width) for format in ('webp', 'jpeg')
+                          for width in (320, 480, 640, 960)})
+        sizes = {(variant['format'], variant['width']):
+                 os.path.getsize(os.path.join(self.media, variant['name']))
+                 for variant in variants}
+        self.assertLess(sizes['webp', 320] * 4, sizes['jpeg', 960])
+        # Names come from the content, so rendering again reuses them.
+        self.assertEqual(
+            image_variants.render(post.image.name, thumbnails.GEOMETRY),
+            variants)
+        self.assertTrue(all(variant['name'].startswith('variants/')
+                            for variant in variants))
+
+    def test_card_shows_picture(self):
+        post = Post.objects.create(text='Фото', author=self.user,
+                                   image=self.image())
+        self.assertContains(Client().get('/'), 'thumbnail-placeholder')
+        self.render(post)
+        response = Client().get('/')
+        self.assertNotContains(response, 'thumbnail-placeholder')
+        self.assertContains(response, '<source type="image/webp"')
+        self.assertContains(response, ' 320w, ')
+        self.assertContains(response, 'width="960" height="339"')
+        self.assertContains(Client().get(f'/{self.user.username}/{post.pk}/'),
+                            '<source type="image/webp"')
+
+    def test_finished_job_changes_post_and_profile_etags(self):
+        post = Post.objects.create(text='Фото', author=self.user,
+                                   image=self.image())
+        client = Client()
+        urls = [f'/{self.user.username}/{post.pk}/',
+                f'/{self.user.username}/']
+        first = {url: client.get(url) for url in urls}
+        self.render(post)
+        for url, response in first.items():
+            again = client.get(url, HTTP_IF_NONE_MATCH=response['ETag'])
+            self.assertEqual(again.status_code, 200, url)
+            self.assertContains(again, '<source type="image/webp"')
+
+    def test_variants_of_replaced_image_are_ignored(self):
+        post = Post.objects.create(text='Фото', author=self.user,
+                                   image=self.image())
+        self.render(post)
+        self.assertIsNotNone(image_variants.picture_for(post))
+        post.image = self.image('second.png')
+        post.save()
+        post = Post.objects.get(pk=post.pk)
+        self.assertIsNone(image_variants.picture_for(post))
+
+    def test_small_image_is_not_upscaled(self):
+        post = Post.objects.create(text='Фото', author=self.user,
+                                   image=self.image(width=400, height=200))
+        variants = self.render(post)
+        self.assertEqual({variant['width'] for variant in variants}, {320})
+
+    @override_settings(IMAGE_VARIANT_FORMATS=['bmp-that-does-not-exist'])
+    def test_jpeg_is_always_rendered(self):
+        self.assertEqual(image_variants.formats(), ['jpeg'])
+
+    def test_backfill_queues_images_without_variants(self):
+        done = Post.objects.create(text='Фото', author=self.user,
+                                   image=self.image())
+        self.render(done)
+        old = Post.objects.create(text='Старое фото', author=self.user,
+                                  image=self.image('old.png'))
+        Post.objects.create(text='Без картинки', author=self.user)
+        ThumbnailJob.objects.all().delete()
+        self.assertEqual(thumbnails.enqueue_missing(), 1)
+        self.assertEqual(list(ThumbnailJob.objects.values_list(
+            'post_id', flat=True)), [old.pk])
+
+    def test_variants_are_served_as_immutable(self):
+        post = Post.objects.create(text='Фото', author=self.user,
+                                   image=self.image())
+        name = self.render(post)[0]['name']
+        response = image_variant(RequestFactory().get('/'),
+                                 name.split('/', 1)[1])
+        self.assertEqual(response['Cache-Control'],
+                         image_variants.CACHE_CONTROL)
+
+
+class ImageUploadTest(TestCase):
+
+    def setUp(self) -> None:
+        cache.clear()
+        self.media = tempfile.mkdtemp()
+        settings = override_settings(MEDIA_ROOT=self.media)
+        settings.enable()
+        self.addCleanup(settings.disable)
+        self.addCleanup(shutil.rmtree, self.media)
+        self.user = User.objects.create(username='photographer')
+        self.client = Client()
+        self.client.force_login(self.user)
+
+    def upload(self, name='photo.jpg', size=(300, 100), format='JPEG',
+               **params):
+        data = BytesIO()
+        Image.new('RGB', size, 'blue').save(data, format, **params)
+        return SimpleUploadedFile(name, data.getvalue())
+
+    def stored(self, post):
+        with Image.open(os.path.join(self.media, post.image.name)) as image:
+            return image.format, image.size, image.getexif()
+
+    def test_new_post_image_is_reencoded_without_metadata(self):
+        exif = Image.Exif()
+        exif[0x0112] = 6  # Orientation: rotated 90 degrees.
+        exif[0x010f] = 'Camera maker'
+        self.client.post('/new/', {'text': 'Фото', 'image': self.upload(
+            exif=exif.tobytes())})
+        post = Post.objects.get()
+        self.assertTrue(post.image.name.startswith('posts/'))
+        format, size, stored_exif = self.stored(post)
+        self.assertEqual(format, 'JPEG')
+        self.assertEqual(size, (100, 300))
+        self.assertEqual(dict(stored_exif), {})
+
+    @override_settings(IMAGE_UPLOAD_MAX_SIDE=64)
+    def test_edit_bounds_the_longest_side(self):
+        post = Post.objects.create(text='Фото', author=self.user)
+        self.client.post(f'/{self.user.username}/{post.pk}/edit/', {
+            'text': 'Фото', 'image': self.upload('anim.gif', format='GIF')})
+        post.refresh_from_db()
+        self.assertTrue(post.image.name.endswith('.png'))
+        self.assertEqual(self.stored(post)[:2], ('PNG', (64, 21)))
+
+    @override_settings(IMAGE_UPLOAD_MAX_BYTES=1024)
+    def test_oversized_upload_is_rejected(self):
+        data = BytesIO()
+        Image.effect_noise((100, 100), 80).save(data, 'PNG')
+        response = self.client.post('/new/', {'text': 'Фото', 'image':
+                                    SimpleUploadedFile('big.png',
+                                                       data.getvalue())})
+        self.assertEqual(response.context['form'].errors['image'],
+                         ['Файл больше 1,0\xa0КБ.'])
+        self.assertFalse(Post.objects.exists())
+
+    @override_settings(IMAGE_UPLOAD_MAX_PIXELS=10_000)
+    def test_too_many_pixels_is_rejected_before_decoding(self):
+        field = PostForm.base_fields['image']
+        upload = self.upload(size=(200, 100))
+        with mock.patch.object(Image.Image, 'load') as load:
+            with self.assertRaises(ValidationError) as raised:
+                field.clean(upload)
+        self.assertEqual(raised.exception.code, 'too_many_pixels')
+        load.assert_not_called()
+
+    def test_non_image_is_rejected(self):
+        response = self.client.post('/new/', {'text': 'Фото', 'image':
+                                    SimpleUploadedFile('notes.txt',
+                                                       b'not an image')})
+        self.assertTrue(response.context['form'].has_error('image'))
+
+    @skipUnless(hasattr(MpoImagePlugin, '_save_all'), 'needs Pillow 9.3')
+    def test_phone_mpo_is_saved_as_jpeg(self):
+        data = BytesIO()
+        Image.new('RGB', (300, 100), 'blue').save(
+            data, 'MPO', save_all=True,
+            append_images=[Image.new('RGB', (300, 100), 'red')])
+        self.client.post('/new/', {'text': 'Фото', 'image':
+                         SimpleUploadedFile('photo.jpg', data.getvalue())})
+        post = Post.objects.get()
+        self.assertTrue(post.image.name.endswith('.jpg'))
+        self.assertEqual(self.stored(post)[:2], ('JPEG', (300, 100)))
+
+    def test_bmp_and_tiff_are_saved_as_png(self):
+        for format in ('BMP', 'TIFF'):
+            post = Post.objects.create(text='Фото', author=self.user)
+            self.client.post(f'/{self.user.username}/{post.pk}/edit/', {
+                'text': 'Фото', 'image': self.upload('scan', format=format)})
+            post.refresh_from_db()
+            self.assertEqual(self.stored(post)[:2], ('PNG', (300, 100)))
+
+    def test_unsupported_format_is_named(self):
+        response = self.client.post('/new/', {
+            'text': 'Фото', 'image': self.upload('icon.ico', format='ICO')})
+        self.assertEqual(
+            response.context['form'].errors['image'],
+            ['Загрузите изображение в одном из форматов: '
+             'JPEG, PNG, WEBP, GIF, BMP, TIFF.'])
+
+
+class PageAssetsTest(TestCase):
+
+    def test_assets_are_loaded_once(self):
+        content = Client().get('/').content.decode()
+        self.assertEqual(content.count('rel="stylesheet"'), 1)
+        self.assertEqual(content.count('bootstrap.min.css'), 1)
+        self.assertNotIn('jquery', content)
+
+
+@override_settings(FEED_LITE=True, FEED_LITE_FIRST_CARDS=3)
+class LiteFeedTest(TestCase):
+
+    def setUp(self) -> None:
+        cache.clear()
+        self.user = User.objects.create(username='writer')
+        self.posts = [Post.objects.create(text=f'Post #{i}', author=self.user)
+                      for i in range(25)]
+        self.client = Client()
+
+    def test_first_page_renders_first_cards_only(self):
+        response = self.client.get('/')
+        self.assertEqual(len(response.context['keyset']), 3)
+        self.assertContains(response, 'class="card ', count=3)
+        self.assertContains(response, 'data-feed-more=')
+        self.assertContains(response, 'js/feed.js')
+        self.assertNotContains(response, 'Старее')
+
+    def test_fragments_continue_the_feed(self):
+        keyset = self.client.get('/').context['keyset']
+        seen = list(keyset.object_list)
+        while keyset.has_older:
+            response = self.client.get('/', {'before': keyset.older_cursor,
+                                             'fragment': 'cards'})
+            self.assertNotContains(response, '<html')
+            keyset = response.context['keyset']
+            self.assertLessEqual(len(keyset), 10)
+            seen += keyset.object_list
+        self.assertEqual(seen, self.posts[::-1])
+        self.assertNotContains(response, 'data-feed-more')
+
+    def test_feed_pages_have_fragments(self):
+        group = Group.objects.create(title='Группа', slug='group')
+        Post.objects.filter(pk__in=[post.pk for post in self.posts[:5]])\
+            .update(group=group)
+        self.client.force_login(self.user)
+        for url in ('/group/group/', '/writer/'):
+            keyset = self.client.get(url).context['keyset']
+            self.assertEqual(len(keyset), 3)
+            response = self.client.get(url, {'before': keyset.older_cursor,
+                                             'fragment': 'cards'})
+            self.assertNotContains(response, '<html')
+            self.assertTrue(response.context['keyset'].object_list)
+
+    def test_pages_without_javascript_are_full(self):
+        keyset = self.client.get('/').context['keyset']
+        response = self.client.get('/', {'before': keyset.older_cursor})
+        self.assertEqual(len(response.context['keyset']), 10)
+
+    def test_legacy_pages_are_full(self):
+        response = self.client.get('/', {'page': 2})
+        self.assertEqual(len(response.context['keyset']), 10)
+        self.assertNotContains(response, 'data-feed-more')
+
+
+@override_settings(COMMENTS_FIRST_PAGE=3, COMMENTS_PAGE_SIZE=4)
+class CommentThreadTest(TestCase):
+
+    def setUp(self) -> None:
+        cache.clear()
+        self.user = User.objects.create(username='writer')
+        self.post = Post.objects.create(text='Текст', author=self.user)
+        self.comments = [
+            Comment.objects.create(post=self.post, author=self.user,
+                                   text=f'Comment #{i}')
+            for i in range(10)]
+        self.url = f'/writer/{self.post.pk}/'
+        self.client = Client()
+
+    def test_first_render_is_capped(self):
+        response = self.client.get(self.url)
+        self.assertEqual(list(response.context['items']),
+                         self.comments[:-4:-1])
+        self.assertContains(response, 'fragment=comments')
+        self.assertContains(response, 'js/feed.js')
+
+    def test_fragments_continue_the_thread(self):
+        items = self.client.get(self.url).context['items']
+        seen = list(items)
+        while items.has_older:
+            response = self.client.get(self.url, {'before': items.older_cursor,
+                                                  'fragment': 'comments'})
+            self.assertNotContains(response, '<html')
+            items = response.context['items']
+            self.assertLessEqual(len(items), 4)
+            seen += items.object_list
+        self.assertEqual(seen, self.comments[::-1])
+        self.assertNotContains(response, 'data-feed-more')
+
+    def test_cursor_without_javascript(self):
+        items = self.client.get(self.url).context['items']
+        response = self.client.get(self.url, {'before': items.older_cursor})
+        self.assertEqual(list(response.context['items']),
+                         self.comments[-4:-8:-1])
+        self.assertContains(response, 'К новым комментариям')
+
+    def test_fragment_of_unknown_post(self):
+        response = self.client.get(f'/other/{self.post.pk}/',
+                                   {'fragment': 'comments'})
+        self.assertEqual(response.status_code, 404)
+
+
+class ConditionalGetTest(TestCase):
+
+    def setUp(self) -> None:
+        cache.clear()
+        self.client = Client()
+        self.author = User.objects.create(username='author')
+        self.group = Group.objects.create(title='Группа', slug='group')
+        self.post = Post.objects.create(text='Текст', author=self.author,
+                                        group=self.group)
+
+    def revalidate(self, url, response):
+        return self.client.get(url, HTTP_IF_NONE_MATCH=response['ETag'])
+
+    def test_not_modified_until_changed(self):
+        pages = ['/', f'/group/{self.group.slug}/', f'/{self.author}/',
+                 f'/{self.author}/{self.post.pk}/']
+        first = {url: self.client.get(url) for url in pages}
+        for url, response in first.items():
+            self.assertEqual(response.status_code, 200, url)
+            self.assertIn('Last-Modified', response)
+            self.assertEqual(self.revalidate(url, response).status_code, 304,
+                             url)
+        Comment.objects.create(post=self.post, author=self.author,
+                               text='Комментарий')
+        for url, response in first.items():
+            self.assertEqual(self.revalidate(url, response).status_code, 200,
+                             url)
+
+    def test_not_modified_without_running_the_view(self):
+        url = f'/{self.author}/{self.post.pk}/'
+        response = self.client.get(url)
+        with CaptureQueriesContext(connection) as queries:
+            self.assertEqual(self.revalidate(url, response).status_code, 304)
+        # The author id of the scope, nothing from the page itself.
+        self.assertEqual(len(queries), 1)
+
+    def test_validators_depend_on_viewer_and_query(self):
+        anonymous = self.client.get('/')
+        self.assertEqual(self.client.get(
+            '/?before=x', HTTP_IF_NONE_MATCH=anonymous['ETag']).status_code,
+            200)
+        self.client.force_login(self.author)
+        signed_in = self.revalidate('/', anonymous)
+        self.assertEqual(signed_in.status_code, 200)
+        self.assertIn('private', signed_in['Cache-Control'])
+
+    def test_missing_objects_store_no_generation(self):
+        for url, scope in ((f'/{self.author}/999/',
+                            page_cache.post_scope(999)),
+                           ('/group/missing/',
+                            page_cache.group_scope('missing'))):
+            self.assertEqual(self.client.get(url).status_code, 404)
+            self.assertIsNone(cache.get(page_cache.generation_key(scope)))
+
+    def test_new_csrf_token_changes_forms(self):
+        self.client.force_login(self.author)
+        url = f'/{self.author}/{self.post.pk}/'
+        self.client.get(url)
+        response = self.client.get(url)
+        self.assertEqual(self.revalidate(url, response).status_code, 304)
+        # Logging in again rotates the token embedded in the comment form.
+        self.client.cookies['csrftoken'] = 'a' * 64
+        self.assertEqual(self.revalidate(url, response).status_code, 200)
+
+    def test_follow_changes_profile(self):
+        url = f'/{self.author}/'
+        response = self.client.get(url)
+        Follow.objects.create(user=User.objects.create(username='reader'),
+                              author=self.author)
+        self.assertEqual(self.revalidate(url, response).status_code, 200)
+
+
+class ExplainQueriesTest(TestCase):
+
+    def test_feeds_use_indexes(self):
+        user = User.objects.create(username='author')
+        group = Group.objects.create(title='Группа', slug='group')
+        post = Post.objects.create(text='Текст', author=user, group=group)
+        Comment.objects.create(post=post, author=user, text='Комментарий')
+        out = StringIO()
+        call_command('explain_queries', stdout=out)
+        self.assertIn('No full scans found', out.getvalue())
+        with connection.cursor() as cursor:
+            cursor.execute('DROP INDEX post_group_date_idx')
+        out = StringIO()
+        call_command('explain_queries', stdout=out)
+        self.assertIn(f'/group/{group.slug}/', out.getvalue())
+
+
+class BenchmarkTest(TestCase):
+
+    def setUp(self) -> None:
+        cache.clear()
+        media = tempfile.mkdtemp()
+        settings = override_settings(MEDIA_ROOT=media)
+        settings.enable()
+        self.addCleanup(settings.disable)
+        self.addCleanup(shutil.rmtree, media)
+
+    def test_seed_and_measure(self):
+        dataset = benchmark.seed(scale=0.0001, stdout=StringIO())
+        sizes = benchmark.sizes_for(0.0001)
+        self.assertEqual(dataset['posts'], sizes['posts'])
+        self.assertEqual(dataset['comments'], sizes['comments'])
+        self.assertTrue(dataset['follows'])
+        # Dates come from the factories, not from auto_now_add.
+        self.assertGreater(Post.objects.values('pub_date').distinct().count(),
+                           1)
+        results = benchmark.run(benchmark.default_user(), requests=2,
+                                warmup=0)
+        self.assertIn('follow_index:user', results)
+        self.assertIn('api:comment-list', results)
+        for name, result in results.items():
+            self.assertEqual(result['errors'], 0, name)
+            self.assertEqual(result['requests'], 2)
+        self.assertGreater(results['index:user']['queries']['max'], 0)
+        report = benchmark.report(results, {})
+        rows = benchmark.compare(report, report)
+        self.assertTrue(rows)
+        self.assertTrue(all(change == 0 for *_, change in rows))
+
+
+class ServerBenchmarkTest(TransactionTestCase):
+
+    def setUp(self) -> None:
+        cache.clear()
+        media = tempfile.mkdtemp()
+        settings = override_settings(MEDIA_ROOT=media)
+        settings.enable()
+        self.addCleanup(settings.disable)
+        self.addCleanup(shutil.rmtree, media)
 
+    def test_both_servers_answer_every_request(self):
+        benchmark.seed(scale=0.0001, stdout=StringIO())
+        results = server_benchmark.run(benchmark.default_user(), clients=3,
+                                       requests=4, workers=2, delay=0)
+        for name in ('wsgi', 'asgi'):
+            self.assertEqual(results[name]['requests'], 12, name)
+            self.assertEqual(results[name]['errors'], 0, name)
+            self.assertGreater(results[name]['throughput'], 0)
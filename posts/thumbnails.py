@@ -0,0 +1,162 @@
+"""Thumbnails of post images generated ahead of time.
+
+Saving a post with a new image queues a ``ThumbnailJob``; the
+``thumbnail_worker`` command claims jobs from that table and renders them
+in a pool of processes, since decoding and resizing with Pillow is CPU
+bound. Each job renders the sorl thumbnail and the responsive variants of
+posts.image_variants. Pages never render thumbnails inline:
+``ready_thumbnail`` only looks the thumbnail up in sorl's key-value store
+and the card shows a placeholder until the worker has produced it.
+"""
+import logging
+from concurrent.futures import ProcessPoolExecutor, as_completed
+from datetime import timedelta
+from multiprocessing import get_context
+
+from django.conf import settings
+from django.db import connections
+from django.db.models import Q
+from django.utils import timezone
+from sorl.thumbnail import default, get_thumbnail
+from sorl.thumbnail.base import ThumbnailBackend
+from sorl.thumbnail.conf import settings as sorl_settings, defaults
+from sorl.thumbnail.images import ImageFile
+
+from . import fragments, image_variants, page_cache
+from .models import Post, ThumbnailJob
+
+logger = logging.getLogger(__name__)
+
+GEOMETRY = '960x339'
+OPTIONS = {'crop': 'center', 'upscale': True}
+MAX_ATTEMPTS = 5
+
+
+def lease():
+    return timedelta(seconds=getattr(settings, 'THUMBNAIL_JOB_LEASE', 300))
+
+
+class LookupBackend(ThumbnailBackend):
+
+    def get_ready_thumbnail(self, file_, geometry_string, **options):
+        """Return the stored thumbnail like get_thumbnail, never render."""
+        source = ImageFile(file_)
+        if sorl_settings.THUMBNAIL_PRESERVE_FORMAT:
+            options.setdefault('format', self._get_format(source))
+        for key, value in self.default_options.items():
+            options.setdefault(key, value)
+        for key, attr in self.extra_options:
+            value = getattr(sorl_settings, attr)
+            if value != getattr(defaults, attr):
+                options.setdefault(key, value)
+        name = self._get_thumbnail_filename(source, geometry_string, options)
+        return default.kvstore.get(ImageFile(name, default.storage))
+
+
+backend = LookupBackend()
+
+
+def ready_thumbnail(image):
+    if not image:
+        return None
+    return backend.get_ready_thumbnail(image, GEOMETRY, **OPTIONS)
+
+
+def enqueue(post):
+    job, created = ThumbnailJob.objects.get_or_create(post=post)
+    if not created:
+        ThumbnailJob.objects.filter(pk=job.pk).update(
+            locked_at=None, attempts=0, last_error='')
+
+
+def enqueue_missing():
+    """Queue the images that have no variants yet, e.g. uploaded before
+    variants existed."""
+    ids = list(Post.objects
+               .exclude(Q(image='') | Q(image__isnull=True))
+               .filter(image_variants__isnull=True,
+                       thumbnail_job__isnull=True)
+               .values_list('pk', flat=True))
+    ThumbnailJob.objects.bulk_create(ThumbnailJob(post_id=pk) for pk in ids)
+    return len(ids)
+
+
+def generate(name):
+    """Render the thumbnail and the variants of one image; runs in a
+    worker process and returns the variants to store."""
+    variants = image_variants.render(name, GEOMETRY)
+    get_thumbnail(name, GEOMETRY, **OPTIONS)
+    return variants
+
+
+def claim(limit):
+    now = timezone.now()
+    available = Q(locked_at__isnull=True) | Q(locked_at__lt=now - lease())
+    pending = ThumbnailJob.objects\
+        .filter(available, attempts__lt=MAX_ATTEMPTS)\
+        .values_list('pk', flat=True)[:limit]
+    ids = list(pending)
+    # The conditional UPDATE is the lock: a job another worker claimed in
+    # the meantime no longer matches ``available``.
+    ThumbnailJob.objects.filter(available, pk__in=ids).update(locked_at=now)
+    return list(ThumbnailJob.objects
+                .filter(pk__in=ids, locked_at=now)
+                .select_related('post'))
+
+
+def invalidate(post_ids):
+    for post_id in post_ids:
+        fragments.bump('post', post_id)
+    rows = list(Post.objects
+                .filter(pk__in=post_ids)
+                .values_list('pk', 'author_id', 'group_id'))
+    page_cache.bump(
+        *page_cache.post_scopes(*(group_id for _, _, group_id in rows)),
+        *{page_cache.post_scope(pk) for pk, _, _ in rows},
+        *{page_cache.author_scope(author_id) for _, author_id, _ in rows})
+
+
+def finish(job, error=None, variants=()):
+    if error is None:
+        # A job re-queued for a newer image while this one ran is unlocked
+        # again and must survive.
+        ThumbnailJob.objects.filter(pk=job.pk,
+                                    locked_at=job.locked_at).delete()
+        if variants:
+            image_variants.store(job.post_id, job.post.image.name, variants)
+        invalidate([job.post_id])
+        return
+    logger.warning('Thumbnail for post %s failed: %s', job.post_id, error)
+    ThumbnailJob.objects.filter(pk=job.pk).update(
+        locked_at=None, attempts=job.attempts + 1, last_error=str(error))
+
+
+def process_jobs(jobs, pool=None):
+    """Generate thumbnails for claimed jobs, in ``pool`` if one is given."""
+    pending = []
+    for job in jobs:
+        if job.post.image:
+            pending.append(job)
+        else:
+            job.delete()
+    if pool is None:
+        for job in pending:
+            try:
+                variants = generate(job.post.image.name)
+            except Exception as error:
+                finish(job, error)
+            else:
+                finish(job, variants=variants)
+        return
+    # Forked workers must not inherit the parent's database connections.
+    connections.close_all()
+    futures = {pool.submit(generate, job.post.image.name): job
+               for job in pending}
+    for future in as_completed(futures):
+        error = future.exception()
+        finish(futures[future], error,
+               () if error is not None else future.result())
+
+
+def make_pool(processes):
+    return ProcessPoolExecutor(processes, mp_context=get_context('fork'))
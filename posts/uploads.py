@@ -0,0 +1,177 @@
+"""Checked and re-encoded image uploads.
+
+Uploads are streamed to a temporary file by ``FILE_UPLOAD_HANDLERS``:
+``SizeLimitUploadHandler`` stops storing a file once it passes
+``IMAGE_UPLOAD_MAX_BYTES`` and leaves a marker that ``ImageUploadField``
+rejects. The field reads only the image header to check the format and the
+dimensions, so a decompression bomb is refused before any pixel is decoded,
+and then re-encodes the image with its EXIF and other metadata dropped and
+its longest side at most ``IMAGE_UPLOAD_MAX_SIDE``. JPEG files are decoded
+at a reduced scale when that is enough for the bounded size.
+
+Only the formats of ``OUTPUT`` are opened at all; other files, including
+images Pillow could read, get the ``unsupported_format`` error naming the
+accepted formats. MPO photos of phone cameras are saved as JPEG and the
+lossless BMP and TIFF as PNG, keeping their first frame.
+
+``ImageUploadField`` is the form field of ``PostForm`` and, through DRF's
+``_DjangoImageField`` hook, of the API serializer.
+"""
+import os
+import tempfile
+
+from django import forms
+from django.conf import settings
+from django.core.files.uploadedfile import UploadedFile
+from django.core.files.uploadhandler import FileUploadHandler
+from django.template.defaultfilters import filesizeformat
+from PIL import Image, ImageOps, UnidentifiedImageError
+
+# Source format: (saved format, extension, content type).
+OUTPUT = {
+    'JPEG': ('JPEG', 'jpg', 'image/jpeg'),
+    'PNG': ('PNG', 'png', 'image/png'),
+    'WEBP': ('WEBP', 'webp', 'image/webp'),
+    # Only the first frame is kept.
+    'MPO': ('JPEG', 'jpg', 'image/jpeg'),
+    'GIF': ('PNG', 'png', 'image/png'),
+    'BMP': ('PNG', 'png', 'image/png'),
+    'TIFF': ('PNG', 'png', 'image/png'),
+}
+# Plugins tried on uploads; the JPEG one also opens MPO files.
+OPEN = [name for name in OUTPUT if name != 'MPO']
+# Names shown in the unsupported_format error.
+FORMAT_NAMES = 'JPEG, PNG, WEBP, GIF, BMP, TIFF'
+# Modes each saved format can keep as they are.
+MODES = {'JPEG': ('RGB', 'L'), 'PNG': ('RGB', 'RGBA', 'L', 'LA'),
+         'WEBP': ('RGB', 'RGBA')}
+QUALITY = 85
+
+
+def max_bytes():
+    return getattr(settings, 'IMAGE_UPLOAD_MAX_BYTES', 10 * 1024 * 1024)
+
+
+def max_pixels():
+    return getattr(settings, 'IMAGE_UPLOAD_MAX_PIXELS', 25_000_000)
+
+
+def megapixels():
+    return f'{max_pixels() / 1_000_000:g}'
+
+
+def max_side():
+    return getattr(settings, 'IMAGE_UPLOAD_MAX_SIDE', 2048)
+
+
+class OversizedUpload(UploadedFile):
+    """Stands in for a file that was larger than the upload limit; its
+    content was not kept."""
+
+    def __init__(self, name, content_type, size):
+        super().__init__(None, name, content_type, size)
+
+    def close(self):
+        pass
+
+
+class SizeLimitUploadHandler(FileUploadHandler):
+    """Count the bytes of each file and drop the rest past the limit.
+
+    Placed before the handler storing the file, which then receives no
+    more chunks.
+    """
+
+    def new_file(self, *args, **kwargs):
+        super().new_file(*args, **kwargs)
+        self.received = 0
+        self.oversized = False
+
+    def receive_data_chunk(self, raw_data, start):
+        self.received += len(raw_data)
+        if self.received > max_bytes():
+            self.oversized = True
+        return None if self.oversized else raw_data
+
+    def file_complete(self, file_size):
+        if self.oversized:
+            return OversizedUpload(self.file_name, self.content_type,
+                                   self.received)
+        return None
+
+
+def _bounded(image, output):
+    """Decode ``image`` no larger than needed for ``max_side()``, in a mode
+    ``output`` can save, without metadata."""
+    limit = max_side()
+    if image.format in ('JPEG', 'MPO'):
+        # Lets libjpeg scale by 1/2, 1/4 or 1/8 while decoding.
+        image.draft('RGB', (limit, limit))
+    image = ImageOps.exif_transpose(image)
+    if image.mode not in MODES[output]:
+        alpha = image.mode in ('RGBA', 'LA', 'PA') \
+            or 'transparency' in image.info
+        image = image.convert('RGBA' if alpha and output != 'JPEG'
+                              else 'RGB')
+    image.thumbnail((limit, limit), Image.LANCZOS)
+    # EXIF, ICC profiles, comments and XMP would be copied from here.
+    image.info = {}
+    return image
+
+
+class ImageUploadField(forms.ImageField):
+    default_error_messages = {
+        'too_large': 'Файл больше %(limit)s.',
+        'too_many_pixels': 'Изображение больше %(limit)s мегапикселей.',
+        'unsupported_format': 'Загрузите изображение в одном из форматов: '
+                              '%(formats)s.',
+    }
+
+    def error(self, code, **params):
+        # DRF replaces error_messages with the ones of its own field.
+        message = self.error_messages.get(
+            code, ImageUploadField.default_error_messages[code])
+        return forms.ValidationError(message, code=code, params=params)
+
+    def to_python(self, data):
+        data = forms.FileField.to_python(self, data)
+        if data is None:
+            return None
+        if isinstance(data, OversizedUpload) or data.size > max_bytes():
+            raise self.error('too_large', limit=filesizeformat(max_bytes()))
+        file = data.temporary_file_path() \
+            if hasattr(data, 'temporary_file_path') else data
+        invalid = forms.ValidationError(self.error_messages['invalid_image'],
+                                        code='invalid_image')
+        try:
+            # Only the header is read here.
+            image = Image.open(file, formats=OPEN)
+        except Image.DecompressionBombError as error:
+            raise self.error('too_many_pixels', limit=megapixels()) from error
+        except UnidentifiedImageError as error:
+            raise self.error('unsupported_format',
+                             formats=FORMAT_NAMES) from error
+        except Exception as error:
+            raise invalid from error
+        with image:
+            width, height = image.size
+            if width * height > max_pixels():
+                raise self.error('too_many_pixels', limit=megapixels())
+            try:
+                return self.reencode(data, image)
+            except Exception as error:
+                raise invalid from error
+
+    def reencode(self, data, image):
+        """Return a new upload of ``image`` without metadata."""
+        output, extension, content_type = OUTPUT[image.format]
+        image = _bounded(image, output)
+        name = f'{os.path.splitext(os.path.basename(data.name))[0]}' \
+               f'.{extension}'
+        file = tempfile.SpooledTemporaryFile(
+            settings.FILE_UPLOAD_MAX_MEMORY_SIZE)
+        image.save(file, output, quality=QUALITY, optimize=True)
+        upload = UploadedFile(file, name, content_type, file.tell())
+        upload.seek(0)
+        upload.image = image
+        return upload
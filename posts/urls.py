@@ -7,6 +7,7 @@ urlpatterns = [
     path('', views.index, name='index'),
     path('group/<slug:slug>/', views.group_posts, name='group'),
     path('new/', views.new_post, name='new_post'),
+    path('search/', views.search, name='search'),
     path("follow/", views.follow_index, name="follow_index"),
     path("<username>/follow/", views.profile_follow,
          name="profile_follow"),
@@ -1,23 +1,38 @@
+import os
+
+from django.conf import settings
 from django.contrib.auth.decorators import login_required
 from django.shortcuts import render, get_object_or_404, redirect
-from django.core.paginator import Paginator
-from django.views.decorators.cache import cache_page
+from django.utils.http import urlencode
+from django.views.static import serve
 
-from .models import Post, Group, User, Comment, Follow
+from .models import Post, Group, User, Follow
 from .forms import PostForm, CommentForm
-
-
-# @cache_page(20, key_prefix='index_page')
+from . import comment_thread, feed, follow_graph, image_variants, \
+    search as search_index
+from .conditional import conditional_page, group_page_scopes, \
+    post_page_scopes, profile_scopes
+from .counters import stats_for
+from .lite_feed import per_page, render_feed
+from .page_cache import anonymous_page_cache, existing_group_scope, \
+    INDEX_SCOPE
+from .pagination import paginate, page_context, is_legacy_request
+from yatube.routers import replica_reads
+from yatube.sqlite.transactions import serialized_write
+
+
+@replica_reads
+@conditional_page([INDEX_SCOPE])
+@anonymous_page_cache(INDEX_SCOPE)
 def index(request):
     post_list = Post.objects.select_related('author', 'group')
-    paginator = Paginator(post_list, 10)
-    page_number = request.GET.get('page')
-    page = paginator.get_page(page_number)
-
-    return render(request, 'index.html',
-                  {'page': page, 'paginator': paginator})
+    return render_feed(request, 'index.html',
+                       paginate(request, post_list, per_page(request)))
 
 
+@replica_reads
+@conditional_page(group_page_scopes)
+@anonymous_page_cache(existing_group_scope)
 def group_posts(request, slug):
     group = get_object_or_404(Group
                               .objects
@@ -27,13 +42,25 @@ def group_posts(request, slug):
         .objects\
         .filter(group=group)\
         .select_related('author', 'group')
-    paginator = Paginator(post_list, 10)
-    page_number = request.GET.get('page')
-    page = paginator.get_page(page_number)
-    context = {'group': group, 'page': page, 'paginator': paginator}
-    return render(request, 'group.html', context)
+    context = {'group': group,
+               **paginate(request, post_list, per_page(request))}
+    return render_feed(request, 'group.html', context)
+
+
+def search(request):
+    query = request.GET.get('q', '').strip()
+    post_list = Post.objects.select_related('author', 'group')
+    keyset = search_index.search_page(post_list, query,
+                                      before=request.GET.get('before'),
+                                      after=request.GET.get('after'),
+                                      per_page=per_page(request))
+    context = {'query': query,
+               'params': urlencode({'q': query}) + '&',
+               **page_context(keyset, post_list)}
+    return render_feed(request, 'search.html', context)
 
 
+@serialized_write
 def new_post(request):
     if request.user.is_authenticated:
         form = PostForm(request.POST or None, files=request.FILES or None, )
@@ -48,48 +75,53 @@ def new_post(request):
     return redirect('index')
 
 
+@replica_reads
+@conditional_page(profile_scopes)
 def profile(request, username):
     author = get_object_or_404(User
                                .objects
                                .filter(username=username)
-                               .select_related())
+                               .select_related('stats'))
     post_list = Post\
         .objects\
         .filter(author=author)\
         .select_related('author', 'group')
-    paginator = Paginator(post_list, 10)
-    page_number = request.GET.get('page')
-    page = paginator.get_page(page_number)
-    following = author.following.exists()
-    return render(request, 'profile.html', {'page': page,
-                                            'paginator': paginator,
-                                            'author': author,
-                                            'post_list': post_list,
-                                            'following': following,
-                                            })
-
-
+    following = follow_graph.is_following(request.user, author.pk)
+    return render_feed(request, 'profile.html', {
+        **paginate(request, post_list, per_page(request)),
+        'author': author,
+        'stats': stats_for(author),
+        'post_list': post_list,
+        'following': following,
+    })
+
+
+@replica_reads
+@conditional_page(post_page_scopes)
 def post_view(request, username, post_id):
+    if comment_thread.is_fragment(request):
+        post = get_object_or_404(Post.objects.select_related('author'),
+                                 author__username=username, id=post_id)
+        return render(request, 'comment_list.html', {
+            'post': post, 'items': comment_thread.page(request, post.pk)})
     author = get_object_or_404(User
                                .objects
                                .filter(username=username)
-                               .select_related())
+                               .select_related('stats'))
     post = get_object_or_404(Post
                              .objects
                              .filter(author=author, id=post_id)
                              .select_related('author', 'group'))
-    posts_count = Post\
-        .objects\
-        .filter(author=author)\
-        .select_related('author', 'group')\
-        .count()
+    stats = stats_for(author)
     form = CommentForm()
-    items = Comment.objects.filter(post=post).select_related('author')
+    items = comment_thread.page(request, post.pk)
     return render(request, 'post.html', {'author': author, 'post': post,
-                                         'posts_count': posts_count,
+                                         'stats': stats,
+                                         'posts_count': stats.posts_count,
                                          'form': form, 'items': items})
 
 
+@serialized_write
 def post_edit(request, username, post_id):
     if request.user.username != username:
         return redirect('post', username=username, post_id=post_id)
@@ -122,6 +154,7 @@ def server_error(request):
     return render(request, 'misc/500.html', status=500)
 
 
+@serialized_write
 def add_comment(request, username, post_id):
     if request.user.is_authenticated:
         form = CommentForm(request.POST or None)
@@ -141,18 +174,26 @@ def add_comment(request, username, post_id):
     return redirect('post', username=username, post_id=post_id)
 
 
+@replica_reads
 @login_required
 def follow_index(request):
-    post_list = Post.objects.filter(author__following__user=request.user)
-    paginator = Paginator(post_list, 10)
-    page_number = request.GET.get('page')
-    page = paginator.get_page(page_number)
-
-    return render(request, "follow.html",
-                  {'page': page, 'paginator': paginator})
+    post_list = Post\
+        .objects\
+        .filter(author__following__user=request.user)\
+        .select_related('author', 'group')
+    if is_legacy_request(request):
+        return render_feed(request, "follow.html",
+                           paginate(request, post_list))
+    keyset = feed.timeline_page(request.user,
+                                before=request.GET.get('before'),
+                                after=request.GET.get('after'),
+                                per_page=per_page(request))
+    return render_feed(request, "follow.html",
+                       page_context(keyset, post_list))
 
 
 @login_required
+@serialized_write(methods=('GET', 'POST'))
 def profile_follow(request, username):
     author = get_object_or_404(User
                                .objects
@@ -164,9 +205,19 @@ def profile_follow(request, username):
 
 
 @login_required
+@serialized_write(methods=('GET', 'POST'))
 def profile_unfollow(request, username):
     Follow\
         .objects\
         .filter(author__username=username, user=request.user)\
         .delete()
-    return redirect('profile', username=username)
\ No newline at end of file
+    return redirect('profile', username=username)
+
+
+def image_variant(request, path):
+    """Serve an image variant in development with the headers the web
+    server sends in production."""
+    response = serve(request, path, document_root=os.path.join(
+        settings.MEDIA_ROOT, image_variants.DIRECTORY))
+    response['Cache-Control'] = image_variants.CACHE_CONTROL
+    return response
@@ -0,0 +1,21 @@
+"""
+ASGI config for Yatube project.
+
+It exposes the ASGI callable as a module-level variable named
+``application``, for servers such as uvicorn or daphne:
+
+    uvicorn yatube.asgi:application
+
+See yatube.asgi_handler for how requests are served.
+"""
+
+import os
+
+import django
+
+os.environ.setdefault('DJANGO_SETTINGS_MODULE', 'yatube.settings')
+django.setup(set_prefix=False)
+
+from yatube.asgi_handler import ASGIHandler  # noqa: E402
+
+application = ASGIHandler()
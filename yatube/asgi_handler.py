@@ -0,0 +1,224 @@
+"""Serve the Django application to an ASGI server.
+
+Django 2.2 has neither an ASGI handler nor async views, so this adapter
+runs the regular WSGI handler, and with it the ORM and the thumbnail
+lookups, in bounded thread pools while the event loop does the network
+I/O. A thread is only taken once the request body has been received, and
+handed back before the response is written, so slow clients cost a
+coroutine instead of a blocked worker.
+
+Safe requests (GET, HEAD, OPTIONS), the read-only feed pages and API
+lists, run in ``ASGI_READ_THREADS`` threads. Other methods go to
+``ASGI_WRITE_THREADS`` threads, one by default because SQLite has a single
+writer anyway. Each request runs in a fresh ``contextvars`` context, like
+it would in its own WSGI worker thread.
+
+The request body is spooled to a temporary file past
+``FILE_UPLOAD_MAX_MEMORY_SIZE``, as a WSGI server would do, and a body
+over ``ASGI_MAX_BODY_BYTES`` is answered with 413 without running the
+application. The default allows a form of ``DATA_UPLOAD_MAX_MEMORY_SIZE``
+with an image of ``IMAGE_UPLOAD_MAX_BYTES``, which posts.uploads checks
+again as it is parsed.
+
+Streamed responses are read chunk by chunk in the pool, since producing a
+chunk may query the database.
+"""
+import asyncio
+import contextvars
+import sys
+import tempfile
+from concurrent.futures import ThreadPoolExecutor
+from io import BytesIO
+
+from django.conf import settings
+from django.core.handlers.wsgi import WSGIHandler
+
+from posts.uploads import max_bytes as image_upload_max_bytes
+
+SAFE_METHODS = ('GET', 'HEAD', 'OPTIONS')
+
+
+def read_threads():
+    return getattr(settings, 'ASGI_READ_THREADS', 8)
+
+
+def write_threads():
+    return getattr(settings, 'ASGI_WRITE_THREADS', 1)
+
+
+def max_body_bytes():
+    default = (settings.DATA_UPLOAD_MAX_MEMORY_SIZE or 0) \
+        + image_upload_max_bytes()
+    return getattr(settings, 'ASGI_MAX_BODY_BYTES', default)
+
+
+class BodyTooLarge(Exception):
+    pass
+
+
+def _latin1(value):
+    # WSGI strings carry the raw bytes as latin-1.
+    return value.encode().decode('latin-1')
+
+
+def environ_for(scope, body):
+    """The WSGI environ of ``scope``; ``body`` is bytes or a file."""
+    if isinstance(body, bytes):
+        body = BytesIO(body)
+    length = body.seek(0, 2)
+    body.seek(0)
+    server = scope.get('server') or ('localhost', 80)
+    client = scope.get('client') or ('', 0)
+    environ = {
+        'REQUEST_METHOD': scope['method'],
+        'SCRIPT_NAME': _latin1(scope.get('root_path', '')),
+        'PATH_INFO': _latin1(scope['path']),
+        'QUERY_STRING': scope.get('query_string', b'').decode('latin-1'),
+        'SERVER_NAME': str(server[0]),
+        'SERVER_PORT': str(server[1] or 80),
+        'SERVER_PROTOCOL': f'HTTP/{scope.get("http_version", "1.1")}',
+        'REMOTE_ADDR': client[0],
+        'REMOTE_PORT': str(client[1]),
+        'CONTENT_LENGTH': str(length),
+        'wsgi.version': (1, 0),
+        'wsgi.url_scheme': scope.get('scheme', 'http'),
+        'wsgi.input': body,
+        'wsgi.errors': sys.stderr,
+        'wsgi.multithread': True,
+        'wsgi.multiprocess': True,
+        'wsgi.run_once': False,
+    }
+    for name, value in scope.get('headers', []):
+        name = name.decode('latin-1').upper().replace('-', '_')
+        value = value.decode('latin-1')
+        if name == 'CONTENT_TYPE':
+            environ['CONTENT_TYPE'] = value
+            continue
+        if name == 'CONTENT_LENGTH':
+            continue
+        key = f'HTTP_{name}'
+        environ[key] = f'{environ[key]},{value}' if key in environ else value
+    return environ
+
+
+class ASGIHandler:
+
+    def __init__(self, wsgi_application=None):
+        self.wsgi_application = wsgi_application or WSGIHandler()
+        self.pools = {}
+
+    def pool(self, method):
+        kind = 'read' if method in SAFE_METHODS else 'write'
+        if kind not in self.pools:
+            size = read_threads() if kind == 'read' else write_threads()
+            self.pools[kind] = ThreadPoolExecutor(
+                size, thread_name_prefix=f'asgi-{kind}')
+        return self.pools[kind]
+
+    async def __call__(self, scope, receive, send):
+        if scope['type'] == 'lifespan':
+            await self.lifespan(receive, send)
+        elif scope['type'] == 'http':
+            await self.http(scope, receive, send)
+        else:
+            raise ValueError(f'Unsupported ASGI scope {scope["type"]!r}.')
+
+    async def lifespan(self, receive, send):
+        while True:
+            message = await receive()
+            if message['type'] == 'lifespan.startup':
+                await send({'type': 'lifespan.startup.complete'})
+            elif message['type'] == 'lifespan.shutdown':
+                for pool in self.pools.values():
+                    pool.shutdown(wait=False)
+                await send({'type': 'lifespan.shutdown.complete'})
+                return
+
+    async def read_body(self, scope, receive):
+        """The request body in a temporary file, None if the client
+        disconnected. Raises BodyTooLarge past ``max_body_bytes()``."""
+        limit = max_body_bytes()
+        for name, value in scope.get('headers', []):
+            if name.lower() == b'content-length' and value.isdigit() \
+                    and int(value) > limit:
+                raise BodyTooLarge
+        body = tempfile.SpooledTemporaryFile(
+            settings.FILE_UPLOAD_MAX_MEMORY_SIZE)
+        size = 0
+        try:
+            while True:
+                message = await receive()
+                if message['type'] == 'http.disconnect':
+                    body.close()
+                    return None
+                chunk = message.get('body', b'')
+                size += len(chunk)
+                if size > limit:
+                    raise BodyTooLarge
+                body.write(chunk)
+                if not message.get('more_body'):
+                    return body
+        except BaseException:
+            body.close()
+            raise
+
+    async def run(self, pool, function, *args):
+        loop = asyncio.get_running_loop()
+        return await loop.run_in_executor(
+            pool, contextvars.Context().run, function, *args)
+
+    def respond(self, environ):
+        """Run the WSGI application, return status, headers and the body
+        if it is already in memory."""
+        started = {}
+
+        def start_response(status, headers, exc_info=None):
+            started['status'], started['headers'] = status, headers
+
+        response = self.wsgi_application(environ, start_response)
+        body = None
+        if not getattr(response, 'streaming', False):
+            try:
+                body = b''.join(response)
+            finally:
+                response.close()
+        return started['status'], started['headers'], response, body
+
+    async def http(self, scope, receive, send):
+        try:
+            body = await self.read_body(scope, receive)
+        except BodyTooLarge:
+            await send({'type': 'http.response.start', 'status': 413,
+                        'headers': [(b'content-type', b'text/plain')]})
+            await send({'type': 'http.response.body',
+                        'body': b'Request body too large'})
+            return
+        if body is None:
+            return
+        with body:
+            await self.respond_to(scope, body, send)
+
+    async def respond_to(self, scope, body, send):
+        pool = self.pool(scope['method'])
+        status, headers, response, content = await self.run(
+            pool, self.respond, environ_for(scope, body))
+        await send({
+            'type': 'http.response.start',
+            'status': int(status.split(' ', 1)[0]),
+            'headers': [(name.lower().encode('latin-1'),
+                         value.encode('latin-1')) for name, value in headers],
+        })
+        if content is not None:
+            await send({'type': 'http.response.body', 'body': content})
+            return
+        chunks = iter(response)
+        try:
+            while True:
+                chunk = await self.run(pool, next, chunks, None)
+                if chunk is None:
+                    break
+                await send({'type': 'http.response.body', 'body': chunk,
+                            'more_body': True})
+            await send({'type': 'http.response.body'})
+        finally:
+            await self.run(pool, response.close)
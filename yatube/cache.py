@@ -0,0 +1,330 @@
+"""Cross-process cache backend stored in a local SQLite file.
+
+Every gunicorn worker opens the same database, so an invalidation made by
+one worker is seen by all of them and no external server is needed. Each
+process keeps a small LRU of raw values in front of SQLite; it is dropped
+whenever ``PRAGMA data_version`` reports that another connection committed
+a change, which keeps the LRU coherent at the price of one cheap pragma per
+read.
+
+Integers are stored as SQLite integers so ``incr``/``decr`` run as an
+in-place UPDATE inside an immediate transaction; everything else is
+pickled. When the table grows
+past ``MAX_ENTRIES`` the expired rows and then the oldest written
+``1 / CULL_FREQUENCY`` of the rows are removed.
+
+Hit and miss counters are kept per process and flushed every
+``METRICS_INTERVAL`` seconds to a separate ``<LOCATION>.metrics`` file so
+that writing them does not invalidate the LRUs. ``manage.py cache_stats``
+prints them.
+
+    CACHES = {
+        'default': {
+            'BACKEND': 'yatube.cache.SQLiteCache',
+            'LOCATION': '/var/tmp/yatube-cache.sqlite3',
+            'OPTIONS': {'MAX_ENTRIES': 50000, 'LRU_SIZE': 2000},
+        }
+    }
+"""
+import os
+import pickle
+import sqlite3
+import threading
+import time
+from collections import OrderedDict
+
+from django.core.cache.backends.base import BaseCache, DEFAULT_TIMEOUT
+
+SCHEMA = (
+    'CREATE TABLE IF NOT EXISTS cache ('
+    ' key TEXT PRIMARY KEY, value BLOB, expires REAL, stored REAL NOT NULL)',
+    'CREATE INDEX IF NOT EXISTS cache_expires ON cache (expires)',
+    'CREATE INDEX IF NOT EXISTS cache_stored ON cache (stored)',
+)
+METRICS_SCHEMA = (
+    'CREATE TABLE IF NOT EXISTS metrics ('
+    ' pid INTEGER PRIMARY KEY, lru_hits INTEGER, hits INTEGER,'
+    ' misses INTEGER, updated REAL)',
+)
+CULL_CHECK_EVERY = 64
+
+
+def _connect(path, schema):
+    connection = sqlite3.connect(path, timeout=30, isolation_level=None,
+                                 check_same_thread=False)
+    connection.execute('PRAGMA journal_mode=WAL')
+    connection.execute('PRAGMA synchronous=NORMAL')
+    for statement in schema:
+        connection.execute(statement)
+    return connection
+
+
+def _dump(value):
+    if type(value) is int and -2 ** 63 <= value < 2 ** 63:
+        return value
+    return sqlite3.Binary(pickle.dumps(value, pickle.HIGHEST_PROTOCOL))
+
+
+def _load(raw):
+    if isinstance(raw, int):
+        return raw
+    return pickle.loads(raw)
+
+
+class SQLiteCache(BaseCache):
+
+    def __init__(self, location, params):
+        super().__init__(params)
+        options = params.get('OPTIONS', {})
+        self.path = location
+        self.lru_size = int(options.get('LRU_SIZE', 1000))
+        self.metrics_interval = float(options.get('METRICS_INTERVAL', 10))
+        self._local = threading.local()
+        self._lock = threading.Lock()
+        self._lru = OrderedDict()
+        self._writes = 0
+        self._pid = None
+        self._reset_metrics()
+
+    # Connections and bookkeeping.
+
+    def _reset_metrics(self):
+        self.metrics = {'lru_hits': 0, 'hits': 0, 'misses': 0}
+        self._flushed = time.monotonic()
+
+    def _check_fork(self):
+        pid = os.getpid()
+        if pid != self._pid:
+            # A forked worker must not share the parent's connections, LRU
+            # or counters.
+            self._pid = pid
+            self._local = threading.local()
+            self._lru.clear()
+            self._reset_metrics()
+
+    @property
+    def _db(self):
+        self._check_fork()
+        connection = getattr(self._local, 'connection', None)
+        if connection is None:
+            connection = _connect(self.path, SCHEMA)
+            self._local.connection = connection
+        return connection
+
+    def _validate_lru(self):
+        # data_version is per connection and only moves when another
+        # connection commits, so every thread checks its own.
+        version = self._db.execute('PRAGMA data_version').fetchone()[0]
+        if getattr(self._local, 'data_version', version) != version:
+            with self._lock:
+                self._lru.clear()
+        self._local.data_version = version
+
+    def _remember(self, key, raw, expires):
+        if not self.lru_size:
+            return
+        with self._lock:
+            self._lru[key] = (raw, expires)
+            self._lru.move_to_end(key)
+            while len(self._lru) > self.lru_size:
+                self._lru.popitem(last=False)
+
+    def _forget(self, *keys):
+        with self._lock:
+            for key in keys:
+                self._lru.pop(key, None)
+
+    def _count(self, name, value=1):
+        self.metrics[name] += value
+        if time.monotonic() - self._flushed >= self.metrics_interval:
+            self.flush_metrics()
+
+    def flush_metrics(self):
+        self._check_fork()
+        connection = _connect(f'{self.path}.metrics', METRICS_SCHEMA)
+        try:
+            connection.execute(
+                'INSERT OR REPLACE INTO metrics VALUES (?, ?, ?, ?, ?)',
+                (self._pid, self.metrics['lru_hits'], self.metrics['hits'],
+                 self.metrics['misses'], time.time()))
+        finally:
+            connection.close()
+        self._flushed = time.monotonic()
+
+    def worker_metrics(self):
+        """Return the last flushed counters of every worker process."""
+        connection = _connect(f'{self.path}.metrics', METRICS_SCHEMA)
+        try:
+            rows = connection.execute(
+                'SELECT pid, lru_hits, hits, misses, updated FROM metrics '
+                'ORDER BY pid').fetchall()
+        finally:
+            connection.close()
+        return [dict(zip(('pid', 'lru_hits', 'hits', 'misses', 'updated'),
+                         row)) for row in rows]
+
+    def _cull(self):
+        self._writes += 1
+        if self._writes % CULL_CHECK_EVERY:
+            return
+        db = self._db
+        db.execute('DELETE FROM cache WHERE expires <= ?', (time.time(),))
+        count = db.execute('SELECT COUNT(*) FROM cache').fetchone()[0]
+        if count > self._max_entries:
+            victims = count // self._cull_frequency if self._cull_frequency \
+                else count
+            db.execute('DELETE FROM cache WHERE key IN (SELECT key FROM cache'
+                       ' ORDER BY stored LIMIT ?)', (victims,))
+
+    # Cache API.
+
+    def _lookup(self, keys):
+        """Return ``{key: raw}`` for the live entries among ``keys``."""
+        self._validate_lru()
+        now = time.time()
+        found = {}
+        missing = []
+        with self._lock:
+            for key in keys:
+                entry = self._lru.get(key)
+                if entry is not None and (entry[1] is None or entry[1] > now):
+                    self._lru.move_to_end(key)
+                    found[key] = entry[0]
+                else:
+                    missing.append(key)
+        self._count('lru_hits', len(found))
+        for start in range(0, len(missing), 500):
+            chunk = missing[start:start + 500]
+            rows = self._db.execute(
+                'SELECT key, value, expires FROM cache WHERE key IN (%s) '
+                'AND (expires IS NULL OR expires > ?)'
+                % ', '.join('?' * len(chunk)), (*chunk, now)).fetchall()
+            for key, raw, expires in rows:
+                found[key] = raw
+                self._remember(key, raw, expires)
+            self._count('hits', len(rows))
+            self._count('misses', len(chunk) - len(rows))
+        return found
+
+    def get(self, key, default=None, version=None):
+        key = self.make_key(key, version=version)
+        self.validate_key(key)
+        found = self._lookup([key])
+        return _load(found[key]) if key in found else default
+
+    def get_many(self, keys, version=None):
+        mapping = {self.make_key(key, version=version): key for key in keys}
+        for key in mapping:
+            self.validate_key(key)
+        found = self._lookup(list(mapping))
+        return {mapping[key]: _load(raw) for key, raw in found.items()}
+
+    def set(self, key, value, timeout=DEFAULT_TIMEOUT, version=None):
+        self.set_many({key: value}, timeout, version)
+
+    def set_many(self, data, timeout=DEFAULT_TIMEOUT, version=None):
+        expires = self.get_backend_timeout(timeout)
+        now = time.time()
+        rows = []
+        for key, value in data.items():
+            key = self.make_key(key, version=version)
+            self.validate_key(key)
+            rows.append((key, _dump(value), expires, now))
+        db = self._db
+        db.execute('BEGIN IMMEDIATE')
+        try:
+            db.executemany('INSERT OR REPLACE INTO cache VALUES (?, ?, ?, ?)',
+                           rows)
+            self._cull()
+            db.execute('COMMIT')
+        except BaseException:
+            db.execute('ROLLBACK')
+            raise
+        self._validate_lru()
+        for key, raw, expires, _ in rows:
+            self._remember(key, raw, expires)
+        return []
+
+    def add(self, key, value, timeout=DEFAULT_TIMEOUT, version=None):
+        key = self.make_key(key, version=version)
+        self.validate_key(key)
+        raw, expires = _dump(value), self.get_backend_timeout(timeout)
+        db = self._db
+        db.execute('BEGIN IMMEDIATE')
+        try:
+            db.execute('DELETE FROM cache WHERE key = ? AND expires <= ?',
+                       (key, time.time()))
+            added = db.execute(
+                'INSERT OR IGNORE INTO cache VALUES (?, ?, ?, ?)',
+                (key, raw, expires, time.time())).rowcount == 1
+            db.execute('COMMIT')
+        except BaseException:
+            db.execute('ROLLBACK')
+            raise
+        if added:
+            self._validate_lru()
+            self._remember(key, raw, expires)
+        return added
+
+    def touch(self, key, timeout=DEFAULT_TIMEOUT, version=None):
+        key = self.make_key(key, version=version)
+        self.validate_key(key)
+        touched = self._db.execute(
+            'UPDATE cache SET expires = ? WHERE key = ? '
+            'AND (expires IS NULL OR expires > ?)',
+            (self.get_backend_timeout(timeout), key, time.time())).rowcount
+        self._forget(key)
+        return bool(touched)
+
+    def incr(self, key, delta=1, version=None):
+        key = self.make_key(key, version=version)
+        self.validate_key(key)
+        db = self._db
+        db.execute('BEGIN IMMEDIATE')
+        try:
+            row = db.execute(
+                'SELECT value FROM cache WHERE key = ? '
+                'AND (expires IS NULL OR expires > ?)',
+                (key, time.time())).fetchone()
+            if row is None:
+                raise ValueError(f"Key '{key}' not found")
+            if isinstance(row[0], int):
+                db.execute('UPDATE cache SET value = value + ? WHERE key = ?',
+                           (delta, key))
+                value = row[0] + delta
+            else:
+                value = _load(row[0]) + delta
+                db.execute('UPDATE cache SET value = ? WHERE key = ?',
+                           (_dump(value), key))
+            db.execute('COMMIT')
+        except BaseException:
+            db.execute('ROLLBACK')
+            raise
+        self._forget(key)
+        return value
+
+    def delete(self, key, version=None):
+        self.delete_many([key], version)
+
+    def delete_many(self, keys, version=None):
+        keys = [self.make_key(key, version=version) for key in keys]
+        for key in keys:
+            self.validate_key(key)
+        self._db.executemany('DELETE FROM cache WHERE key = ?',
+                             [(key,) for key in keys])
+        self._forget(*keys)
+
+    def has_key(self, key, version=None):
+        key = self.make_key(key, version=version)
+        self.validate_key(key)
+        return key in self._lookup([key])
+
+    def clear(self):
+        self._db.execute('DELETE FROM cache')
+        with self._lock:
+            self._lru.clear()
+
+    def close(self, **kwargs):
+        # Connections are reused for the life of the worker, like
+        # persistent database connections.
+        pass
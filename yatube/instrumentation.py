@@ -0,0 +1,299 @@
+"""Per-view query budgets and latency histograms.
+
+``QueryBudgetMiddleware`` measures every request by the URL name it
+resolved to (``index``, ``profile``, ``post-list``...): number of queries
+and time spent in SQL, counted with a ``connection.execute_wrapper`` on
+every database alias, template render time, measured by the
+``DjangoTemplates`` backend below, and total latency. Each process keeps
+bucketed histograms in memory and copies them to the shared cache every
+``QUERY_STATS_FLUSH_INTERVAL`` seconds; ``manage.py query_stats`` merges
+the copies of all workers.
+
+``QUERY_BUDGETS`` maps URL names to the number of queries a request may
+run. Writes are measured and budgeted apart from the reads of their URL,
+under the URL name followed by the method, e.g. ``'follow-list POST'``;
+a write without an entry has no budget. A request over its budget is
+logged, or raises ``QueryBudgetExceeded`` when ``QUERY_BUDGET_RAISE`` is
+set, which is meant for tests and development.
+"""
+import logging
+import os
+import threading
+import time
+from contextlib import ExitStack
+from contextvars import ContextVar
+
+from django.conf import settings
+from django.core.cache import cache
+from django.db import connections
+from django.template.backends import django as django_backend
+from django.template.exceptions import TemplateDoesNotExist
+
+logger = logging.getLogger(__name__)
+
+READ_METHODS = ('GET', 'HEAD', 'OPTIONS')
+
+UNRESOLVED = '<unresolved>'
+PIDS_KEY = 'query_stats:pids'
+BUCKETS = {
+    'queries': (0, 1, 2, 3, 5, 10, 20, 50, 100),
+    'sql_ms': (1, 2, 5, 10, 25, 50, 100, 250, 1000),
+    'render_ms': (1, 2, 5, 10, 25, 50, 100, 250, 1000),
+    'total_ms': (5, 10, 25, 50, 100, 250, 500, 1000, 2500),
+}
+
+_current = ContextVar('query_budget_measure', default=None)
+
+
+class QueryBudgetExceeded(Exception):
+    pass
+
+
+def flush_interval():
+    return getattr(settings, 'QUERY_STATS_FLUSH_INTERVAL', 10)
+
+
+def budget_name(view_name, method):
+    """``view_name`` for reads, ``'view_name METHOD'`` for writes."""
+    if method in READ_METHODS:
+        return view_name
+    return f'{view_name} {method}'
+
+
+def budget_for(name):
+    return getattr(settings, 'QUERY_BUDGETS', {}).get(name)
+
+
+def stats_key(pid):
+    return f'query_stats:{pid}'
+
+
+class Histogram:
+    """Counts of values per bucket; the last bucket is unbounded."""
+
+    def __init__(self, bounds, counts=None, total=0.0, peak=0.0):
+        self.bounds = tuple(bounds)
+        self.counts = list(counts or [0] * (len(bounds) + 1))
+        self.total = total
+        self.peak = peak
+
+    @property
+    def count(self):
+        return sum(self.counts)
+
+    def add(self, value):
+        index = len(self.bounds)
+        for position, bound in enumerate(self.bounds):
+            if value <= bound:
+                index = position
+                break
+        self.counts[index] += 1
+        self.total += value
+        self.peak = max(self.peak, value)
+
+    def merge(self, other):
+        self.counts = [a + b for a, b in zip(self.counts, other.counts)]
+        self.total += other.total
+        self.peak = max(self.peak, other.peak)
+
+    def percentile(self, fraction):
+        """Upper bound of the bucket holding the given fraction of values."""
+        wanted = fraction * self.count
+        seen = 0
+        for bound, count in zip(self.bounds, self.counts):
+            seen += count
+            if count and seen >= wanted:
+                return min(bound, self.peak)
+        return self.peak
+
+    def mean(self):
+        return self.total / self.count if self.count else 0.0
+
+    def as_dict(self):
+        return {'bounds': self.bounds, 'counts': self.counts,
+                'total': self.total, 'peak': self.peak}
+
+    @classmethod
+    def from_dict(cls, data):
+        return cls(data['bounds'], data['counts'], data['total'],
+                   data['peak'])
+
+
+class ViewStats:
+
+    def __init__(self, histograms=None, over_budget=0):
+        self.histograms = histograms or {
+            name: Histogram(bounds) for name, bounds in BUCKETS.items()}
+        self.over_budget = over_budget
+
+    def add(self, measure):
+        for name, histogram in self.histograms.items():
+            histogram.add(getattr(measure, name))
+
+    def merge(self, other):
+        for name, histogram in self.histograms.items():
+            histogram.merge(other.histograms[name])
+        self.over_budget += other.over_budget
+
+    def as_dict(self):
+        return {'over_budget': self.over_budget,
+                'histograms': {name: histogram.as_dict() for name, histogram
+                               in self.histograms.items()}}
+
+    @classmethod
+    def from_dict(cls, data):
+        return cls({name: Histogram.from_dict(histogram) for name, histogram
+                    in data['histograms'].items()}, data['over_budget'])
+
+
+class Measure:
+    """What one request spent, filled in while it runs."""
+
+    def __init__(self):
+        self.started = time.perf_counter()
+        self.queries = 0
+        self.sql = 0.0
+        self.render = 0.0
+        self.render_depth = 0
+        self.total = 0.0
+
+    @property
+    def sql_ms(self):
+        return self.sql * 1000
+
+    @property
+    def render_ms(self):
+        return self.render * 1000
+
+    @property
+    def total_ms(self):
+        return self.total * 1000
+
+    def __call__(self, execute, sql, params, many, context):
+        start = time.perf_counter()
+        try:
+            return execute(sql, params, many, context)
+        finally:
+            self.queries += 1
+            self.sql += time.perf_counter() - start
+
+
+class Recorder:
+    """The histograms of this process."""
+
+    def __init__(self):
+        self.views = {}
+        self.lock = threading.Lock()
+        self.pid = os.getpid()
+        self.flushed = time.monotonic()
+
+    def record(self, view_name, measure, over_budget):
+        with self.lock:
+            if os.getpid() != self.pid:
+                # Forked worker: start from empty histograms.
+                self.views, self.pid = {}, os.getpid()
+            stats = self.views.setdefault(view_name, ViewStats())
+            stats.add(measure)
+            stats.over_budget += over_budget
+            due = time.monotonic() - self.flushed >= flush_interval()
+        if due:
+            self.flush()
+
+    def flush(self):
+        with self.lock:
+            snapshot = {name: stats.as_dict()
+                        for name, stats in self.views.items()}
+            self.flushed = time.monotonic()
+        cache.set(stats_key(self.pid), snapshot, None)
+        pids = cache.get(PIDS_KEY) or []
+        if self.pid not in pids:
+            cache.set(PIDS_KEY, pids + [self.pid], None)
+
+    def reset(self):
+        with self.lock:
+            self.views = {}
+
+
+recorder = Recorder()
+
+
+def collected():
+    """Merge the flushed histograms of every process by view name."""
+    pids = cache.get(PIDS_KEY) or []
+    merged = {}
+    for snapshot in cache.get_many([stats_key(pid) for pid in pids]).values():
+        for name, data in snapshot.items():
+            stats = ViewStats.from_dict(data)
+            if name in merged:
+                merged[name].merge(stats)
+            else:
+                merged[name] = stats
+    return merged
+
+
+def clear_collected():
+    pids = cache.get(PIDS_KEY) or []
+    cache.delete_many([stats_key(pid) for pid in pids] + [PIDS_KEY])
+    recorder.reset()
+
+
+class QueryBudgetMiddleware:
+
+    def __init__(self, get_response):
+        self.get_response = get_response
+
+    def __call__(self, request):
+        measure = Measure()
+        token = _current.set(measure)
+        try:
+            with ExitStack() as stack:
+                for connection in connections.all():
+                    stack.enter_context(connection.execute_wrapper(measure))
+                response = self.get_response(request)
+        finally:
+            _current.reset(token)
+        measure.total = time.perf_counter() - measure.started
+        match = getattr(request, 'resolver_match', None)
+        view_name = budget_name(
+            match.view_name if match and match.view_name else UNRESOLVED,
+            request.method)
+        budget = budget_for(view_name)
+        over_budget = budget is not None and measure.queries > budget
+        recorder.record(view_name, measure, over_budget)
+        if over_budget:
+            message = (f'{view_name} ran {measure.queries} queries, '
+                       f'over its budget of {budget}')
+            if getattr(settings, 'QUERY_BUDGET_RAISE', False):
+                raise QueryBudgetExceeded(message)
+            logger.warning(message)
+        return response
+
+
+class Template(django_backend.Template):
+
+    def render(self, context=None, request=None):
+        measure = _current.get()
+        if measure is None:
+            return super().render(context, request)
+        # Included and nested renders are part of the outermost one.
+        measure.render_depth += 1
+        start = time.perf_counter()
+        try:
+            return super().render(context, request)
+        finally:
+            measure.render_depth -= 1
+            if not measure.render_depth:
+                measure.render += time.perf_counter() - start
+
+
+class DjangoTemplates(django_backend.DjangoTemplates):
+    """The Django template backend with render time measured."""
+
+    def from_string(self, template_code):
+        return Template(self.engine.from_string(template_code), self)
+
+    def get_template(self, template_name):
+        try:
+            return Template(self.engine.get_template(template_name), self)
+        except TemplateDoesNotExist as exc:
+            django_backend.reraise(exc, self)
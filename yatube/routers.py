@@ -0,0 +1,150 @@
+"""Read replica routing.
+
+Writes always go to ``default``. Reads go to one of the aliases listed in
+``DATABASE_REPLICAS`` only while a read-only view runs: a function view
+decorated with ``replica_reads`` or a viewset using ``ReplicaReadsMixin``,
+and only for GET, HEAD and OPTIONS. Everything else, including the session
+and user lookups done before the view, reads from the primary.
+
+A client that has just written reads from the primary for
+``REPLICA_STICKY_SECONDS`` so it sees its own post or comment even while
+the replicas lag: ``ReplicaStickinessMiddleware`` notices the write and
+marks the client with a cookie and, for signed in users, a cache key that
+also covers API clients without cookies.
+"""
+import random
+import time
+from contextlib import contextmanager
+from contextvars import ContextVar
+from functools import wraps
+
+from django.conf import settings
+from django.core.cache import cache
+from django.db import DEFAULT_DB_ALIAS
+
+SAFE_METHODS = ('GET', 'HEAD', 'OPTIONS')
+STICKY_COOKIE = 'primary_until'
+
+_reading_replica = ContextVar('reading_replica', default=False)
+_wrote = ContextVar('wrote_primary', default=False)
+
+
+def replica_aliases():
+    return list(getattr(settings, 'DATABASE_REPLICAS', ()))
+
+
+def sticky_seconds():
+    return getattr(settings, 'REPLICA_STICKY_SECONDS', 5)
+
+
+def sticky_key(user_id):
+    return f'replica:sticky:{user_id}'
+
+
+def reading_replica():
+    return _reading_replica.get() and bool(replica_aliases())
+
+
+def is_sticky(request):
+    try:
+        if float(request.COOKIES.get(STICKY_COOKIE, 0)) > time.time():
+            return True
+    except ValueError:
+        pass
+    user = getattr(request, 'user', None)
+    return bool(user is not None and user.is_authenticated
+                and cache.get(sticky_key(user.pk)))
+
+
+def may_read_replica(request):
+    return (request.method in SAFE_METHODS and bool(replica_aliases())
+            and not is_sticky(request))
+
+
+@contextmanager
+def replica(enabled=True):
+    """Route reads in the block to a replica, or to the primary."""
+    token = _reading_replica.set(enabled)
+    try:
+        yield
+    finally:
+        _reading_replica.reset(token)
+
+
+def replica_reads(view):
+    """Let a read-only function view read from a replica."""
+    @wraps(view)
+    def wrapped(request, *args, **kwargs):
+        if not may_read_replica(request):
+            return view(request, *args, **kwargs)
+        with replica():
+            return view(request, *args, **kwargs)
+    return wrapped
+
+
+class ReplicaReadsMixin:
+    """Let the safe methods of a DRF view read from a replica.
+
+    The decision is taken after authentication so that the stickiness of
+    token authenticated users is known.
+    """
+    _replica_token = None
+
+    def initial(self, request, *args, **kwargs):
+        super().initial(request, *args, **kwargs)
+        if may_read_replica(request):
+            self._replica_token = _reading_replica.set(True)
+
+    def finalize_response(self, request, response, *args, **kwargs):
+        if self._replica_token is not None:
+            _reading_replica.reset(self._replica_token)
+            self._replica_token = None
+        return super().finalize_response(request, response, *args, **kwargs)
+
+
+class ReplicaRouter:
+
+    def db_for_read(self, model, **hints):
+        replicas = replica_aliases()
+        if replicas and _reading_replica.get() and not _wrote.get():
+            return random.choice(replicas)
+        return DEFAULT_DB_ALIAS
+
+    def db_for_write(self, model, **hints):
+        _wrote.set(True)
+        return DEFAULT_DB_ALIAS
+
+    def allow_relation(self, obj1, obj2, **hints):
+        return True
+
+    def allow_migrate(self, db, app_label, model_name=None, **hints):
+        # Replicas are copies of the primary and never migrated themselves.
+        if db in replica_aliases():
+            return False
+        return None
+
+
+class ReplicaStickinessMiddleware:
+    """Send a client that wrote during this request to the primary."""
+
+    def __init__(self, get_response):
+        self.get_response = get_response
+
+    def __call__(self, request):
+        token = _wrote.set(False)
+        try:
+            response = self.get_response(request)
+            if _wrote.get() and replica_aliases():
+                self.stick(request, response)
+            return response
+        finally:
+            _wrote.reset(token)
+
+    def stick(self, request, response):
+        seconds = sticky_seconds()
+        until = time.time() + seconds
+        response.set_cookie(STICKY_COOKIE, f'{until:.3f}', max_age=seconds,
+                            httponly=True, samesite='Lax')
+        user = getattr(request, 'user', None)
+        if user is not None and user.is_authenticated:
+            cache.set(sticky_key(user.pk), until, seconds)
@@ -47,8 +47,8 @@ INSTALLED_APPS = [
     'django.contrib.contenttypes',
     'django.contrib.sessions',
     'django.contrib.messages',
+    'whitenoise.runserver_nostatic',
     'django.contrib.staticfiles',
-    'debug_toolbar',
     'sorl.thumbnail',
     'django_extensions',
     'rest_framework',
@@ -78,35 +78,64 @@ REST_FRAMEWORK = {
     },
 
     'DEFAULT_FILTER_BACKENDS':
-        ['django_filters.rest_framework.DjangoFilterBackend']
+        ['django_filters.rest_framework.DjangoFilterBackend'],
+
+    'DEFAULT_PAGINATION_CLASS': 'api.pagination.KeysetPagination',
+    'PAGE_SIZE': 20,
 }
 
+API_MAX_PAGE_SIZE = int(os.environ.get('API_MAX_PAGE_SIZE', 100))
+API_BULK_MAX_ITEMS = int(os.environ.get('API_BULK_MAX_ITEMS', 100))
+
+# Feed pages render their first cards and load the rest while scrolling,
+# see posts.lite_feed.
+FEED_LITE = strtobool(os.getenv('FEED_LITE', 'no'))
+FEED_LITE_FIRST_CARDS = int(os.getenv('FEED_LITE_FIRST_CARDS', 5))
+
+# Comments shown with a post and loaded per "Показать ещё", see
+# posts.comment_thread.
+COMMENTS_FIRST_PAGE = int(os.getenv('COMMENTS_FIRST_PAGE', 20))
+COMMENTS_PAGE_SIZE = int(os.getenv('COMMENTS_PAGE_SIZE', 50))
+
+# Threads of yatube.asgi running the views: safe methods and the others.
+ASGI_READ_THREADS = int(os.environ.get('ASGI_READ_THREADS', 8))
+ASGI_WRITE_THREADS = int(os.environ.get('ASGI_WRITE_THREADS', 1))
+
 SIMPLE_JWT = {
     'ACCESS_TOKEN_LIFETIME': timedelta(days=1),
     'REFRESH_TOKEN_LIFETIME': timedelta(days=1),
 }
 
 MIDDLEWARE = [
+    'yatube.instrumentation.QueryBudgetMiddleware',
     'django.middleware.security.SecurityMiddleware',
+    'whitenoise.middleware.WhiteNoiseMiddleware',
     'django.contrib.sessions.middleware.SessionMiddleware',
     'corsheaders.middleware.CorsMiddleware',
     'django.middleware.common.CommonMiddleware',
     'django.middleware.csrf.CsrfViewMiddleware',
     'django.contrib.auth.middleware.AuthenticationMiddleware',
+    'yatube.routers.ReplicaStickinessMiddleware',
     'django.contrib.messages.middleware.MessageMiddleware',
     'django.middleware.clickjacking.XFrameOptionsMiddleware',
-    "debug_toolbar.middleware.DebugToolbarMiddleware",
 ]
 
+# The toolbar renders SQL and settings into pages, development only.
+if DEBUG:
+    INSTALLED_APPS.append('debug_toolbar')
+    MIDDLEWARE.append('debug_toolbar.middleware.DebugToolbarMiddleware')
+
 CORS_ORIGIN_ALLOW_ALL = True
 CORS_URLS_REGEX = r'^/api/.*$'
 
 ROOT_URLCONF = 'yatube.urls'
 
+TEST_RUNNER = 'yatube.test_runner.TestRunner'
+
 TEMPLATES_DIR = os.path.join(BASE_DIR, 'templates')
 TEMPLATES = [
     {
-        'BACKEND': 'django.template.backends.django.DjangoTemplates',
+        'BACKEND': 'yatube.instrumentation.DjangoTemplates',
         'DIRS': [TEMPLATES_DIR],
         'APP_DIRS': True,
         'OPTIONS': {
@@ -128,11 +157,53 @@ WSGI_APPLICATION = 'yatube.wsgi.application'
 
 DATABASES = {
     'default': {
-        'ENGINE': 'django.db.backends.sqlite3',
+        'ENGINE': 'yatube.sqlite',
         'NAME': os.path.join(BASE_DIR, 'db.sqlite3'),
+        'CONN_MAX_AGE': 600,
     }
 }
 
+
+def _replicas(names):
+    """Aliases and settings of the replica files ``names``."""
+    return {f'replica{index}': {**DATABASES['default'], 'NAME': name,
+                                'TEST': {'MIRROR': 'default'}}
+            for index, name in enumerate(filter(None, names.split(',')), 1)}
+
+
+# Comma separated SQLite files serving as read replicas, e.g. copies kept
+# fresh with "manage.py sync_replicas".
+DATABASES.update(_replicas(os.environ.get('DATABASE_REPLICAS', '')))
+DATABASE_REPLICAS = [alias for alias in DATABASES if alias != 'default']
+
+DATABASE_ROUTERS = ['yatube.routers.ReplicaRouter']
+REPLICA_STICKY_SECONDS = 5
+
+# Queries a request to each URL name may run, see yatube.instrumentation.
+QUERY_BUDGETS = {
+    'index': 10,
+    'group': 10,
+    'profile': 10,
+    'post': 12,
+    'follow_index': 12,
+    'search': 10,
+    'post-list': 6,
+    'post-detail': 6,
+    'comment-list': 6,
+    'group-list': 4,
+    'follow-list': 4,
+    # Writes, keyed by URL name and method.
+    'new_post POST': 20,
+    'post_edit POST': 14,
+    'add_comment POST': 10,
+    'post-list POST': 16,
+    'comment-list POST': 10,
+    'follow-list POST': 20,
+    'post-bulk POST': 20,
+    'comment-bulk POST': 14,
+}
+QUERY_BUDGET_RAISE = strtobool(os.getenv('QUERY_BUDGET_RAISE', 'no'))
+
 # Password validation
 # https://docs.djangoproject.com/en/2.2/ref/settings/#auth-password-validators
 
@@ -173,9 +244,30 @@ STATIC_ROOT = os.path.join(BASE_DIR, 'static/')
 
 STATICFILES_DIRS = [os.path.join(BASE_DIR, 'posts/static/')]
 
+# Hashed names and gzip/brotli copies served by WhiteNoise, see
+# yatube.storage.
+STATICFILES_STORAGE = 'yatube.storage.StaticFilesStorage'
+
 MEDIA_URL = '/media/'
 
 MEDIA_ROOT = os.path.join(BASE_DIR, 'media/')
+DEFAULT_FILE_STORAGE = 'yatube.storage.MediaStorage'
+
+# Uploads always go to a temporary file, see posts.uploads.
+FILE_UPLOAD_HANDLERS = [
+    'posts.uploads.SizeLimitUploadHandler',
+    'django.core.files.uploadhandler.TemporaryFileUploadHandler',
+]
+IMAGE_UPLOAD_MAX_BYTES = int(os.getenv('IMAGE_UPLOAD_MAX_BYTES',
+                                       10 * 1024 * 1024))
+IMAGE_UPLOAD_MAX_PIXELS = int(os.getenv('IMAGE_UPLOAD_MAX_PIXELS',
+                                        25_000_000))
+IMAGE_UPLOAD_MAX_SIDE = int(os.getenv('IMAGE_UPLOAD_MAX_SIDE', 2048))
+
+# Responsive copies of post images, see posts.image_variants.
+IMAGE_VARIANT_WIDTHS = (320, 480, 640, 960)
+IMAGE_VARIANT_FORMATS = os.getenv('IMAGE_VARIANT_FORMATS',
+                                  'webp,jpeg').split(',')
 
 INTERNAL_IPS = [
     "127.0.0.1",
@@ -185,9 +277,16 @@ LOGIN_REDIRECT_URL = '/'
 
 SITE_ID = 1
 
+# Test runs use a temporary cache file instead, see yatube.test_runner.
 CACHES = {
     'default': {
-        'BACKEND': 'django.core.cache.backends.locmem.LocMemCache',
+        'BACKEND': 'yatube.cache.SQLiteCache',
+        'LOCATION': os.getenv('CACHE_LOCATION',
+                              os.path.join(BASE_DIR, 'cache.sqlite3')),
+        'OPTIONS': {
+            'MAX_ENTRIES': 50000,
+            'LRU_SIZE': 2000,
+        },
     }
 }
 
@@ -0,0 +1,34 @@
+"""SQLite backend tuned for serving requests.
+
+Every new connection switches the database to WAL, so readers no longer
+wait for a writer, and sets the pragmas below; ``DATABASES[...]['PRAGMAS']``
+overrides them. Transactions start with ``BEGIN IMMEDIATE``: a transaction
+that only took its write lock at its first write could find another writer
+committed in between and fail with "database is locked" at once, whereas
+taking the lock up front waits for ``busy_timeout`` instead.
+"""
+from django.db.backends.sqlite3 import base
+
+PRAGMAS = {
+    'journal_mode': 'WAL',
+    'synchronous': 'NORMAL',
+    'busy_timeout': 5000,
+    'cache_size': -64000,
+    'mmap_size': 256 * 1024 * 1024,
+    'temp_store': 'MEMORY',
+}
+
+
+class DatabaseWrapper(base.DatabaseWrapper):
+
+    def pragmas(self):
+        return {**PRAGMAS, **self.settings_dict.get('PRAGMAS', {})}
+
+    def get_new_connection(self, conn_params):
+        connection = super().get_new_connection(conn_params)
+        for name, value in self.pragmas().items():
+            connection.execute(f'PRAGMA {name} = {value}')
+        return connection
+
+    def _start_transaction_under_autocommit(self):
+        self.cursor().execute('BEGIN IMMEDIATE')
@@ -0,0 +1,75 @@
+"""Serialized, retried write requests.
+
+SQLite has a single writer. ``serialized_write`` runs an unsafe request in
+one ``BEGIN IMMEDIATE`` transaction, so its writes queue behind the current
+writer for up to ``busy_timeout``, and replays the whole request with a
+jittered backoff if the lock still could not be taken. Running it in one
+transaction is what makes the replay safe: nothing of a failed attempt is
+kept. Files are not part of the transaction, so the uploads an attempt
+stored through yatube.storage.MediaStorage are deleted when it rolls back.
+"""
+import random
+import time
+from contextvars import ContextVar
+from functools import wraps
+
+from django.conf import settings
+from django.db import OperationalError, transaction
+
+LOCKED = 'database is locked'
+UNSAFE_METHODS = ('POST', 'PUT', 'PATCH', 'DELETE')
+
+
+_saved_files = ContextVar('saved_files', default=None)
+
+
+def file_saved(storage, name):
+    """Record a file stored by the current write attempt, if any."""
+    saved = _saved_files.get()
+    if saved is not None:
+        saved.append((storage, name))
+
+
+def write_attempts():
+    return getattr(settings, 'SQLITE_WRITE_ATTEMPTS', 5)
+
+
+def write_backoff():
+    return getattr(settings, 'SQLITE_WRITE_BACKOFF', 0.05)
+
+
+def _attempt(view, request, *args, **kwargs):
+    saved = []
+    token = _saved_files.set(saved)
+    try:
+        with transaction.atomic():
+            return view(request, *args, **kwargs)
+    except BaseException:
+        for storage, name in saved:
+            storage.delete(name)
+        raise
+    finally:
+        _saved_files.reset(token)
+
+
+def serialized_write(view=None, *, methods=UNSAFE_METHODS):
+    """Decorate a view writing on ``methods``; other requests run as is.
+
+    Views that write on GET, like the follow links, pass ``methods``.
+    """
+    if view is None:
+        return lambda view: serialized_write(view, methods=methods)
+
+    @wraps(view)
+    def wrapped(request, *args, **kwargs):
+        if request.method not in methods:
+            return view(request, *args, **kwargs)
+        attempts = write_attempts()
+        for attempt in range(attempts):
+            try:
+                return _attempt(view, request, *args, **kwargs)
+            except OperationalError as error:
+                if LOCKED not in str(error) or attempt == attempts - 1:
+                    raise
+            time.sleep(write_backoff() * 2 ** attempt * random.uniform(1, 2))
+    return wrapped
@@ -0,0 +1,36 @@
+"""Storages of the collected static files and of the uploads.
+
+``collectstatic`` stores every file under a name with a hash of its
+content, as ManifestStaticFilesStorage does, and writes gzip and, when the
+Brotli package is installed, brotli copies next to it. WhiteNoise serves
+the compressed copy the browser accepts, and since a hashed name never
+changes content, with ``Cache-Control: max-age=315360000, public,
+immutable``.
+
+``MediaStorage`` reports the uploads it stores to
+yatube.sqlite.transactions, which deletes them again when the write
+request that stored them is rolled back.
+"""
+from django.core.files.storage import FileSystemStorage
+from whitenoise.storage import CompressedManifestStaticFilesStorage
+
+from .sqlite import transactions
+
+
+class StaticFilesStorage(CompressedManifestStaticFilesStorage):
+
+    def stored_name(self, name):
+        try:
+            return super().stored_name(name)
+        except ValueError:
+            # Not collected yet, e.g. in tests or before the first
+            # collectstatic of a checkout: link the plain name.
+            return name
+
+
+class MediaStorage(FileSystemStorage):
+
+    def _save(self, name, content):
+        name = super()._save(name, content)
+        transactions.file_saved(self, name)
+        return name
@@ -0,0 +1,40 @@
+"""Test runs with a cache of their own.
+
+The tests clear the cache, so ``TestRunner``, the ``TEST_RUNNER`` of
+"manage.py test", and the pytest ``conftest.py`` point ``CACHES`` to a file
+in a temporary directory instead of the one of the dev server.
+"""
+import os
+import shutil
+import tempfile
+from contextlib import ExitStack, contextmanager
+
+from django.conf import settings
+from django.test.runner import DiscoverRunner
+from django.test.utils import override_settings
+
+
+@contextmanager
+def temporary_cache():
+    directory = tempfile.mkdtemp(prefix='yatube-test-cache-')
+    location = os.path.join(directory, 'cache.sqlite3')
+    caches = {**settings.CACHES,
+              'default': {**settings.CACHES['default'],
+                          'LOCATION': location}}
+    try:
+        with override_settings(CACHES=caches):
+            yield location
+    finally:
+        shutil.rmtree(directory, ignore_errors=True)
+
+
+class TestRunner(DiscoverRunner):
+
+    def setup_test_environment(self, **kwargs):
+        super().setup_test_environment(**kwargs)
+        self.cache = ExitStack()
+        self.cache.enter_context(temporary_cache())
+
+    def teardown_test_environment(self, **kwargs):
+        self.cache.close()
+        super().teardown_test_environment(**kwargs)
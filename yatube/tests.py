@@ -0,0 +1,482 @@
+import asyncio
+import json
+import multiprocessing
+import os
+import tempfile
+import threading
+import time
+from io import StringIO
+
+from django.conf import settings
+from django.contrib.auth.models import User
+from django.core.cache import cache
+from django.core.files.base import ContentFile
+from django.core.files.storage import default_storage
+from django.core.management import call_command
+from django.db import OperationalError, connection, connections
+from django.db.utils import ConnectionHandler
+from django.http import HttpResponse
+from django.templatetags.static import static
+from django.test import SimpleTestCase, TestCase, TransactionTestCase, \
+    Client, RequestFactory, override_settings
+from rest_framework.test import APIClient
+from rest_framework_simplejwt.tokens import AccessToken
+
+from posts.models import Post
+
+from . import instrumentation
+from .asgi_handler import ASGIHandler, environ_for
+from .cache import SQLiteCache
+from .sqlite.transactions import serialized_write
+
+
+def _incr_many(location, count):
+    cache = SQLiteCache(location, {})
+    for _ in range(count):
+        cache.incr('counter')
+
+
+class SQLiteCacheTest(SimpleTestCase):
+
+    def setUp(self) -> None:
+        self.dir = tempfile.TemporaryDirectory()
+        self.location = os.path.join(self.dir.name, 'cache.sqlite3')
+        self.cache = SQLiteCache(self.location, {})
+
+    def tearDown(self) -> None:
+        self.dir.cleanup()
+
+    def test_basic_operations(self):
+        self.cache.set('key', {'a': 1})
+        self.assertEqual(self.cache.get('key'), {'a': 1})
+        self.assertFalse(self.cache.add('key', 'other'))
+        self.assertTrue(self.cache.add('new', True))
+        self.assertIs(self.cache.get('new'), True)
+        self.assertEqual(self.cache.get_many(['key', 'missing']),
+                         {'key': {'a': 1}})
+        self.cache.delete('key')
+        self.assertIsNone(self.cache.get('key'))
+
+    def test_test_runs_use_their_own_file(self):
+        self.assertEqual(cache.path, settings.CACHES['default']['LOCATION'])
+        self.assertNotEqual(os.path.dirname(cache.path), settings.BASE_DIR)
+
+    def test_ttl(self):
+        self.cache.set('short', 1, timeout=0.05)
+        self.assertEqual(self.cache.get('short'), 1)
+        time.sleep(0.1)
+        self.assertIsNone(self.cache.get('short'))
+        self.assertTrue(self.cache.add('short', 2))
+
+    def test_other_process_sees_writes(self):
+        other = SQLiteCache(self.location, {})
+        self.cache.set('key', 'old')
+        self.assertEqual(other.get('key'), 'old')
+        self.cache.set('key', 'new')
+        self.assertEqual(other.get('key'), 'new')
+        self.cache.delete('key')
+        self.assertIsNone(other.get('key'))
+
+    def test_incr_is_atomic_across_processes(self):
+        self.cache.set('counter', 0)
+        workers = [multiprocessing.Process(target=_incr_many,
+                                           args=(self.location, 50))
+                   for _ in range(4)]
+        for worker in workers:
+            worker.start()
+        for worker in workers:
+            worker.join()
+        self.assertEqual(self.cache.get('counter'), 200)
+        with self.assertRaises(ValueError):
+            self.cache.incr('missing')
+
+    def test_size_bound(self):
+        cache = SQLiteCache(self.location, {'OPTIONS': {'MAX_ENTRIES': 10}})
+        for index in range(200):
+            cache.set(f'key{index}', index)
+        rows = cache._db.execute('SELECT COUNT(*) FROM cache').fetchone()[0]
+        self.assertLess(rows, 100)
+        self.assertEqual(cache.get('key199'), 199)
+
+    def test_metrics(self):
+        self.cache.set('key', 1)
+        self.cache.get('key')
+        other = SQLiteCache(self.location, {})
+        other.get('key')
+        other.get('missing')
+        self.assertEqual(self.cache.metrics['lru_hits'], 1)
+        self.assertEqual(other.metrics, {'lru_hits': 0, 'hits': 1,
+                                         'misses': 1})
+        other.flush_metrics()
+        self.assertEqual(self.cache.worker_metrics()[0]['hits'], 1)
+
+
+class SQLiteBackendTest(TestCase):
+
+    def test_pragmas(self):
+        with connection.cursor() as cursor:
+            cursor.execute('PRAGMA synchronous')
+            self.assertEqual(cursor.fetchone()[0], 1)
+            cursor.execute('PRAGMA busy_timeout')
+            self.assertEqual(cursor.fetchone()[0], 5000)
+
+    def test_concurrent_writers_wait_for_the_lock(self):
+        with tempfile.TemporaryDirectory() as directory:
+            settings = {'ENGINE': 'yatube.sqlite',
+                        'NAME': os.path.join(directory, 'db.sqlite3')}
+            handler = ConnectionHandler({'default': settings})
+            with handler['default'].cursor() as cursor:
+                cursor.execute('CREATE TABLE t (n INTEGER)')
+            handler['default'].close()
+            errors = []
+
+            def write():
+                db = handler['default']
+                try:
+                    # The way atomic() opens a transaction. A read comes
+                    # first: under a plain BEGIN the write that follows
+                    # fails once the other writer has committed.
+                    db._start_transaction_under_autocommit()
+                    with db.cursor() as cursor:
+                        cursor.execute('SELECT COUNT(*) FROM t')
+                        time.sleep(0.2)
+                        cursor.execute('INSERT INTO t VALUES (1)')
+                        cursor.execute('COMMIT')
+                except OperationalError as error:
+                    errors.append(error)
+                finally:
+                    db.close()
+
+            threads = [threading.Thread(target=write) for _ in range(2)]
+            for thread in threads:
+                thread.start()
+            for thread in threads:
+                thread.join()
+            self.assertEqual(errors, [])
+
+    @override_settings(SQLITE_WRITE_BACKOFF=0)
+    def test_write_retried_when_locked(self):
+        calls = []
+
+        @serialized_write
+        def view(request):
+            calls.append(request.method)
+            if len(calls) == 1:
+                raise OperationalError('database is locked')
+            return HttpResponse('ok')
+
+        factory = RequestFactory()
+        self.assertEqual(view(factory.post('/')).content, b'ok')
+        self.assertEqual(calls, ['POST', 'POST'])
+        calls.clear()
+        with self.assertRaises(OperationalError):
+            view(factory.get('/'))
+
+    @override_settings(SQLITE_WRITE_BACKOFF=0)
+    def test_files_of_failed_attempts_deleted(self):
+        names = []
+
+        @serialized_write
+        def view(request):
+            names.append(default_storage.save(f'attempt{len(names)}.txt',
+                                              ContentFile(b'data')))
+            if len(names) == 1:
+                raise OperationalError('database is locked')
+            return HttpResponse('ok')
+
+        with tempfile.TemporaryDirectory() as media, \
+                override_settings(MEDIA_ROOT=media):
+            view(RequestFactory().post('/'))
+            self.assertEqual([default_storage.exists(name)
+                              for name in names], [False, True])
+
+    def test_other_errors_not_retried(self):
+        calls = []
+
+        @serialized_write
+        def view(request):
+            calls.append(request)
+            raise OperationalError('no such table: t')
+
+        with self.assertRaises(OperationalError):
+            view(RequestFactory().post('/'))
+        self.assertEqual(len(calls), 1)
+
+
+class ReplicaRoutingTest(TransactionTestCase):
+    """A second SQLite file stands in for the replica."""
+
+    def setUp(self) -> None:
+        cache.clear()
+        self.dir = tempfile.TemporaryDirectory()
+        connections.databases['replica'] = {
+            **connections.databases['default'],
+            'NAME': os.path.join(self.dir.name, 'replica.sqlite3'),
+        }
+        settings = override_settings(DATABASE_REPLICAS=['replica'])
+        settings.enable()
+        self.addCleanup(settings.disable)
+        self.author = User.objects.create(username='author')
+        self.reader = User.objects.create(username='reader')
+        Post.objects.create(text='Replicated post', author=self.author)
+        call_command('sync_replicas', stdout=StringIO())
+        Post.objects.create(text='Not yet replicated', author=self.author)
+
+    def tearDown(self) -> None:
+        connections['replica'].close()
+        del connections.databases['replica']
+        if hasattr(connections._connections, 'replica'):
+            delattr(connections._connections, 'replica')
+        self.dir.cleanup()
+
+    def client_for(self, user):
+        client = Client()
+        client.force_login(user)
+        return client
+
+    def test_reads_go_to_replica(self):
+        response = self.client_for(self.reader).get('/')
+        self.assertContains(response, 'Replicated post')
+        self.assertNotContains(response, 'Not yet replicated')
+        api = APIClient()
+        api.force_authenticate(self.reader)
+        texts = [post['text']
+                 for post in api.get('/api/v1/posts').json()['results']]
+        self.assertEqual(texts, ['Replicated post'])
+
+    def test_anonymous_page_cache_renders_from_primary(self):
+        self.assertContains(Client().get('/'), 'Not yet replicated')
+
+    def test_writer_reads_own_writes(self):
+        client = self.client_for(self.author)
+        client.post('/new/', {'text': 'Fresh post'})
+        self.assertIn('primary_until', client.cookies)
+        self.assertContains(client.get('/'), 'Fresh post')
+        # Other readers are not affected by the author's stickiness.
+        self.assertNotContains(self.client_for(self.reader).get('/'),
+                               'Fresh post')
+        api = APIClient()
+        api.force_authenticate(self.author)
+        texts = [post['text']
+                 for post in api.get('/api/v1/posts').json()['results']]
+        self.assertIn('Fresh post', texts)
+
+
+class QueryBudgetTest(TestCase):
+
+    def setUp(self) -> None:
+        cache.clear()
+        instrumentation.clear_collected()
+        self.user = User.objects.create(username='reader')
+        Post.objects.create(text='Text', author=self.user)
+        self.client.force_login(self.user)
+
+    def test_histograms_per_view(self):
+        self.client.get('/')
+        self.client.get('/')
+        self.client.get('/reader/')
+        instrumentation.recorder.flush()
+        views = instrumentation.collected()
+        index = views['index'].histograms
+        self.assertEqual(index['queries'].count, 2)
+        self.assertGreater(index['queries'].peak, 0)
+        self.assertGreater(index['render_ms'].total, 0)
+        self.assertGreaterEqual(index['total_ms'].total,
+                                index['render_ms'].total)
+        self.assertEqual(views['profile'].histograms['queries'].count, 1)
+        out = StringIO()
+        call_command('query_stats', stdout=out)
+        self.assertIn('profile', out.getvalue())
+
+    @override_settings(QUERY_BUDGETS={'index': 0})
+    def test_budget_logged(self):
+        with self.assertLogs('yatube.instrumentation', 'WARNING') as logs:
+            self.assertEqual(self.client.get('/').status_code, 200)
+        self.assertIn('over its budget of 0', logs.output[0])
+        instrumentation.recorder.flush()
+        self.assertEqual(instrumentation.collected()['index'].over_budget, 1)
+
+    @override_settings(QUERY_BUDGETS={'index': 0}, QUERY_BUDGET_RAISE=True)
+    def test_budget_raises(self):
+        with self.assertRaises(instrumentation.QueryBudgetExceeded):
+            self.client.get('/')
+
+    @override_settings(QUERY_BUDGETS={'follow-list': 0},
+                       QUERY_BUDGET_RAISE=True)
+    def test_writes_have_their_own_budget(self):
+        author = User.objects.create(username='author')
+        api = APIClient()
+        api.force_authenticate(self.user)
+        response = api.post('/api/v1/follow', {'author': 'author'},
+                            format='json')
+        self.assertEqual(response.status_code, 201)
+        self.assertEqual(author.following.count(), 1)
+        instrumentation.recorder.flush()
+        self.assertIn('follow-list POST', instrumentation.collected())
+
+    def test_histogram_percentile(self):
+        histogram = instrumentation.Histogram((1, 5, 10))
+        for value in (1, 1, 1, 4, 30):
+            histogram.add(value)
+        self.assertEqual(histogram.percentile(.5), 1)
+        self.assertEqual(histogram.percentile(.8), 5)
+        self.assertEqual(histogram.percentile(1), 30)
+
+
+class ASGIHandlerTest(TransactionTestCase):
+    """Requests run in the handler's pool threads, so the data has to be
+    committed."""
+
+    def setUp(self) -> None:
+        cache.clear()
+        self.author = User.objects.create(username='author')
+        self.post = Post.objects.create(text='Served over ASGI',
+                                        author=self.author)
+        self.application = ASGIHandler()
+        self.addCleanup(self.shutdown)
+
+    def shutdown(self):
+        for pool in self.application.pools.values():
+            pool.shutdown()
+
+    def request(self, path, method='GET', body=b'', headers=(),
+                query=b'', chunk=None):
+        scope = {
+            'type': 'http', 'http_version': '1.1', 'method': method,
+            'scheme': 'http', 'path': path, 'root_path': '',
+            'query_string': query, 'server': ('testserver', 80),
+            'client': ('127.0.0.1', 1234),
+            'headers': [(b'host', b'testserver'), *headers],
+        }
+        chunk = chunk or len(body) or 1
+        messages = [{'type': 'http.request', 'body': body[i:i + chunk],
+                     'more_body': i + chunk < len(body)}
+                    for i in range(0, len(body) or 1, chunk)]
+        sent = []
+
+        async def receive():
+            return messages.pop(0)
+
+        async def send(message):
+            sent.append(message)
+
+        asyncio.run(self.application(scope, receive, send))
+        return sent
+
+    def test_page(self):
+        start, body = self.request('/')
+        self.assertEqual(start['status'], 200)
+        self.assertIn((b'content-type', b'text/html; charset=utf-8'),
+                      start['headers'])
+        self.assertIn('Served over ASGI', body['body'].decode())
+        self.assertEqual(set(self.application.pools), {'read'})
+
+    def test_environ(self):
+        environ = environ_for({
+            'method': 'GET', 'path': '/группа/', 'query_string': b'q=%D0%B',
+            'headers': [(b'content-type', b'text/plain'),
+                        (b'x-tag', b'a'), (b'x-tag', b'b')],
+        }, b'body')
+        self.assertEqual(environ['PATH_INFO'],
+                         '/группа/'.encode().decode('latin-1'))
+        self.assertEqual(environ['QUERY_STRING'], 'q=%D0%B')
+        self.assertEqual(environ['CONTENT_TYPE'], 'text/plain')
+        self.assertEqual(environ['CONTENT_LENGTH'], '4')
+        self.assertEqual(environ['HTTP_X_TAG'], 'a,b')
+        self.assertEqual(environ['wsgi.input'].read(), b'body')
+
+    def test_streaming_response(self):
+        token = AccessToken.for_user(self.author)
+        sent = self.request('/api/v1/posts', query=b'stream=1', headers=[
+            (b'authorization', f'Bearer {token}'.encode())])
+        self.assertEqual(sent[0]['status'], 200)
+        self.assertTrue(all(message['more_body'] for message in sent[1:-1]))
+        self.assertNotIn('more_body', sent[-1])
+        rows = json.loads(b''.join(message.get('body', b'')
+                                   for message in sent[1:]))
+        self.assertEqual([row['text'] for row in rows], ['Served over ASGI'])
+
+    def test_write_goes_to_write_pool(self):
+        token = AccessToken.for_user(self.author)
+        body = json.dumps({'text': 'Posted over ASGI'}).encode()
+        start, _ = self.request('/api/v1/posts', method='POST', body=body,
+                                chunk=5, headers=[
+                                    (b'content-type', b'application/json'),
+                                    (b'authorization',
+                                     f'Bearer {token}'.encode())])
+        self.assertEqual(start['status'], 201)
+        self.assertTrue(Post.objects.filter(text='Posted over ASGI').exists())
+        self.assertEqual(set(self.application.pools), {'write'})
+
+    @override_settings(ASGI_MAX_BODY_BYTES=10)
+    def test_large_body_refused(self):
+        for headers in ([(b'content-length', b'11')], []):
+            start, _ = self.request('/api/v1/posts', method='POST',
+                                    body=b'x' * 11, chunk=4,
+                                    headers=headers)
+            self.assertEqual(start['status'], 413)
+        self.assertEqual(self.application.pools, {})
+
+    def test_body_spooled_to_file(self):
+        body = self.application.read_body
+        messages = [{'type': 'http.request', 'body': b'x' * 10,
+                     'more_body': True},
+                    {'type': 'http.request', 'body': b'y'}]
+
+        async def receive():
+            return messages.pop(0)
+
+        with override_settings(FILE_UPLOAD_MAX_MEMORY_SIZE=5):
+            file = asyncio.run(body({'headers': []}, receive))
+        with file:
+            self.assertTrue(file._rolled)
+            file.seek(0)
+            self.assertEqual(file.read(), b'x' * 10 + b'y')
+
+    def test_disconnect_before_body(self):
+        sent = []
+
+        async def receive():
+            return {'type': 'http.disconnect'}
+
+        async def send(message):
+            sent.append(message)
+
+        asyncio.run(self.application(
+            {'type': 'http', 'method': 'GET', 'path': '/'}, receive, send))
+        self.assertEqual(sent, [])
+
+    def test_lifespan(self):
+        messages = [{'type': 'lifespan.startup'},
+                    {'type': 'lifespan.shutdown'}]
+        sent = []
+
+        async def receive():
+            return messages.pop(0)
+
+        async def send(message):
+            sent.append(message['type'])
+
+        asyncio.run(self.application({'type': 'lifespan'}, receive, send))
+        self.assertEqual(sent, ['lifespan.startup.complete',
+                                'lifespan.shutdown.complete'])
+
+
+class StaticFilesTest(SimpleTestCase):
+
+    def test_collected_files_are_hashed_compressed_and_immutable(self):
+        root = tempfile.TemporaryDirectory()
+        self.addCleanup(root.cleanup)
+        with override_settings(STATIC_ROOT=root.name):
+            call_command('collectstatic', interactive=False, verbosity=0)
+            url = static('api_doc.yaml')
+            self.assertRegex(url, r'^/static/api_doc\.[0-9a-f]{12}\.yaml$')
+            response = Client().get(url, HTTP_ACCEPT_ENCODING='gzip')
+            self.assertEqual(response.status_code, 200)
+            self.assertEqual(response['Content-Encoding'], 'gzip')
+            self.assertIn('immutable', response['Cache-Control'])
+            response.close()
+
+    def test_uncollected_file_keeps_its_name(self):
+        self.assertEqual(static('img/not-collected.svg'),
+                         '/static/img/not-collected.svg')
@@ -21,6 +21,9 @@ from django.conf.urls.static import static
 from django.conf.urls import handler404, handler500, url
 from django.views.generic import TemplateView
 
+from posts import image_variants
+from posts.views import image_variant
+
 urlpatterns = [
     path("auth/", include("users.urls")),
     path("auth/", include("django.contrib.auth.urls")),
@@ -31,7 +34,6 @@ urlpatterns = [
 ]
 
 urlpatterns += [
-    path('__debug__/', include('debug_toolbar.urls')),
     path('about-us/', views.flatpage, {'url': '/about-us/'}, name='about'),
     path('terms/', views.flatpage, {'url': '/terms/'}, name='terms'),
     path('about-author/', views.flatpage, {'url': '/about-author/'},
@@ -52,9 +54,12 @@ handler404 = 'posts.views.page_not_found'  # noqa
 handler500 = 'posts.views.server_error'  # noqa
 
 if settings.DEBUG:
+    urlpatterns = [
+        path('__debug__/', include('debug_toolbar.urls')),
+        path(f'{settings.MEDIA_URL[1:]}{image_variants.DIRECTORY}/'
+             '<path:path>', image_variant),
+    ] + urlpatterns
     urlpatterns += static(settings.MEDIA_URL,
                           document_root=settings.MEDIA_ROOT)
-    urlpatterns += static(settings.STATIC_URL,
-                          document_root=settings.STATIC_ROOT)
 
 